@@ -1,32 +1,156 @@
-from keybert import KeyBERT
-from keyphrase_vectorizers import KeyphraseCountVectorizer
 import uuid
 import arxiv
-import wikipedia
 import json
 import asyncio
-from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
-from sentence_transformers import SentenceTransformer
 from qdrant_client import async_qdrant_client
 from qdrant_client.http import models
-import fitz  # PyMuPDF
-import io
+import os
+import hashlib
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from embedding_cache import EmbeddingCache
+from response_cache import ResponseCache
+from arxiv_scheduler import ArxivScheduler
+from wiki_fetch import WikipediaFetcher
+from sparse_index import document_vector, query_vector, rrf_fuse
+from semantic_cache import SemanticCache
+from near_duplicates import signature, band_keys, match_near_duplicates, stats as near_dup_stats
+from chunker import iter_chunk_spans
+from pdf_extract import iter_pdf_pages, save_upload, stats as pdf_stats
+from model_registry import registry, get_embedder, get_summarizer, get_keyphrase_engine, EMBEDDER_NAME
 
 # client = QdrantClient(":memory:")
 COLLECTION_PREFIX = "rag_session_"
 
-client = async_qdrant_client.AsyncQdrantClient(":memory:")
+# Vector store: in memory by default, or persistent in a local directory (QDRANT_PATH)
+# or on a Qdrant server (QDRANT_URL). Persistent collections are reopened as they are
+# on restart. Only a server keeps vectors and payloads on disk (memory-mapped); the
+# local mode saves them to QDRANT_PATH but holds them all in RAM. The client is
+# created on first use, not at import: a local directory can only be opened by one
+# client, and spawned worker processes import this module too.
+QDRANT_URL = os.getenv("QDRANT_URL", "")
+QDRANT_PATH = os.getenv("QDRANT_PATH", "")
+QDRANT_PERSISTENT = bool(QDRANT_URL or QDRANT_PATH)
+# Sessions live in memory, so in persistent mode the collections of the previous run's
+# sessions are deleted at start-up. Disable when several app processes share a server.
+QDRANT_ORPHAN_CLEANUP = os.getenv("QDRANT_ORPHAN_CLEANUP", "1") == "1"
+
+def _connect_qdrant():
+    if QDRANT_URL:
+        return async_qdrant_client.AsyncQdrantClient(url=QDRANT_URL, api_key=os.getenv("QDRANT_API_KEY"))
+    if QDRANT_PATH:
+        return async_qdrant_client.AsyncQdrantClient(path=QDRANT_PATH)
+    return async_qdrant_client.AsyncQdrantClient(":memory:")
+
+registry.register("qdrant", _connect_qdrant, model=False)
+
+def get_client():
+    """
+    Returns the process-wide Qdrant client, connecting on first use.
+    """
+    return registry.get("qdrant")
+
+# Shared collection for fetched Wikipedia and arXiv chunks (persistent mode only by
+# default), searched alongside each session's own collection of uploaded files. Each
+# chunk carries the scope tags (source, topic, arXiv subject) of the sessions that
+# fetched it, and a session only retrieves chunks with one of its own tags. The corpus
+# is on disk and unbounded by default; QDRANT_CORPUS_MAX_POINTS caps it (new chunks
+# are dropped once it is full).
+CORPUS_COLLECTION = os.getenv("QDRANT_CORPUS_COLLECTION", "rag_corpus" if QDRANT_PERSISTENT else "")
+CORPUS_MAX_POINTS = int(os.getenv("QDRANT_CORPUS_MAX_POINTS", "0")) or None
+CORPUS_SCOPE_FIELD = "corpus_scope"
+_known_collections = set()
+
+# Opt-in vector quantization of new collections: "int8" (scalar, 4x smaller) or
+# "binary" (32x smaller). The quantized vectors stay in RAM and the originals move to
+# disk, where they are only read to rescore the oversampled candidates. Quantization
+# needs a Qdrant server; the embedded local mode always searches the originals.
+QDRANT_QUANTIZATION = os.getenv("QDRANT_QUANTIZATION", "").lower()
+if QDRANT_QUANTIZATION not in ("", "int8", "binary"):
+    raise ValueError("QDRANT_QUANTIZATION must be empty, 'int8' or 'binary'")
+QDRANT_RESCORE = os.getenv("QDRANT_RESCORE", "1") == "1"
+QDRANT_OVERSAMPLING = float(os.getenv("QDRANT_OVERSAMPLING", "2.0"))
+
+# Hybrid retrieval: a BM25 sparse vector is stored next to each dense one, and the two
+# rankings are merged with weighted reciprocal rank fusion. HYBRID_SPARSE_WEIGHT=0
+# falls back to dense-only search.
+SPARSE_VECTOR = "bm25"
+HYBRID_DENSE_WEIGHT = float(os.getenv("HYBRID_DENSE_WEIGHT", "1.0"))
+HYBRID_SPARSE_WEIGHT = float(os.getenv("HYBRID_SPARSE_WEIGHT", "1.0"))
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))
+_sparse_collections = set()
+
+# Near-duplicate filter: chunks whose word shingles mostly match a chunk of the same batch
+# or of the collection (MinHash LSH, see near_duplicates) are not embedded. The LSH band
+# keys are stored in the MINHASH_FIELD payload to find the stored candidates.
+NEAR_DUP = os.getenv("NEAR_DUP", "1") == "1"
+MINHASH_FIELD = "minhash"
+NEAR_DUP_MAX_CANDIDATES = int(os.getenv("NEAR_DUP_MAX_CANDIDATES", "256"))
 
 # set up qdrant
 COLLECTION_PREFIX = "rag_session_"
 session_id = 'test'
 
-embedder = SentenceTransformer("all-MiniLM-L6-v2")  # Sentence embeddings
-
-# Load the model and tokenizer for summary generation
-model_name = "sshleifer/distilbart-cnn-12-6"
-tokenizer = AutoTokenizer.from_pretrained(model_name)
-model = AutoModelForSeq2SeqLM.from_pretrained(model_name)
+# Models (sentence embedder, BART summarizer, KeyBERT) are loaded lazily, once per
+# process, through the shared registry in model_registry.py
+
+# Tokens repeated between consecutive chunks of a Wikipedia section. Point IDs are
+# derived from the chunk text, so every fetch path must chunk the same way.
+WIKI_CHUNK_OVERLAP = int(os.getenv("WIKI_CHUNK_OVERLAP", "32"))
+
+# Wikipedia and arXiv endpoints; point these at a local stand-in server to work offline
+WIKIPEDIA_API_URL = os.getenv("WIKIPEDIA_API_URL", "https://en.wikipedia.org/w/api.php")
+ARXIV_API_URL = os.getenv("ARXIV_API_URL", "https://export.arxiv.org/api/query")
+arxiv.Client.query_url_format = ARXIV_API_URL + "?{}"
+
+# Bulk MediaWiki client with a pooled keep-alive session
+registry.register("wiki_fetcher", lambda: WikipediaFetcher(WIKIPEDIA_API_URL), model=False)
+
+# Persistent cache of Wikipedia and arXiv responses, with a TTL per source (seconds)
+RESPONSE_CACHE_DB = os.getenv("RESPONSE_CACHE_DB", os.path.join(".cache", "responses.sqlite3"))
+RESPONSE_CACHE_TTLS = {
+    "wiki_search": float(os.getenv("WIKI_SEARCH_TTL", str(7 * 86400))),
+    "wiki_page": float(os.getenv("WIKI_PAGE_TTL", str(7 * 86400))),
+    "arxiv_relevance": float(os.getenv("ARXIV_RELEVANCE_TTL", str(86400))),
+    "arxiv_recent": float(os.getenv("ARXIV_RECENT_TTL", str(3600))),
+}
+RESPONSE_CACHE_STALE_TTL = float(os.getenv("RESPONSE_CACHE_STALE_TTL", str(7 * 86400)))
+RESPONSE_CACHE_MAX_MB = int(os.getenv("RESPONSE_CACHE_MAX_MB", "512"))
+registry.register("response_cache", lambda: ResponseCache(
+    RESPONSE_CACHE_DB, RESPONSE_CACHE_TTLS, stale_ttl=RESPONSE_CACHE_STALE_TTL, max_bytes=RESPONSE_CACHE_MAX_MB * 1024 * 1024
+) if RESPONSE_CACHE_DB else None, model=False)
+
+# One rate-limited arXiv scheduler for the whole process; every page is a request
+ARXIV_RATE = float(os.getenv("ARXIV_RATE", str(1 / 3)))
+ARXIV_BURST = int(os.getenv("ARXIV_BURST", "2"))
+ARXIV_WORKERS = int(os.getenv("ARXIV_WORKERS", "2"))
+ARXIV_PAGE_SIZE = int(os.getenv("ARXIV_PAGE_SIZE", "100"))
+registry.register("arxiv_scheduler", lambda: ArxivScheduler(rate=ARXIV_RATE, burst=ARXIV_BURST, workers=ARXIV_WORKERS, page_size=ARXIV_PAGE_SIZE), model=False)
+
+# Semantic cache of chat turns: a question whose embedding is within QUERY_CACHE_THRESHOLD
+# cosine similarity of an earlier one reuses its documents, summary and (QUERY_CACHE_ANSWERS)
+# answer. With a shared corpus, sessions with the same sources and topics share entries.
+QUERY_CACHE = os.getenv("QUERY_CACHE", "1") == "1"
+QUERY_CACHE_THRESHOLD = float(os.getenv("QUERY_CACHE_THRESHOLD", "0.92"))
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "512"))
+QUERY_CACHE_SHARED = os.getenv("QUERY_CACHE_SHARED", "1") == "1"
+QUERY_CACHE_ANSWERS = os.getenv("QUERY_CACHE_ANSWERS", "1") == "1"
+registry.register("query_cache", lambda: SemanticCache(QUERY_CACHE_THRESHOLD, QUERY_CACHE_SIZE), model=False)
+
+# Version of each collection, changed whenever points are stored or it is deleted, so
+# cached turns built on older content are not served
+_collection_versions = {}
+_version_counter = itertools.count(1)
+
+# CPU-bound encoding runs here, off the event loop and away from the fetch threads
+embed_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed")
+
+# Disk-backed cache of chunk embeddings, shared by every session
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", os.path.join(".cache", "embeddings"))
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "100000"))
+registry.register("embedding_cache", lambda: EmbeddingCache(
+    EMBEDDING_CACHE_DIR, EMBEDDER_NAME, get_embedder().get_sentence_embedding_dimension(), max_entries=EMBEDDING_CACHE_SIZE
+), model=False)
 
 def summarize(text: str, max_input_tokens:int = 1024, max_output_tokens:int =512) -> str:
     """
@@ -53,6 +177,8 @@ def summarize(text: str, max_input_tokens:int = 1024, max_output_tokens:int =512
     if not isinstance(text, str):
         raise TypeError("Input text must be a string.")
     
+    tokenizer, model = get_summarizer()
+
     # Tokenize input (truncate if it's too long)
     inputs = tokenizer(
         text,
@@ -107,6 +233,27 @@ def remove_duplicate_dicts(list_of_dicts):
             result.append(d)
     return result
 
+def make_point_id(source: str, text: str) -> str:
+    """
+    Returns a deterministic Qdrant point ID for a chunk, derived from its source URL
+    and a hash of its text. The same chunk fetched twice (for another keyword, or by
+    both the relevance and submitted arXiv passes) always maps to the same point.
+
+    Parameters
+    ----------
+    source : str
+        The source URL (or file name) of the chunk.
+    text : str
+        The text of the chunk.
+
+    Returns
+    -------
+    str
+        A UUID string usable as a Qdrant point ID.
+    """
+    content_hash = hashlib.sha1(text.encode("utf-8")).hexdigest()
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{source}#{content_hash}"))
+
 def extract_keywords(query: str, top_n: int = 5, threshold: float = 0.75) -> list:
     """
     This function takes a query string and returns a list of keywords extracted from
@@ -145,25 +292,37 @@ def extract_keywords(query: str, top_n: int = 5, threshold: float = 0.75) -> lis
     if threshold > 1 or threshold < 0:
         raise ValueError("threshold must be a float in [0,1]")
 
-    # Create a KeyBERT model
-    kw_model = KeyBERT()
+    # Extract keywords with the shared keyphrase engine
+    keywords, _ = extract_keywords_batch([query], top_n=top_n, threshold=threshold)
 
-    # Create a CountVectorizer for keyphrases
-    vectorizer = KeyphraseCountVectorizer()
+    # Return the list of search words
+    return keywords[0]
 
-    # Extract keywords with the KeyBERT model
-    try:
-        keywords = kw_model.extract_keywords(
-            query, keyphrase_ngram_range=(1, 5), vectorizer=vectorizer, top_n=top_n
-        )
-    except:
-        return []
+def extract_keywords_batch(queries: list[str], top_n: int = 5, threshold: float = 0.75) -> tuple:
+    """
+    Extracts keywords from a batch of queries in one call, reusing the shared sentence
+    embedder. Also returns the query embeddings, so that retrieval does not have to
+    encode the same text again.
 
-    # Filter the keywords based on the relevance threshold
-    search_words = [word[0] for word in keywords if word[1] >= threshold]
+    Parameters
+    ----------
+    queries : list[str]
+        The queries from which to extract keywords.
+    top_n : int, optional
+        The maximum number of keywords to return per query. Defaults to 5.
+    threshold : float, optional
+        Keywords with a relevance score above this threshold will be included in the
+        output. Defaults to 0.75.
 
-    # Return the list of search words
-    return search_words
+    Returns
+    -------
+    tuple[list[list[str]], np.ndarray]
+        The keywords of each query, and the embedding of each query.
+    """
+    if not isinstance(queries, list) or not all(isinstance(query, str) for query in queries):
+        raise TypeError("Queries must be a list of strings")
+
+    return get_keyphrase_engine().extract(queries, top_n=top_n, threshold=threshold)
 
 with open('sub2tag.json', 'r') as f:
     sub2tag = json.load(f)
@@ -197,38 +356,87 @@ def get_arxiv_paper_sync(subject: str = "", subtopic:str = "", query: str = "",
     """
     if not isinstance(query, str):
         raise TypeError("Query must be a string")
-    
+
+    return list(iter_arxiv_papers_sync(subject, subtopic, query, max_results, priority))
+
+def iter_arxiv_papers_sync(subject: str = "", subtopic: str = "", query: str = "", max_results: int = 5, priority: str = 'relevance', background: bool = False):
+    """
+    Same as get_arxiv_paper_sync, but yields the papers one by one, so that
+    ingestion can stream them into the embedder. Requests go through the shared
+    arXiv scheduler; background searches (follow-up turns) wait for queued
+    first-turn searches.
+
+    Yields
+    ------
+    dict
+        Paper metadata: id, title, text, source and published date.
+    """
+    if not isinstance(query, str):
+        raise TypeError("Query must be a string")
+
+    # Create a search query, restricted to the selected category if any
+    category = arxiv_category(subject, subtopic)
+    search_query = f"{category} AND abs:{query}" if category else query
+    yield from search_arxiv_sync(search_query, max_results, priority, background)
+
+def arxiv_category(subject: str = "", subtopic: str = "") -> str:
+    """
+    Returns the arXiv category filter for a subject and subtopic, e.g. 'cat:cs.AI',
+    or '' when no subject is selected. A subject without a subtopic matches any of
+    its categories.
+    """
+    if not subject:
+        return ""
+    if subtopic:
+        return f"cat:{sub2tag[subject][subtopic]}"
+    return "(" + " OR ".join(f"cat:{tag}" for tag in sub2tag[subject].values()) + ")"
+
+def search_arxiv_sync(search_query: str, max_results: int = 5, priority: str = 'relevance', background: bool = False) -> list[dict]:
+    """
+    Runs a raw arXiv search query on the shared scheduler, using the response cache.
+
+    Parameters
+    ----------
+    search_query : str
+        The arXiv API query, e.g. 'cat:cs.AI AND abs:transformer'.
+    max_results : int, optional
+        The maximum number of papers to retrieve. Defaults to 5.
+    priority : str, optional
+        The sorting criterion: 'relevance', 'submitted' or 'updated'. Defaults to 'relevance'.
+    background : bool, optional
+        Queue behind first-turn searches. Defaults to False.
+
+    Returns
+    -------
+    list[dict]
+        Paper metadata: id, title, text, source and published date.
+    """
     # Map the priority string to an arXiv sort criterion
     sort_by = {
         'relevance': arxiv.SortCriterion.Relevance,
         'submitted': arxiv.SortCriterion.SubmittedDate,
         'updated': arxiv.SortCriterion.LastUpdatedDate
     }.get(priority, arxiv.SortCriterion.Relevance)
-
-    # Create a search object for the arXiv query
-    if subject!="" and subtopic!="":
-        search_query = f"cat:{sub2tag[subject][subtopic]} AND abs:{query}"
-    elif subject!="" and subtopic=="":
-        search_query = f"cat:{sub2tag[subject]} AND abs:{query}"
-    else:
-        search_query = query
     search = arxiv.Search(query=search_query, max_results=max_results, sort_by=sort_by)
-    client = arxiv.Client()
 
-    papers = []
-
-    # Iterate over search results and extract relevant information
-    for result in client.results(search):
-        paper_id = f"arxiv_{result.entry_id.split('/')[-1]}"
-        paper_text = f"{result.title}\n\n{result.summary}"
-        papers.append({
-            "id": paper_id,
+    def load():
+        # Run the search on the shared, rate-limited scheduler, one request per page
+        found = registry.get("arxiv_scheduler").search(search, background=background)
+        # Extract the relevant information from each result
+        return [{
+            "id": f"arxiv_{result.entry_id.split('/')[-1]}",
             "title": result.title,
-            "text": paper_text,
-            "source": result.entry_id
-        })
-
-    return papers
+            "text": f"{result.title}\n\n{result.summary}",
+            "source": result.entry_id,
+            "published": result.published.isoformat()
+        } for result in found]
+
+    # Serve repeated searches from the response cache (stale entries are refreshed in the background)
+    cache = registry.get("response_cache")
+    if cache is None:
+        return load()
+    namespace = "arxiv_relevance" if priority == "relevance" else "arxiv_recent"
+    return cache.fetch(namespace, [search_query, max_results, priority], load)
 
 # Async wrapper using asyncio.to_thread
 async def get_arxiv_paper(subject:str, subtopic:str, query: str, max_results: int = 5, priority: str = 'relevance') -> list[dict]:
@@ -265,42 +473,40 @@ async def fetch_arxiv_papers(subject:str, subtopic:str,
     # Flatten the list of lists into a single list
     return [paper for sublist in papers_nested for paper in sublist]
 
-def chunk_text(text: str, chunk_size: int = 512, overlap: int = 64) -> list[str]:
+def embedder_token_limit() -> int:
+    """
+    Returns the number of tokens the embedder reads from a chunk before truncating,
+    not counting the [CLS] and [SEP] tokens.
+    """
+    return get_embedder().max_seq_length - 2
+
+def chunk_text_tokens(text: str, chunk_size: int = None, overlap: int = 0) -> list[str]:
     """
-    Splits text into overlapping chunks. This is useful for storing text in a
-    database or other storage system that has size limitations.
+    Splits text into chunks that fit the embedder, counting tokenizer tokens and
+    breaking at sentence and paragraph boundaries (see chunker.iter_chunk_spans).
 
     Parameters
     ----------
     text : str
         The text to split into chunks.
     chunk_size : int, optional
-        The size of each chunk. Defaults to 256.
+        The maximum number of tokens per chunk, capped at the embedder's limit.
+        Defaults to the embedder's limit.
     overlap : int, optional
-        The amount of overlap between chunks. Defaults to 32.
+        The maximum number of tokens repeated between consecutive chunks. Defaults to 0.
 
     Returns
     -------
     list[str]
-        A list of strings, where each string is a chunk of the input text.
+        The chunks.
     """
-    if not isinstance(text, str):
-        raise TypeError("Text must be a string")
-    
-    words = text.split()
-    chunks = []
-    start = 0
-    while start < len(words):
-        # Get the words for the current chunk
-        chunk = words[start : start + chunk_size]
-        # Join the words with spaces to form a string
-        chunks.append(" ".join(chunk))
-        # Shift the start to ensure the next chunk has the specified overlap
-        start += chunk_size - overlap
-    return chunks
+    limit = embedder_token_limit()
+    max_tokens = min(chunk_size or limit, limit)
+    spans = iter_chunk_spans(text, registry.get("chunk_tokenizer"), max_tokens, min(overlap, max_tokens - 1))
+    return [text[start:end] for start, end in spans]
 
 def get_wiki_page_sync(
-    query: str, max_sections: int = 15, num_results: int = 5, chunk_size: int = 128, overlap: int = 0
+    query: str, max_sections: int = 15, num_results: int = 5, chunk_size: int = None, overlap: int = WIKI_CHUNK_OVERLAP
 ) -> list[dict]:
     """
     Fetches relevant content from Wikipedia and stores it in a list of dictionaries.
@@ -314,9 +520,9 @@ def get_wiki_page_sync(
     num_results : int, optional
         The number of search results to consider. Defaults to 5.
     chunk_size : int, optional
-        The size of each text chunk. Defaults to 128.
+        The maximum number of tokens per chunk. Defaults to the embedder's limit.
     overlap : int, optional
-        The number of words that overlap between chunks. Defaults to 0.
+        The number of tokens that overlap between chunks. Defaults to WIKI_CHUNK_OVERLAP.
 
     Returns
     -------
@@ -326,40 +532,113 @@ def get_wiki_page_sync(
     if not isinstance(query, str):
         raise TypeError("Query must be a string")
     
-    results = wikipedia.search(query, results=num_results)
-    wiki_content = []
-    for result in results:
-        try:
-            # Retrieve the content of the Wikipedia page
-            page_content = wikipedia.page(result).content
-            # Split content into sections (paragraphs)
-            text_sections = page_content.split("\n\n")[:max_sections]
-            # Process each section
-            for idx, section_text in enumerate(text_sections):
-                if section_text.strip():
-                    # Chunk the section text
-                    chunks = chunk_text(section_text.strip(), chunk_size, overlap)
-                    # Store each chunk with metadata
-                    for chunk_idx, chunk in enumerate(chunks):
-                        wiki_content.append({
-                            "id": f"wiki_{uuid.uuid4().hex[:8]}",
-                            "title": f"{result} - Section {idx+1} - Chunk {chunk_idx+1}",
-                            "text": chunk,
-                            "source": f"https://en.wikipedia.org/wiki/{result.replace(' ', '_')}"
-                        })
-        except (wikipedia.exceptions.PageError, wikipedia.exceptions.DisambiguationError):
-            # Skip pages that cannot be retrieved
-            pass
-    return wiki_content
+    return [chunk for page in iter_wiki_pages_sync(query, max_sections, num_results, chunk_size, overlap) for chunk in page]
+
+def cached_wiki_search(query: str, num_results: int) -> list[dict]:
+    """
+    Returns the non-disambiguation search hits for a query, with their intros, using
+    the response cache.
+    """
+    def load():
+        return [hit for hit in registry.get("wiki_fetcher").search(query, num_results) if not hit["disambiguation"]]
+
+    cache = registry.get("response_cache")
+    if cache is None:
+        return load()
+    return cache.fetch("wiki_search", ["bulk", query, num_results], load)
+
+def cached_wiki_extracts(titles: list[str]) -> dict:
+    """
+    Returns the full plain-text extracts of several Wikipedia pages, using the
+    response cache and fetching the missing ones in parallel.
+    """
+    fetcher = registry.get("wiki_fetcher")
+    cache = registry.get("response_cache")
+    if cache is None:
+        return fetcher.extracts(titles)
+
+    extracts = {}
+    missing = []
+    for title in titles:
+        entry = cache.lookup("wiki_page", ["extract", title])
+        if entry is None:
+            missing.append(title)
+            cache.record_miss()
+            continue
+        extracts[title], fresh = entry
+        cache.record_hit(fresh)
+        if not fresh:
+            cache.refresh_in_background("wiki_page", ["extract", title], lambda title=title: fetcher.extract(title))
+    for title, extract in fetcher.extracts(missing).items():
+        cache.put("wiki_page", ["extract", title], extract)
+        extracts[title] = extract
+    return extracts
+
+def wiki_sections(text: str) -> list[str]:
+    """
+    Splits a plain-text extract into its non-empty sections. Paragraphs within a
+    section are separated by single newlines; a blank line only precedes a section
+    heading, so the intro of an article is one section.
+    """
+    return [section.strip() for section in text.split("\n\n") if section.strip()]
+
+def iter_wiki_pages_sync(
+    query: str, max_sections: int = 15, num_results: int = 5, chunk_size: int = None, overlap: int = WIKI_CHUNK_OVERLAP
+):
+    """
+    Same as get_wiki_page_sync, but yields the chunks of each page in search order,
+    so that ingestion can start embedding before all queries are done.
+
+    One API request returns the search hits with their intros, i.e. their first
+    section. TextExtracts cannot return only the first few sections of an article, so
+    the full text is only downloaded when more than the intro is needed
+    (max_sections > 1).
+
+    Yields
+    ------
+    list[dict]
+        The chunks of one Wikipedia page, each with an ID, title, text and source URL.
+    """
+    if not isinstance(query, str):
+        raise TypeError("Query must be a string")
+
+    hits = cached_wiki_search(query, num_results)
+    # Only download the full text when the intro is not enough; sections are counted
+    # the same way the pages are split below
+    need_full = [hit["title"] for hit in hits if len(wiki_sections(hit["intro"])) < max_sections]
+    full_text = cached_wiki_extracts(need_full) if need_full else {}
+
+    for hit in hits:
+        result = hit["title"]
+        # Retrieve the content of the Wikipedia page
+        page_content = full_text.get(result) or hit["intro"]
+        # Split content into sections
+        text_sections = wiki_sections(page_content)[:max_sections]
+        wiki_content = []
+        # Process each section
+        for idx, section_text in enumerate(text_sections):
+            # Chunk the section text
+            chunks = chunk_text_tokens(section_text, chunk_size, overlap)
+            # Store each chunk with metadata
+            source = f"https://en.wikipedia.org/wiki/{result.replace(' ', '_')}"
+            for chunk_idx, chunk in enumerate(chunks):
+                wiki_content.append({
+                    "id": f"wiki_{make_point_id(source, chunk)}",
+                    "title": f"{result} - Section {idx+1} - Chunk {chunk_idx+1}",
+                    "text": chunk,
+                    "source": source
+                })
+        if wiki_content:
+            yield wiki_content
 
 # Async wrapper using asyncio.to_thread
-async def get_wiki_page(query: str, max_sections: int = 15, num_results: int = 5, chunk_size: int = 512, overlap: int = 64):
+async def get_wiki_page(query: str, max_sections: int = 15, num_results: int = 5, chunk_size: int = None, overlap: int = WIKI_CHUNK_OVERLAP):
     return await asyncio.to_thread(get_wiki_page_sync, query, max_sections, num_results, chunk_size, overlap)
 
         
 # Main async fetcher
 async def fetch_wikipedia_content(
-    queries: list[str], max_sections: int = 15, num_results: int = 5, chunk_size: int = 512, overlap: int = 64
+    queries: list[str], max_sections: int = 15, num_results: int = 5, chunk_size: int = None, overlap: int = WIKI_CHUNK_OVERLAP
 ) -> list[dict]:
     """
     Fetches relevant content from Wikipedia, given a list of search queries.
@@ -373,9 +652,9 @@ async def fetch_wikipedia_content(
     num_results : int, optional
         The number of search results to consider. Defaults to 5.
     chunk_size : int, optional
-        The size of each text chunk. Defaults to 180.
+        The maximum number of tokens per chunk. Defaults to the embedder's limit.
     overlap : int, optional
-        The number of words that overlap between chunks. Defaults to 0.
+        The number of tokens that overlap between chunks. Defaults to WIKI_CHUNK_OVERLAP.
 
     Returns
     -------
@@ -401,6 +680,7 @@ async def fetch_wikipedia_content(
 async def process_pdf_file(file_obj):
     """
     Process a PDF file and extract its text content.
+    Pages are extracted in the PDF process pool (see iter_process_pdf_pages).
     
     Args:
         file_obj: File object from Flask request
@@ -408,30 +688,111 @@ async def process_pdf_file(file_obj):
     Returns:
         str: Extracted text from the PDF
     """
-    # Save the file to a temporary in-memory buffer
-    pdf_data = file_obj.read()
-    pdf_stream = io.BytesIO(pdf_data)
-    
-    # Open the PDF with PyMuPDF
-    doc = fitz.open(stream=pdf_stream, filetype="pdf")
-    
-    # Extract text from each page
-    text = ""
-    for page_num in range(len(doc)):
-        page = doc.load_page(page_num)
-        text += page.get_text()
-        
-    return text
+    return "".join([text async for _, _, text in iter_process_pdf_pages(file_obj)])
 
+async def iter_process_pdf_pages(file_obj):
+    """
+    Extracts the pages of an uploaded PDF in a process pool, off the event loop,
+    and yields them in order as they are ready.
+
+    Args:
+        file_obj: File object from Flask or Quart request
 
-async def store_content(COLLECTION_PREFIX: str, session_id: str, documents: list[dict], batch_size: int = 128):
+    Yields:
+        tuple[int, int, str]: The 1-based page number, the page count and the page text.
+    """
+    # Spool the upload to disk, so workers open the file instead of receiving copies
+    path = await asyncio.to_thread(save_upload, file_obj)
+    try:
+        async for page in iter_pdf_pages(path):
+            yield page
+    finally:
+        os.remove(path)
+
+
+def quantization_config(mode: str):
+    """
+    Returns the Qdrant quantization config for a mode: 'int8', 'binary', or '' for none.
+    """
+    if mode == "int8":
+        return models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(type=models.ScalarType.INT8, quantile=0.99, always_ram=True)
+        )
+    if mode == "binary":
+        return models.BinaryQuantization(binary=models.BinaryQuantizationConfig(always_ram=True))
+    if mode:
+        raise ValueError(f"Unknown quantization mode: {mode}")
+    return None
+
+async def ensure_collection(collection_name: str, quantization: str = None) -> None:
+    """
+    Creates a Qdrant collection unless it already exists. On a Qdrant server, in
+    persistent mode the vectors and payloads are stored on disk; with quantization the
+    original vectors are. The local mode ignores these settings.
+
+    Args:
+        collection_name: The name of the collection.
+        quantization: 'int8', 'binary' or '' for none. Defaults to QDRANT_QUANTIZATION.
+    """
+    if await _inspect_collection(collection_name):
+        return
+    if quantization is None:
+        quantization = QDRANT_QUANTIZATION
+    try:
+        await get_client().create_collection(
+            collection_name=collection_name,
+            vectors_config=models.VectorParams(
+                size=384, distance=models.Distance.COSINE, on_disk=QDRANT_PERSISTENT or bool(quantization)
+            ),
+            sparse_vectors_config={SPARSE_VECTOR: models.SparseVectorParams(modifier=models.Modifier.IDF)},
+            on_disk_payload=QDRANT_PERSISTENT,
+            quantization_config=quantization_config(quantization),
+        )
+        for field_name in (MINHASH_FIELD, CORPUS_SCOPE_FIELD):
+            await get_client().create_payload_index(
+                collection_name=collection_name, field_name=field_name, field_schema=models.PayloadSchemaType.KEYWORD
+            )
+    except Exception:
+        # Another request may have created it in the meantime
+        if not await _inspect_collection(collection_name):
+            raise
+        return
+    _known_collections.add(collection_name)
+    _sparse_collections.add(collection_name)
+
+async def _inspect_collection(collection_name: str) -> bool:
+    """
+    Returns whether a collection exists, and records whether it has the sparse index
+    (collections created before hybrid retrieval do not).
+    """
+    if collection_name in _known_collections:
+        return True
+    if not await get_client().collection_exists(collection_name=collection_name):
+        return False
+    info = await get_client().get_collection(collection_name=collection_name)
+    if SPARSE_VECTOR in (info.config.params.sparse_vectors or {}):
+        _sparse_collections.add(collection_name)
+    _known_collections.add(collection_name)
+    return True
+
+async def store_content(COLLECTION_PREFIX: str, session_id: str, documents: list[dict], batch_size: int = 128, max_points: int = None) -> int:
     """ 
     Stores documents in Qdrant after encoding them into embeddings, using batches for efficiency.
+    Point IDs are derived from each document's source and text, so storing the same
+    document again is a no-op: only points missing from the collection are embedded and upserted.
+    With NEAR_DUP, near-duplicates of the batch or of the collection are dropped as well.
+    Corpus scope tags of a document (see corpus_tags) are added to its point, whether
+    it is new or already stored.
 
     Args:
         session_id: The ID of the session for which documents are being stored.
-        documents: A list of dictionaries, where each dictionary contains "text", "title", and "source" keys.
+        documents: A list of dictionaries, where each dictionary contains "text", "title", and "source" keys,
+            and optionally "page" and CORPUS_SCOPE_FIELD (a list of scope tags).
         batch_size: The number of documents to process and upsert into Qdrant in each batch.
+        max_points: Optional cap on the size of the collection; documents beyond it are dropped.
+
+    Returns:
+        The number of new points stored.
     """
     if not isinstance(documents, list):
         raise TypeError("Documents must be a list of dictionaries")
@@ -443,42 +804,178 @@ async def store_content(COLLECTION_PREFIX: str, session_id: str, documents: list
         raise ValueError("Batch size must be a positive integer")
 
     collection_name = COLLECTION_PREFIX + session_id
+    await ensure_collection(collection_name)
+
+    # Derive content-addressed IDs and drop repeats within this batch
+    unique_docs = {}
+    for doc in documents:
+        unique_docs.setdefault(make_point_id(doc["source"], doc["text"]), doc)
+
+    # Only embed and upsert the points that are not already in the collection
+    tagged = any(CORPUS_SCOPE_FIELD in doc for doc in unique_docs.values())
+    existing = await get_client().retrieve(
+        collection_name=collection_name, ids=list(unique_docs),
+        with_payload=[CORPUS_SCOPE_FIELD] if tagged else False, with_vectors=False
+    )
+    if tagged:
+        await _add_corpus_tags(collection_name, existing, unique_docs)
+    for point in existing:
+        unique_docs.pop(str(point.id), None)
+    if not unique_docs:
+        return 0
+
+    ids = list(unique_docs)
+    documents = list(unique_docs.values())
+
+    # Drop near-duplicates of each other and of the points already stored
+    minhash_keys = None
+    if NEAR_DUP:
+        ids, documents, minhash_keys = await _drop_near_duplicates(collection_name, ids, documents)
+        if not ids:
+            return 0
+
+    # Keep the collection within its memory cap
+    if max_points is not None:
+        count = (await get_client().count(collection_name=collection_name, exact=True)).count
+        room = max(max_points - count, 0)
+        if room < len(ids):
+            print(f"Collection {collection_name} is full, dropping {len(ids) - room} documents")
+            ids, documents = ids[:room], documents[:room]
+            if minhash_keys is not None:
+                minhash_keys = minhash_keys[:room]
+        if not ids:
+            return 0
+
+    # Encode the document text into a vector, skipping chunks that are already cached.
+    # Encoding runs on the embedding executor so the event loop keeps serving I/O.
+    texts = [doc["text"] for doc in documents]
+    embedding = await asyncio.get_running_loop().run_in_executor(
+        embed_executor, lambda: registry.get("embedding_cache").encode(get_embedder(), texts, batch_size=batch_size)
+    )
 
-    # check if collection exists
-    try:
-        await client.get_collection(collection_name=collection_name)
-    except:
-        await client.create_collection(
-            collection_name=collection_name,
-            vectors_config=models.VectorParams(size=384, distance=models.Distance.COSINE, on_disk=False),
-        )
+    # Add the BM25 term weights, so the lexical index grows with every batch
+    vectors = embedding.tolist()
+    if collection_name in _sparse_collections:
+        sparse = [models.SparseVector(indices=indices, values=values) for indices, values in map(document_vector, texts)]
+        vectors = {"": vectors, SPARSE_VECTOR: sparse}
 
-    # Encode the document text into a vector
-    embedding = embedder.encode([doc["text"] for doc in documents], batch_size=batch_size, show_progress_bar=True)
+    payloads = [
+        {"title": doc["title"], "text": doc["text"], "source": doc["source"], **({"page": doc["page"]} if "page" in doc else {}),
+         **({CORPUS_SCOPE_FIELD: doc[CORPUS_SCOPE_FIELD]} if CORPUS_SCOPE_FIELD in doc else {})}
+        for doc in documents
+    ]
+    if minhash_keys is not None:
+        for payload, keys in zip(payloads, minhash_keys):
+            payload[MINHASH_FIELD] = keys
 
     # Prepare the data structure for Qdrant
     points = models.Batch(
-    ids=[uuid.uuid4().hex for _ in range(len(documents))],
-    vectors=embedding,
-    payloads=[{"title": doc["title"], "text": doc["text"], "source": doc["source"]} for doc in documents]
+    ids=ids,
+    vectors=vectors,
+    payloads=payloads
 )
 
     # Upsert the batch into Qdrant when batch size is met or at the end
     try:
-        await client.upsert(collection_name=collection_name, points=points, wait=True)
+        await get_client().upsert(collection_name=collection_name, points=points, wait=True)
     except Exception as e:
         print(f"Error upserting batch: {e}")
-    
+        return 0
+    _collection_versions[collection_name] = next(_version_counter)
+    return len(ids)
+
+async def _add_corpus_tags(collection_name: str, points: list, documents: dict) -> None:
+    """
+    Adds the corpus scope tags of the documents to their already stored points, so
+    that chunks fetched by another session become visible to this one as well.
 
-async def retrieve_content(COLLECTION_PREFIX: str, session_id: str, query: str, top_k: int=10, threshold: float=0.5) -> list[dict]:
+    Args:
+        collection_name: The collection the points are stored in.
+        points: The stored points, with their CORPUS_SCOPE_FIELD payload.
+        documents: The documents by point ID.
+    """
+    updates = {}
+    for point in points:
+        stored = set((point.payload or {}).get(CORPUS_SCOPE_FIELD, []))
+        tags = stored | set(documents[str(point.id)].get(CORPUS_SCOPE_FIELD, []))
+        if tags != stored:
+            updates.setdefault(tuple(sorted(tags)), []).append(point.id)
+    for tags, ids in updates.items():
+        await get_client().set_payload(collection_name=collection_name, payload={CORPUS_SCOPE_FIELD: list(tags)}, points=ids, wait=True)
+    if updates:
+        _collection_versions[collection_name] = next(_version_counter)
+
+async def _drop_near_duplicates(collection_name: str, ids: list[str], documents: list[dict]) -> tuple[list, list, list]:
     """
-    Retrieves content from Qdrant for a given query.
+    Drops the documents that are near-duplicates of an earlier document of the list or
+    of a point of the collection. Stored points sharing an LSH band key with a new
+    document are fetched with one payload-filtered scroll and compared by MinHash.
+    The corpus scope tags of a dropped document are merged into the document or
+    point it duplicates, so that its session still retrieves the content.
+
+    Args:
+        collection_name: The collection the documents are stored in.
+        ids: The point IDs of the documents.
+        documents: The documents to filter.
+
+    Returns:
+        The kept IDs, documents and the LSH band keys of each kept document.
+    """
+    loop = asyncio.get_running_loop()
+    signatures = await loop.run_in_executor(embed_executor, lambda: [signature(doc["text"]) for doc in documents])
+    keys = [band_keys(sig) for sig in signatures]
+
+    candidates, _ = await get_client().scroll(
+        collection_name=collection_name,
+        scroll_filter=models.Filter(must=[
+            models.FieldCondition(key=MINHASH_FIELD, match=models.MatchAny(any=sorted({key for doc_keys in keys for key in doc_keys})))
+        ]),
+        limit=NEAR_DUP_MAX_CANDIDATES,
+        with_payload=["text", CORPUS_SCOPE_FIELD],
+        with_vectors=False
+    )
+    matches = await loop.run_in_executor(
+        embed_executor, lambda: match_near_duplicates(signatures, [signature(point.payload["text"]) for point in candidates])
+    )
+
+    documents = list(documents)
+    matched_points, point_tags = {}, {}
+    for doc, match in zip(documents, matches):
+        if match is None or CORPUS_SCOPE_FIELD not in doc:
+            continue
+        kind, i = match
+        if kind == "new":
+            # Documents are only matched against kept ones, so this one is stored
+            documents[i] = {**documents[i], CORPUS_SCOPE_FIELD: sorted(set(documents[i].get(CORPUS_SCOPE_FIELD, [])) | set(doc[CORPUS_SCOPE_FIELD]))}
+        else:
+            point = candidates[i]
+            matched_points[str(point.id)] = point
+            point_tags.setdefault(str(point.id), set()).update(doc[CORPUS_SCOPE_FIELD])
+    if matched_points:
+        await _add_corpus_tags(
+            collection_name, list(matched_points.values()),
+            {point_id: {CORPUS_SCOPE_FIELD: sorted(tags)} for point_id, tags in point_tags.items()}
+        )
+
+    kept = [i for i, match in enumerate(matches) if match is None]
+    return [ids[i] for i in kept], [documents[i] for i in kept], [keys[i] for i in kept]
+
+async def retrieve_content(COLLECTION_PREFIX: str, session_id: str, query: str, top_k: int=10, threshold: float=0.5, query_embedding=None, corpus_scopes: list = None) -> list[dict]:
+    """
+    Retrieves content from Qdrant for a given query, searching the session's collection
+    and, when enabled, the chunks of the shared corpus collection with one of the
+    session's scope tags.
+
+    Dense hits above the threshold and BM25 hits (exact terms such as arXiv IDs, names
+    or acronyms) are merged with weighted reciprocal rank fusion.
 
     Args:
         session_id: The ID of the session for which content is being retrieved.
         query: The query to search for.
         top_k: The number of top results to retrieve. Defaults to 5.
         threshold: The similarity threshold for filtering results. Defaults to 0.5.
+        query_embedding: Optional precomputed embedding of the query (e.g. from extract_keywords_batch).
+        corpus_scopes: The session's corpus scope tags (see corpus_scopes). Defaults to none, which skips the corpus.
 
     Returns:
         A list of dictionaries, where each dictionary contains "text", "title", and "source" keys.  
@@ -493,19 +990,72 @@ async def retrieve_content(COLLECTION_PREFIX: str, session_id: str, query: str,
         raise TypeError("Query must be a string")
     
     collection_name = COLLECTION_PREFIX + session_id
-    # Encode the query into a vector
-    query_embedding = embedder.encode(query).tolist()
-
-    # Search Qdrant for the top-k documents with cosine similarity above the threshold
-    search_results = await client.search(
-        collection_name=collection_name,
-        query_vector=query_embedding,
-        limit=top_k,
-        score_threshold=threshold
-    )
+    # Encode the query into a vector, unless the caller already has it
+    if query_embedding is None:
+        query_embedding = get_embedder().encode(query)
+    query_embedding = [float(x) for x in query_embedding]
+
+    indices, values = query_vector(query)
+    use_sparse = HYBRID_SPARSE_WEIGHT > 0 and len(indices) > 0
+
+    # Other sessions' chunks of the corpus are only visible when they share a scope tag
+    searches = [(collection_name, None)]
+    if CORPUS_COLLECTION and corpus_scopes:
+        searches.append((CORPUS_COLLECTION, models.Filter(must=[
+            models.FieldCondition(key=CORPUS_SCOPE_FIELD, match=models.MatchAny(any=list(corpus_scopes)))
+        ])))
+
+    async def search(name, query_filter):
+        # The dense and BM25 queries of a collection run concurrently
+        if not await _inspect_collection(name):
+            return [], []
+        dense = get_client().search(
+            collection_name=name,
+            query_vector=query_embedding,
+            query_filter=query_filter,
+            limit=top_k,
+            score_threshold=threshold,
+            # Ignored by collections without quantization
+            search_params=models.SearchParams(
+                quantization=models.QuantizationSearchParams(rescore=QDRANT_RESCORE, oversampling=QDRANT_OVERSAMPLING)
+            )
+        )
+        if not (use_sparse and name in _sparse_collections):
+            return await dense, []
+        dense_hits, sparse_hits = await asyncio.gather(dense, get_client().query_points(
+            collection_name=name,
+            query=models.SparseVector(indices=indices, values=values),
+            using=SPARSE_VECTOR,
+            query_filter=query_filter,
+            limit=top_k,
+            with_payload=True
+        ))
+        return dense_hits, sparse_hits.points
+
+    # Search Qdrant for the top-k documents with cosine similarity above the threshold,
+    # in all collections at once
+    results = await asyncio.gather(*(search(name, query_filter) for name, query_filter in searches))
+    search_results = [hit for dense_hits, _ in results for hit in dense_hits]
+    sparse_results = [hit for _, sparse_hits in results for hit in sparse_hits]
+    # Keep the best top-k over both collections
+    search_results = sorted(search_results, key=lambda result: result.score, reverse=True)[:top_k]
+
+    if sparse_results:
+        sparse_results = sorted(sparse_results, key=lambda result: result.score, reverse=True)[:top_k]
+        payloads = {result.id: result for result in sparse_results + search_results}
+        fused = rrf_fuse(
+            [[result.id for result in search_results], [result.id for result in sparse_results]],
+            [HYBRID_DENSE_WEIGHT, HYBRID_SPARSE_WEIGHT],
+            k=HYBRID_RRF_K
+        )
+        search_results = [payloads[point_id] for point_id, _ in fused[:top_k]]
 
     # Return the top-k results as a list of dictionaries containing text, title, and source
-    return [{"text": result.payload["text"], "title": result.payload["title"], "source": result.payload["source"]} for result in search_results]
+    return [
+        {"text": result.payload["text"], "title": result.payload["title"], "source": result.payload["source"],
+         **({"page": result.payload["page"]} if "page" in result.payload else {})}
+        for result in search_results
+    ]
 
 async def delete_collection(COLLECTION_PREFIX: str, session_id: str):
     """
@@ -516,12 +1066,110 @@ async def delete_collection(COLLECTION_PREFIX: str, session_id: str):
     """
     collection_name = COLLECTION_PREFIX + session_id
     # Delete the collection
-    await client.delete_collection(collection_name=collection_name)
+    await get_client().delete_collection(collection_name=collection_name)
+    _known_collections.discard(collection_name)
+    _sparse_collections.discard(collection_name)
+    _collection_versions[collection_name] = next(_version_counter)
     # Delete all points
     # from qdrant_client.http.models import Filter
-    # await client.delete(
+    # await get_client().delete(
     #     collection_name=collection_name,
     #     points_selector=Filter(must=[]),  # An empty filter matches all points
     #     wait=True  # Optional: waits until deletion is applied
     # )
-    print(f"Collection {collection_name} deleted.")
+
+async def delete_orphaned_collections(COLLECTION_PREFIX: str, live_ids) -> list[str]:
+    """
+    Deletes the session collections whose session no longer exists, such as those left
+    by a previous run of the app in persistent mode.
+
+    Args:
+        live_ids: Function returning the IDs of the live sessions, called once the
+            collections are listed, so that sessions created meanwhile are kept.
+
+    Returns:
+        The names of the deleted collections.
+    """
+    names = [
+        collection.name for collection in (await get_client().get_collections()).collections
+        if collection.name.startswith(COLLECTION_PREFIX) and collection.name != CORPUS_COLLECTION
+    ]
+    live = set(live_ids())
+    orphans = [name for name in names if name[len(COLLECTION_PREFIX):] not in live]
+    for name in orphans:
+        await delete_collection(COLLECTION_PREFIX, name[len(COLLECTION_PREFIX):])
+    return orphans
+
+def collection_version(collection_name: str) -> int:
+    """
+    Returns the version of a collection's content; it changes whenever points are
+    stored in the collection or it is deleted.
+    """
+    return _collection_versions.get(collection_name, 0)
+
+def retrieval_versions(COLLECTION_PREFIX: str, session_id: str) -> dict:
+    """
+    Returns the versions of the collections retrieve_content searches for a session,
+    to tag cached turns with.
+    """
+    names = [COLLECTION_PREFIX + session_id] + ([CORPUS_COLLECTION] if CORPUS_COLLECTION else [])
+    return {name: collection_version(name) for name in names}
+
+def corpus_tags(source: str, topics: list[str], arxiv_subject: str = "", arxiv_subtopic: str = "") -> list[str]:
+    """
+    Returns the corpus scope tags of content fetched for a session: one per topic,
+    combining the source ('wikipedia' or 'arxiv'), the topic and, for arXiv, the
+    subject and subtopic.
+    """
+    category = [arxiv_subject, arxiv_subtopic] if source == "arxiv" else []
+    return [json.dumps([source, topic.lower(), *category]) for topic in topics or [""]]
+
+def corpus_scopes(chat_state: dict) -> list[str]:
+    """
+    Returns the corpus scope tags a session retrieves: those of the sources it
+    fetches, for its topics.
+    """
+    tags = []
+    if chat_state["use_wikipedia"]:
+        tags += corpus_tags("wikipedia", chat_state["topics"])
+    if chat_state["fetch_most_relevant"] or chat_state["fetch_most_recent"]:
+        tags += corpus_tags("arxiv", chat_state["topics"], chat_state["arxiv_subject"], chat_state["arxiv_subtopic"])
+    return tags
+
+def query_cache_scopes(session_id: str, chat_state: dict) -> list:
+    """
+    Returns the semantic cache scopes of a session's turns: the session itself and,
+    with a shared corpus and no uploaded files, the sessions with the same sources,
+    topics and arXiv subject, which retrieve the same corpus chunks (see
+    corpus_scopes). Turns are cached under the last scope.
+    """
+    scopes = [("session", session_id)]
+    if QUERY_CACHE_SHARED and CORPUS_COLLECTION and not chat_state["file_upload"]:
+        scopes.append((
+            "sources", tuple(sorted(chat_state["topics"])), tuple(sorted(corpus_scopes(chat_state))),
+            chat_state["fetch_most_relevant"], chat_state["fetch_most_recent"]
+        ))
+    return scopes
+
+def get_cache_stats() -> dict:
+    """
+    Returns the hit/miss counters of the embedding, summary and response caches, and the load
+    time and memory of each model.
+    """
+    embedding_cache = registry.peek("embedding_cache")
+    summary_cache = registry.peek("summary_cache")
+    response_cache = registry.peek("response_cache")
+    query_cache = registry.peek("query_cache")
+    arxiv_scheduler = registry.peek("arxiv_scheduler")
+    wiki_fetcher = registry.peek("wiki_fetcher")
+    return {
+        "pdf": pdf_stats(),
+        "near_duplicates": near_dup_stats(),
+        "wiki_fetcher": wiki_fetcher.stats() if wiki_fetcher is not None else None,
+        "arxiv_scheduler": arxiv_scheduler.stats() if arxiv_scheduler is not None else None,
+        "response_cache": response_cache.stats() if response_cache is not None else None,
+        "query_cache": query_cache.stats() if query_cache is not None else None,
+        "embedding_cache": embedding_cache.stats() if embedding_cache is not None else None,
+        "summary_cache": summary_cache.stats() if summary_cache is not None else None,
+        "models": registry.stats(),
+    }
@@ -1,43 +1,53 @@
 # 
 #  Uses GOOGLE GEMINI API instead of the local LLM (phi-3-mini)
 # 
-from flask import Flask, request, Response, render_template, jsonify
+from flask import Flask, request, Response, render_template, jsonify, g
 import asyncio
 import multiprocessing
 from time import time
 from tqdm import tqdm
 import json
 import os
-import uuid
 
 # Import helper functions from Helper4
 from Helper4 import (
-    extract_keywords,
-    fetch_wikipedia_content,
-    fetch_arxiv_papers,
-    remove_duplicate_dicts,
+    extract_keywords_batch,
     store_content,
     retrieve_content,
-    summarize,
     delete_collection,
-    process_pdf_file,
-    chunk_text
+    chunk_text_tokens,
+    make_point_id,
+    get_cache_stats,
+    collection_version,
+    retrieval_versions,
+    query_cache_scopes,
+    corpus_scopes,
+    delete_orphaned_collections,
+    QUERY_CACHE,
+    QUERY_CACHE_ANSWERS,
+    QDRANT_PERSISTENT,
+    QDRANT_ORPHAN_CLEANUP
 )
 
+from summarizer import summarize_documents, summarize_conversation
+from ingestion import ingest_sources
+from async_runner import run_async, iterate_async, run_cpu
+from session_manager import SessionManager, SESSION_COOKIE, SESSION_MAX_POINTS
+from reranker import rerank, RERANK, RERANK_CANDIDATES
+from pdf_extract import iter_pdf_pages, save_upload
+from upload_jobs import UploadJobs
+from turn_store import TurnStore, estimate_tokens
+
 # Flask app initialization
 app = Flask(__name__)
 
-# Global configuration for Qdrant and collection naming
+# Global configuration for Qdrant and collection naming; every session gets its own collection
 COLLECTION_PREFIX = "rag_session_"
-session_id = "test"
-
-# Create async Qdrant client (using in-memory storage)
-from qdrant_client import async_qdrant_client
-client = async_qdrant_client.AsyncQdrantClient(":memory:")
+# Uploaded chunks buffered before they are stored, so large files are searchable while being indexed
+UPLOAD_FLUSH_SIZE = int(os.getenv("UPLOAD_FLUSH_SIZE", "256"))
 
-# Embedder for document embeddings
-from sentence_transformers import SentenceTransformer
-embedder = SentenceTransformer("all-MiniLM-L6-v2")
+# The Qdrant client and the models are shared with Helper4
+from model_registry import registry
 
 # Determine number of CPU threads
 import multiprocessing
@@ -47,10 +57,29 @@ n_threads = multiprocessing.cpu_count()
 import os
 import google.generativeai as genai
 
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+def start():
+    """
+    Starts the app: configures the Gemini API and, unless MODEL_WARMUP=0, loads the
+    models in the background so the first chat turn does not pay for it.
+    In persistent mode, the collections of sessions from before a restart are deleted.
 
-# Global chat state – now uses topics instead of subject/subtopic.
-chat_state = {}
+    Called when the server starts rather than at import: spawned worker processes
+    (PDF extraction) may import this module and must not load anything.
+    """
+    genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+    if os.getenv("MODEL_WARMUP", "1") == "1":
+        registry.warm_up(background=True)
+    if QDRANT_PERSISTENT and QDRANT_ORPHAN_CLEANUP:
+        # Sessions do not survive a restart, but their collections do
+        sessions.schedule(delete_orphaned_collections(COLLECTION_PREFIX, sessions.ids), "deleting orphaned collections")
+
+# Prompt tokens sent per turn; earlier turns beyond it are compacted or dropped. Gemini's
+# tokenizer is remote, so the counts are estimated.
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "8192"))
+count_tokens = estimate_tokens
+
+# Turns kept verbatim; older ones are folded into a running summary after each answer
+MEMORY_RECENT_TURNS = int(os.getenv("MEMORY_RECENT_TURNS", "3"))
 
 def initialize_chat_state(
     topics: list[str],
@@ -79,8 +108,10 @@ def initialize_chat_state(
     topics_str = ", ".join(topics)
     return {
         "topics": topics,
-        "conversation_history": "",
-        "model_context": f"Topics: {topics_str}\n\n",
+        "turns": TurnStore(
+            count_tokens, header=f"Topics: {topics_str}\n\n", budget=CONTEXT_TOKEN_BUDGET,
+            summarize=summarize_conversation, recent_turns=MEMORY_RECENT_TURNS
+        ),
         "key_phrases": [],
         "first_query": True,
         "citations": [],
@@ -92,6 +123,34 @@ def initialize_chat_state(
         "file_upload": file_upload
     }
 
+# Per-session chat state, keyed by the session cookie. Evicted sessions lose their collection.
+sessions = SessionManager(
+    new_state=lambda: initialize_chat_state(["Deepseek"], False, False, False),
+    on_evict=lambda session: delete_collection(COLLECTION_PREFIX, session.id),
+    busy=lambda session: upload_jobs.active(session.id)
+)
+
+def get_session():
+    """
+    Returns the session of the current request, identified by the session cookie or
+    the X-Session-Token header. A new session's ID is sent back as a cookie.
+    """
+    token = request.cookies.get(SESSION_COOKIE) or request.headers.get("X-Session-Token")
+    session, created = sessions.get(token)
+    if created:
+        g.new_session_id = session.id
+    return session
+
+@app.after_request
+def set_session_cookie(response):
+    """
+    Sets the session cookie on the response to the request that created the session.
+    """
+    session_id = g.pop("new_session_id", None)
+    if session_id is not None:
+        response.set_cookie(SESSION_COOKIE, session_id, httponly=True, samesite="Lax")
+    return response
+
 # Load JSON data
 with open('sub2tag.json', 'r') as f:
     sub2tag = json.load(f)
@@ -122,20 +181,113 @@ def get_subtopics():
         return jsonify(list(sub2tag[subject].keys()))
     return jsonify([])
 
-file_upload = False
+@app.route("/stats", methods=["GET"])
+def stats():
+    """
+    Returns cache hit/miss counters as JSON, to check the savings under real traffic.
+    """
+    stats = get_cache_stats()
+    stats["sessions"] = sessions.stats()
+    stats["uploads"] = upload_jobs.stats()
+    return jsonify(stats)
+
+async def index_uploaded_file(session, filename: str, path: str, progress: dict) -> None:
+    """
+    Extracts and chunks an uploaded file and stores it in the session's collection,
+    a batch of chunks at a time, so chat turns can retrieve from it before it is
+    fully indexed. Runs as a background upload job (see UploadJobs).
+
+    Args:
+        session: The session receiving the file.
+        filename (str): The name of the uploaded file.
+        path (str): The temporary copy of the file.
+        progress (dict): Updated with the pages extracted and the chunks stored (new points
+            upserted; duplicates and failed batches are not counted).
+    """
+    document_chunks = []
+
+    def add_chunks(chunks, page=None):
+        # Add each chunk to the document chunks list, with its page for PDFs
+        for i, chunk in enumerate(chunks):
+            doc = {
+                "id": f"file_{make_point_id(filename, chunk)}",
+                "title": f"{filename} - Page {page} - Chunk {i+1}" if page else f"{filename} - Chunk {i+1}",
+                "text": chunk,
+                "source": f"Uploaded file: {filename}"
+            }
+            if page:
+                doc["page"] = page
+            document_chunks.append(doc)
+
+    async def flush():
+        # Store the document chunks in the session's collection
+        if document_chunks:
+            progress["chunks"] += await store_content(
+                COLLECTION_PREFIX, session.id, document_chunks, batch_size=256, max_points=SESSION_MAX_POINTS
+            )
+            document_chunks.clear()
+
+    if path.endswith('.pdf'):
+        # Chunk and store pages as the extraction workers return them
+        async for page, page_count, text in iter_pdf_pages(path):
+            add_chunks(await run_cpu(chunk_text_tokens, text, overlap=32), page)
+            progress["pages"], progress["page_count"] = page, page_count
+            if len(document_chunks) >= UPLOAD_FLUSH_SIZE:
+                await flush()
+    else:
+        # Process text file
+        def read_text():
+            with open(path, encoding='utf-8') as f:
+                return f.read()
+        content = await asyncio.to_thread(read_text)
+        add_chunks(await run_cpu(chunk_text_tokens, content, overlap=32))
+    await flush()
+
+# Background indexing of uploads; sessions are not evicted while their files are indexed
+upload_jobs = UploadJobs(index_uploaded_file)
+
+def add_uploaded_files(session, files) -> str:
+    """
+    Copies uploaded files to disk and queues them for background indexing into the
+    session's collection. Shared by the Flask and the ASGI app; the caller holds the
+    session's lock.
+
+    Args:
+        session: The session receiving the files.
+        files: The uploaded files (werkzeug FileStorage objects).
+
+    Returns:
+        str: The ID of the upload job, to poll with /upload_status.
+
+    Raises:
+        ValueError: If a file type is not supported.
+    """
+    for file in files:
+        if os.path.splitext(file.filename)[1].lower() not in ('.pdf', '.txt'):
+            raise ValueError(f"Error processing {file.filename}: Unsupported file type")
+
+    uploads = [(file.filename, save_upload(file, suffix=os.path.splitext(file.filename)[1].lower())) for file in files]
+
+    # Retrieval searches the session's collection from now on, as the chunks come in
+    chat_state = session.state
+    if not chat_state["first_query"]:
+        for file in files:
+            chat_state["key_phrases"].append(os.path.splitext(file.filename)[0])
+    chat_state["file_upload"] = True
+    return upload_jobs.submit(session, uploads)
+
 @app.route("/upload_files", methods=["POST"])
-async def upload_files():
+def upload_files():
     """
-    Handle file uploads, process them, and add their content to the Qdrant collection.
+    Accept file uploads and index them in the background into the session's Qdrant collection.
     
-    Supported file types: PDF, TXT, DOCX
+    Supported file types: PDF, TXT
     
     Returns:
-        JSON response with success status and list of processed files
+        JSON response with the upload job ID and the list of accepted files
     """
-    global chat_state
-    global file_upload
-    
+    session = get_session()
+
     if 'files' not in request.files:
         return jsonify({"success": False, "error": "No files provided"}), 400
     
@@ -143,84 +295,39 @@ async def upload_files():
     if not files or files[0].filename == '':
         return jsonify({"success": False, "error": "No files selected"}), 400
     
-    # Process each file
-    processed_files = []
-    document_chunks = []
-    
-    for file in files:
+    with session.lock:
         try:
-            # Get the file extension
-            file_ext = os.path.splitext(file.filename)[1].lower()
-            
-            # Extract content based on file type
-            if file_ext == '.pdf':
-                # Process PDF file
-                content = await process_pdf_file(file)
-            elif file_ext == '.txt':
-                # Process text file
-                content = file.read().decode('utf-8')
-            
-            # Chunk the content
-            chunks = chunk_text(content, chunk_size=512, overlap=64)
-            
-            # Add each chunk to the document chunks list
-            for i, chunk in enumerate(chunks):
-                document_chunks.append({
-                    "id": f"file_{uuid.uuid4().hex[:8]}",
-                    "title": f"{file.filename} - Chunk {i+1}",
-                    "text": chunk,
-                    "source": f"Uploaded file: {file.filename}"
-                })
-            
-            processed_files.append(file.filename)
-            
-        except Exception as e:
-            return jsonify({
-                "success": False, 
-                "error": f"Error processing {file.filename}: {str(e)}"
-            }), 500
-    
-    # Store the document chunks in Qdrant
-    if document_chunks:
-        await store_content(COLLECTION_PREFIX, session_id, document_chunks, batch_size=256)
-    
-    # Add file keywords to the chat state
-    if processed_files and not chat_state["first_query"]:
-        for file_name in processed_files:
-            chat_state["key_phrases"].append(os.path.splitext(file_name)[0])
-        file_upload = True
-        chat_state['file_upload'] = True
-    elif processed_files:
-        file_upload = True
-        chat_state['file_upload'] = True
-    
+            job_id = add_uploaded_files(session, files)
+        except ValueError as e:
+            return jsonify({"success": False, "error": str(e)}), 400
+
     return jsonify({
         "success": True,
-        "file_count": len(processed_files),
-        "files": processed_files
-    })
+        "job_id": job_id,
+        "file_count": len(files),
+        "files": [file.filename for file in files]
+    }), 202
 
-@app.route("/init", methods=["POST"])
-def init_chat():
+@app.route("/upload_status/<job_id>", methods=["GET"])
+def upload_status(job_id):
     """
-    Initialize chat session using the provided topics and arXiv settings.
+    Returns the indexing progress of each file of an upload job of the session.
+    """
+    status = upload_jobs.status(job_id, get_session().id)
+    if status is None:
+        return jsonify({"success": False, "error": "Unknown upload job"}), 404
+    return jsonify(status)
 
-    The chat session is initialized with the provided topics and arXiv settings.
-    The following keys are expected in the JSON payload:
+def chat_state_from_payload(data: dict) -> dict:
+    """
+    Builds a new chat state from the JSON payload of the /init request.
 
-    - topics: a list of topic strings.
-    - use_wikipedia: a boolean flag to use Wikipedia for context.
-    - fetch_most_relevant: a boolean flag to fetch the most relevant arXiv papers.
-    - fetch_most_recent: a boolean flag to fetch the most recent arXiv papers.
-    - arxiv_subject: an optional string to filter arXiv papers by subject.
-    - arxiv_subtopic: an optional string to filter arXiv papers by subtopic.
+    Args:
+        data (dict): The JSON payload.
 
     Returns:
-        dict: A JSON object with a single key "success" set to True.
+        dict: The initialized chat state.
     """
-    global chat_state
-    # Get the JSON payload from the request
-    data = request.get_json(force=True)
     # Get the topics from the JSON payload, default to ["Deepseek"] if not provided.
     topics = data.get("topics", ["Deepseek"])
     # Get the use_wikipedia flag from the JSON payload, default to True if not provided.
@@ -235,139 +342,177 @@ def init_chat():
     arxiv_subtopic = data.get("arxiv_subtopic", "")
     # Initialize the chat state with the provided topics and arXiv settings.
     file_upload = data.get("uploaded", False)
-    chat_state = initialize_chat_state(topics, use_wikipedia, fetch_most_relevant, fetch_most_recent, arxiv_subject, arxiv_subtopic, file_upload)
+    return initialize_chat_state(topics, use_wikipedia, fetch_most_relevant, fetch_most_recent, arxiv_subject, arxiv_subtopic, file_upload)
+
+@app.route("/init", methods=["POST"])
+def init_chat():
+    """
+    Initialize chat session using the provided topics and arXiv settings.
+
+    The chat session is initialized with the provided topics and arXiv settings.
+    The following keys are expected in the JSON payload:
+
+    - topics: a list of topic strings.
+    - use_wikipedia: a boolean flag to use Wikipedia for context.
+    - fetch_most_relevant: a boolean flag to fetch the most relevant arXiv papers.
+    - fetch_most_recent: a boolean flag to fetch the most recent arXiv papers.
+    - arxiv_subject: an optional string to filter arXiv papers by subject.
+    - arxiv_subtopic: an optional string to filter arXiv papers by subtopic.
+
+    Returns:
+        dict: A JSON object with a single key "success" set to True.
+    """
+    session = get_session()
+    # Get the JSON payload from the request
+    data = request.get_json(force=True)
+    with session.lock:
+        session.state = chat_state_from_payload(data)
     # Return a JSON object with a single key "success" set to True.
     return jsonify({"success": True})
 
-def stream_response(user_input):
+async def stream_response(session, user_input):
     """
-    Generator function to stream status and response tokens via SSE.
+    Async generator streaming status and response tokens via SSE.
     It uses Wikipedia and arXiv content based on the provided topics and arXiv filter options.
+    Fetching, Qdrant and LLM calls are awaited on the running loop and CPU-bound model
+    calls run on the CPU executor, so it serves both the Flask and the ASGI app.
+    The caller holds the session's lock.
     """
-    global chat_state
+    chat_state = session.state
 
     # First query: fetch initial content
     if chat_state["first_query"]:
-        key_phrases = extract_keywords(user_input, top_n=5, threshold=0.50)
+        [key_phrases], query_embeddings = await run_cpu(extract_keywords_batch, [user_input], top_n=5, threshold=0.50)
         key_phrases += chat_state["topics"]
         if len(user_input.split()) < 4:
             key_phrases += [user_input]
         chat_state["key_phrases"] = list(set(key_phrases))
 
-        wiki_content = []
-        start = time()
-        if chat_state["use_wikipedia"]:
-            yield "event: status\ndata: Fetching Wikipedia content...\n\n"
-            wiki_content = asyncio.run(fetch_wikipedia_content(queries=chat_state["key_phrases"], num_results=10, max_sections=15))
-            yield "event: status\ndata: Wikipedia content fetched in {:.2f} seconds.\n\n".format(time() - start)
-
-        arxiv_content = []
-        if chat_state["fetch_most_recent"] or chat_state["fetch_most_relevant"]:
-            yield "event: status\ndata: Fetching arXiv content...\n\n"
-            start = time()
-            arxiv_query = chat_state["key_phrases"]
-            
-            if chat_state["fetch_most_relevant"]:
-                arxiv_content += asyncio.run(fetch_arxiv_papers(subject=chat_state["arxiv_subject"], subtopic=chat_state["arxiv_subtopic"], queries=arxiv_query, max_results=20, priority="relevance"))
-            if chat_state["fetch_most_recent"]:
-                arxiv_content += asyncio.run(fetch_arxiv_papers(subject=chat_state["arxiv_subject"], subtopic=chat_state["arxiv_subtopic"], queries=arxiv_query, max_results=20, priority="submitted"))
-            yield "event: status\ndata: arXiv content fetched in {:.2f} seconds.\n\n".format(time() - start)
-
-        if len(wiki_content) != 0 or len(arxiv_content) != 0:
-            yield "event: status\ndata: Removing duplicates and storing content in Qdrant...\n\n"
-            start = time()
-            documents = remove_duplicate_dicts(wiki_content) + remove_duplicate_dicts(arxiv_content)
-            asyncio.run(store_content(COLLECTION_PREFIX, session_id, documents, batch_size=256))
-            yield "event: status\ndata: Content stored in Qdrant in {:.2f} seconds.\n\n".format(time() - start)
+        # Fetch all enabled sources concurrently
+        async for status in ingest_sources(
+            COLLECTION_PREFIX, session.id, chat_state["key_phrases"],
+            use_wikipedia=chat_state["use_wikipedia"],
+            fetch_most_relevant=chat_state["fetch_most_relevant"],
+            fetch_most_recent=chat_state["fetch_most_recent"],
+            arxiv_subject=chat_state["arxiv_subject"],
+            arxiv_subtopic=chat_state["arxiv_subtopic"],
+            arxiv_max_results=20,
+            max_points=SESSION_MAX_POINTS,
+            wiki_options={"num_results": 10, "max_sections": 15},
+            topics=chat_state["topics"]
+        ):
+            yield f"event: status\ndata: {status}\n\n"
         chat_state["first_query"] = False
     else:
-        new_keywords = extract_keywords(user_input, top_n=5, threshold=0.25)
+        [new_keywords], query_embeddings = await run_cpu(extract_keywords_batch, [user_input], top_n=5, threshold=0.25)
         if len(user_input.split()) < 4:
             new_keywords += [user_input]
         new_keywords = [kw for kw in new_keywords if kw not in chat_state["key_phrases"]]
         if not set(new_keywords).issubset(set(chat_state["key_phrases"])):
             yield "event: status\ndata: Fetching additional content for new keywords...\n\n"
-            start = time()
-            all_docs = []
-            if chat_state["fetch_most_relevant"]:
-                all_docs.extend(asyncio.run(fetch_arxiv_papers(subject=chat_state["arxiv_subject"], subtopic=chat_state["arxiv_subtopic"], queries=new_keywords, max_results=25, priority="relevance")))
-            if chat_state["fetch_most_recent"]:
-                all_docs.extend(asyncio.run(fetch_arxiv_papers(subject=chat_state["arxiv_subject"], subtopic=chat_state["arxiv_subtopic"], queries=new_keywords, max_results=25, priority="submitted")))
-            if chat_state["use_wikipedia"]:
-                all_docs.extend(asyncio.run(fetch_wikipedia_content(new_keywords, num_results=10, max_sections=15, chunk_size=512, overlap=64)))
-            if all_docs != []:
-                asyncio.run(store_content(COLLECTION_PREFIX, session_id, documents=all_docs, batch_size=256))
+            async for status in ingest_sources(
+                COLLECTION_PREFIX, session.id, new_keywords,
+                use_wikipedia=chat_state["use_wikipedia"],
+                fetch_most_relevant=chat_state["fetch_most_relevant"],
+                fetch_most_recent=chat_state["fetch_most_recent"],
+                arxiv_subject=chat_state["arxiv_subject"],
+                arxiv_subtopic=chat_state["arxiv_subtopic"],
+                arxiv_max_results=25,
+                wiki_options={"num_results": 10, "max_sections": 15},
+                background=True,
+                max_points=SESSION_MAX_POINTS,
+                topics=chat_state["topics"]
+            ):
+                yield f"event: status\ndata: {status}\n\n"
             chat_state["key_phrases"].extend([kw for kw in new_keywords if kw not in chat_state["key_phrases"]])
 
-            if chat_state["fetch_most_recent"] or chat_state["fetch_most_relevant"] or chat_state["use_wikipedia"] or chat_state["file_upload"]:
-                yield "event: status\ndata: Additional content stored in Qdrant in {:.2f} seconds.\n\n".format(time() - start)
+    # A repeat or near-repeat of an earlier question reuses its documents, summary and answer,
+    # as long as no content was stored since
+    query_cache = registry.get("query_cache") if QUERY_CACHE else None
+    scopes = query_cache_scopes(session.id, chat_state)
+    versions = retrieval_versions(COLLECTION_PREFIX, session.id)
+    cached = query_cache.get(query_embeddings[0], scopes, collection_version) if query_cache is not None else None
 
     # Retrieve relevant documents
-    if chat_state["fetch_most_relevant"] or chat_state["fetch_most_recent"] or chat_state["use_wikipedia"] or chat_state["file_upload"]:
+    if cached is not None:
+        yield "event: status\ndata: Reusing the documents of a similar question...\n\n"
+        relevant_docs = cached["docs"]
+    elif chat_state["fetch_most_relevant"] or chat_state["fetch_most_recent"] or chat_state["use_wikipedia"] or chat_state["file_upload"]:
         yield "event: status\ndata: Retrieving relevant documents...\n\n"
         start = time()
-        relevant_docs = asyncio.run(retrieve_content(COLLECTION_PREFIX, session_id, user_input, top_k=20, threshold=0.35))
+        # Over-fetch when reranking, then keep the best few for summarization
+        relevant_docs = await retrieve_content(COLLECTION_PREFIX, session.id, user_input, top_k=RERANK_CANDIDATES if RERANK else 20, threshold=0.35, query_embedding=query_embeddings[0], corpus_scopes=corpus_scopes(chat_state))
+        if RERANK and relevant_docs:
+            relevant_docs = await run_cpu(rerank, user_input, relevant_docs)
     
     else:
         relevant_docs = []
-        chat_state["model_context"] += "<|user|>\n"
 
-    if len(relevant_docs) > 0:
+    if len(relevant_docs) > 0 and cached is None:
         yield "event: status\ndata: Retrieved documents in {:.2f} seconds.\n\n".format(time() - start)
-        chat_state["model_context"] += "<|user|>\nUse the following context and your own knowledge to answer the question at the end. If you don't know the answer, just say that you don't know, don't try to make up an answer. Keep the answer as detailed, lucid and to the point as possible. Answer should be at most of 1250 words.\n\n"
 
     # Update conversation context with retrieved documents
-    chat_state["conversation_history"] += f"User: {user_input}\n"
-    
-    new_context = ""
     chat_state["citations"] = []
+    new_context = ""
     for doc in tqdm(relevant_docs):
-        new_context += f"{doc['title']}\n{doc['text']}\n\n"
         chat_state["citations"].append(f"- {doc['title']} ({doc['source']})")
-    if len(new_context) > 0:
-        new_context = summarize(new_context, max_input_tokens=1024, max_output_tokens=1024)
-        chat_state["model_context"] += new_context
-        chat_state["model_context"] += f"Question: {user_input}\n<|end|>\n<|assistant|>\n"
+    if len(relevant_docs) > 0:
+        # Map-reduce summary over all retrieved documents, bounded by SUMMARY_TIME_BUDGET
+        if cached is not None:
+            new_context = cached["summary"]
+        else:
+            new_context = await run_cpu(summarize_documents, relevant_docs, max_input_tokens=1024, max_output_tokens=1024)
+        chat_state["turns"].add(
+            f"<|user|>\nUse the following context and your own knowledge to answer the question at the end. If you don't know the answer, just say that you don't know, don't try to make up an answer. Keep the answer as detailed, lucid and to the point as possible. Answer should be at most of 1250 words.\n\n{new_context}Question: {user_input}\n<|end|>\n<|assistant|>\n",
+            # Once the turn is old and the budget is tight, the question alone stands for it
+            compact=f"<|user|>\n{user_input}\n<|end|>\n<|assistant|>\n",
+            text=user_input
+        )
     else:
-        chat_state["model_context"] += f"<|user|>\n{user_input}\n<|end|>\n<|assistant|>\n"
-    chat_state["conversation_history"] += "Assistant: "
-
-    # Trim context if exceeding model token limits
-    while len(chat_state["model_context"].split()) > 1e6:
-        user_start = chat_state["model_context"].find("<|user|>")
-        assistant_start = chat_state["model_context"].find("<|assistant|>", user_start + 1)
-        if user_start == -1 or assistant_start == -1:
-            break
-        chat_state["model_context"] = chat_state["model_context"][assistant_start:].strip()
-
-    yield "event: status\ndata: Generating response...\n\n"
-    generated_text = ""
+        chat_state["turns"].add(f"<|user|>\n{user_input}\n<|end|>\n<|assistant|>\n", text=user_input)
+
+    # The running summary, then the recent turns, compacted or dropped to fit the prompt token budget
+    prompt = chat_state["turns"].build()
+
+    if cached is not None and QUERY_CACHE_ANSWERS and cached["answer"]:
+        # Stream the cached answer back at once
+        generated_text = cached["answer"]
+        yield "event: clearStatus\ndata: \n\n"
+        yield f"data: {generated_text}\n\n"
+    else:
+        yield "event: status\ndata: Generating response...\n\n"
+        generated_text = ""
     
-    model = genai.GenerativeModel('gemini-2.0-flash')
-    chat = model.start_chat(history=[])
-    first = True
-    for part in chat.send_message(
-        chat_state["model_context"],
-        stream=True,
-        generation_config=genai.types.GenerationConfig(
-        temperature=0.15,
-        max_output_tokens=1920,
-        top_p=0.9,
-        top_k=40,
-        stop_sequences=["<|end|>", "<|assistant|>"]
+        model = genai.GenerativeModel('gemini-2.0-flash')
+        chat = model.start_chat(history=[])
+        first = True
+        response = await chat.send_message_async(
+            prompt,
+            stream=True,
+            generation_config=genai.types.GenerationConfig(
+            temperature=0.15,
+            max_output_tokens=1920,
+            top_p=0.9,
+            top_k=40,
+            stop_sequences=["<|end|>", "<|assistant|>"]
+            )
         )
-    ):
+        async for part in response:
     
-        token = part.text.replace("\n\n", "<br><br>").replace("\n", "<br>")
+            token = part.text.replace("\n\n", "<br><br>").replace("\n", "<br>")
         
-        if first:
-            first = False
-            yield "event: clearStatus\ndata: \n\n"
-        yield f"data: {token}\n\n"
-        generated_text += token
+            if first:
+                first = False
+                yield "event: clearStatus\ndata: \n\n"
+            yield f"data: {token}\n\n"
+            generated_text += token
+
+    chat_state["turns"].answer(f"{generated_text}\n")
+    # Fold older turns into the running summary while the user reads the answer
+    chat_state["turns"].schedule_memory_update()
 
-    chat_state["model_context"] += f"{generated_text}\n"
-    chat_state["conversation_history"] += generated_text
+    if query_cache is not None and cached is None and generated_text:
+        query_cache.put(query_embeddings[0], scopes[-1], versions, {"docs": relevant_docs, "summary": new_context, "answer": generated_text})
 
     if len(chat_state["citations"]) > 0:
         yield f"event: citation\ndata: References: <br>\n"
@@ -384,19 +529,20 @@ def chat():
     user_input = request.args.get("prompt", "")
     if not user_input:
         return "No prompt provided", 400
-    return Response(stream_response(user_input), mimetype="text/event-stream")
+    session = get_session()
 
-@app.route("/shutdown", methods=["POST"])
-def shutdown():
+    def generate():
+        # Turns of the same session run one at a time
+        with session.lock:
+            yield from iterate_async(stream_response(session, user_input))
+
+    return Response(generate(), mimetype="text/event-stream")
+
+def reset_chat_state(chat_state: dict) -> dict:
     """
-    Clear session data and delete the Qdrant collection.
+    Returns a fresh chat state with the same topics and source settings.
     """
-    global chat_state
-    try:
-        asyncio.run(delete_collection(COLLECTION_PREFIX, session_id))
-    except Exception as e:
-        return f"Error deleting collection: {e}", 500
-    chat_state = initialize_chat_state(
+    state = initialize_chat_state(
         chat_state.get("topics", []),
         chat_state.get("use_wikipedia", True),
         chat_state.get("fetch_most_relevant", True),
@@ -405,9 +551,32 @@ def shutdown():
         chat_state.get("arxiv_subtopic", ""),
         chat_state.get("file_upload", False)
     )
-    chat_state["file_upload"] = False
+    state["file_upload"] = False
+    return state
+
+@app.route("/shutdown", methods=["POST"])
+def shutdown():
+    """
+    Clear session data and delete the Qdrant collection.
+    """
+    session = get_session()
+    with session.lock:
+        upload_jobs.cancel(session.id)
+        try:
+            run_async(delete_collection(COLLECTION_PREFIX, session.id))
+        except Exception as e:
+            return f"Error deleting collection: {e}", 500
+        session.state = reset_chat_state(session.state)
     return "Session data cleared", 200
 
+def main():
+    """
+    Starts the app and runs the Flask server.
+    """
+    start()
+    # Run the Flask app with debugging enabled. No reloader: its child process would
+    # reopen the Qdrant storage directory (QDRANT_PATH) while this one holds it.
+    app.run(host="0.0.0.0", port=5000, debug=True, use_reloader=False)
+
 if __name__ == "__main__":
-    # Run the Flask app with debugging enabled.
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    main()
@@ -0,0 +1,222 @@
+import os
+import re
+import threading
+
+from Helper4 import arxiv_category, search_arxiv_sync, ARXIV_PAGE_SIZE
+
+# Limits for one combined query; by default its results fit in one page, i.e. one
+# request (every page takes a token from the arXiv scheduler's budget)
+ARXIV_MAX_TERMS = int(os.getenv("ARXIV_MAX_TERMS", "8"))
+ARXIV_MAX_QUERY_CHARS = int(os.getenv("ARXIV_MAX_QUERY_CHARS", "400"))
+ARXIV_MAX_COMBINED_RESULTS = int(os.getenv("ARXIV_MAX_COMBINED_RESULTS", str(ARXIV_PAGE_SIZE)))
+# Longest key phrase searched as an exact phrase; longer input is split into terms
+ARXIV_PHRASE_MAX_WORDS = int(os.getenv("ARXIV_PHRASE_MAX_WORDS", "4"))
+
+_STOPWORDS = frozenset(
+    "a an and are as at be by can could do does for from how i in is it me of on or should "
+    "tell the to was what when where which who why with would you".split()
+)
+
+
+def content_words(phrase: str) -> list[str]:
+    """
+    Returns the words of a key phrase without punctuation, and without stop words at
+    either end ("What is RLHF?" -> ["RLHF"]). Longer input keeps no stop words at all.
+    """
+    words = re.findall(r"\w+", phrase)
+    while words and words[0].lower() in _STOPWORDS:
+        words.pop(0)
+    while words and words[-1].lower() in _STOPWORDS:
+        words.pop()
+    if len(words) > ARXIV_PHRASE_MAX_WORDS:
+        words = [word for word in words if word.lower() not in _STOPWORDS]
+    return words
+
+
+def abs_term(phrase: str, exact: bool = True) -> str:
+    """
+    Returns the arXiv clause for a key phrase. A short phrase, with exact=True, is
+    searched as one in the abstracts: abs:word, or abs:"two words". Longer input, such
+    as a question, becomes AND-ed abstract terms: (abs:reward AND abs:model). With
+    exact=False the terms are searched in all fields, like a free-text query:
+    (all:reward AND all:model). Returns "" for a phrase without words.
+    """
+    words = content_words(phrase)
+    field = "abs" if exact else "all"
+    if len(words) == 1:
+        return f"{field}:{words[0]}"
+    if exact and 1 < len(words) <= ARXIV_PHRASE_MAX_WORDS:
+        return f'{field}:"{" ".join(words)}"'
+    return "(" + " AND ".join(f"{field}:{word}" for word in words) + ")" if words else ""
+
+
+def build_query(phrases: list[str], category: str = "") -> str:
+    """
+    Combines key phrases into one boolean arXiv query, e.g.
+    'cat:cs.AI AND (abs:"neural network" OR abs:transformer)'. Without a category,
+    phrases are not searched as exact phrases but as terms in all fields, e.g.
+    '((all:neural AND all:network) OR all:transformer)'.
+    """
+    terms = " OR ".join(abs_term(phrase, exact=bool(category)) for phrase in phrases)
+    query = f"({terms})" if len(phrases) > 1 else terms
+    return f"{category} AND {query}" if category else query
+
+
+def plan_queries(phrases: list[str], max_terms: int = ARXIV_MAX_TERMS, max_chars: int = ARXIV_MAX_QUERY_CHARS) -> list[list[str]]:
+    """
+    Splits key phrases into as few groups as possible, each small enough to be sent
+    as one combined query.
+
+    Parameters
+    ----------
+    phrases : list[str]
+        The key phrases.
+    max_terms : int, optional
+        The maximum number of phrases per query. Defaults to ARXIV_MAX_TERMS.
+    max_chars : int, optional
+        The maximum length of the OR-ed abstract clauses. Defaults to ARXIV_MAX_QUERY_CHARS.
+
+    Returns
+    -------
+    list[list[str]]
+        The groups of phrases, one per query.
+    """
+    groups = []
+    current, current_len = [], 0
+    for phrase in dict.fromkeys(p for p in phrases if abs_term(p)):
+        length = max(len(abs_term(phrase)), len(abs_term(phrase, exact=False))) + 4
+        if current and (len(current) >= max_terms or current_len + length > max_chars):
+            groups.append(current)
+            current, current_len = [], 0
+        current.append(phrase)
+        current_len += length
+    if current:
+        groups.append(current)
+    return groups
+
+
+def _words(text: str) -> set:
+    return set(re.findall(r"\w+", text.lower()))
+
+
+def _phrase_words(phrase: str) -> set:
+    return {word.lower() for word in content_words(phrase)}
+
+
+def assign_results(papers: list[dict], phrases: list[str], max_results: int) -> dict:
+    """
+    Assigns the papers returned by a combined query back to the key phrases they
+    match (all content words of the phrase appear in the title or abstract), keeping the
+    query's ranking and at most max_results papers per phrase.
+
+    Papers that match no phrase word-for-word (arXiv also matches stemmed forms) go
+    to the phrase sharing the most words with them.
+
+    Returns
+    -------
+    dict
+        Key phrase -> list of papers.
+    """
+    phrase_words = {phrase: _phrase_words(phrase) for phrase in phrases}
+    assigned = {phrase: [] for phrase in phrases}
+    for paper in papers:
+        words = _words(paper["text"])
+        matches = [phrase for phrase, needed in phrase_words.items() if needed and needed <= words]
+        if not matches:
+            matches = [max(phrases, key=lambda phrase: len(phrase_words[phrase] & words))]
+        for phrase in matches:
+            if len(assigned[phrase]) < max_results:
+                assigned[phrase].append(paper)
+    return assigned
+
+
+class CombinedArxivFetch:
+    """
+    The arXiv requests for one group of key phrases.
+
+    The relevance-sorted query runs once and is shared. When it is needed anyway
+    and returned every matching paper (fewer than requested), the most-recent
+    ordering is derived from it locally instead of sending a second, date-sorted
+    query.
+    """
+
+    def __init__(self, phrases: list[str], category: str, max_results: int, background: bool = False, derive_recent: bool = True):
+        self.phrases = phrases
+        self.max_results = max_results
+        self.max_total = min(max_results * len(phrases), ARXIV_MAX_COMBINED_RESULTS)
+        self.query = build_query(phrases, category)
+        self.background = background
+        self.derive_recent = derive_recent
+        self._relevance = None
+        self._lock = threading.Lock()
+
+    def relevance(self) -> list[dict]:
+        """
+        Returns the papers of the relevance-sorted query, fetching them once.
+        """
+        with self._lock:
+            if self._relevance is None:
+                self._relevance = search_arxiv_sync(self.query, self.max_total, "relevance", self.background)
+            return self._relevance
+
+    def _flatten(self, papers: list[dict]) -> list[dict]:
+        # Keep the papers assigned to at least one phrase, in the query's order
+        assigned = assign_results(papers, self.phrases, self.max_results)
+        kept = {paper["id"] for phrase_papers in assigned.values() for paper in phrase_papers}
+        return [paper for paper in papers if paper["id"] in kept]
+
+    def most_relevant(self) -> list[dict]:
+        """
+        Returns up to max_results papers per phrase, by relevance.
+        """
+        return self._flatten(self.relevance())
+
+    def most_recent(self) -> list[dict]:
+        """
+        Returns up to max_results papers per phrase, newest first.
+        """
+        papers = self.relevance() if self.derive_recent else []
+        if self.derive_recent and len(papers) < self.max_total and all(paper.get("published") for paper in papers):
+            # The relevance query returned the complete result set: just reorder it
+            papers = sorted(papers, key=lambda paper: paper["published"], reverse=True)
+        else:
+            papers = search_arxiv_sync(self.query, self.max_total, "submitted", self.background)
+        return self._flatten(papers)
+
+
+def plan_arxiv_fetches(subject: str, subtopic: str, phrases: list[str], max_results: int,
+                       most_relevant: bool = True, most_recent: bool = False, background: bool = False) -> list:
+    """
+    Plans the arXiv requests for a set of key phrases.
+
+    Parameters
+    ----------
+    subject : str
+        Optional arXiv subject filter.
+    subtopic : str
+        Optional arXiv subtopic filter.
+    phrases : list[str]
+        The key phrases to search for.
+    max_results : int
+        The maximum number of papers per phrase and ordering.
+    most_relevant : bool, optional
+        Whether to fetch the most relevant papers. Defaults to True.
+    most_recent : bool, optional
+        Whether to fetch the most recent papers. Defaults to False.
+    background : bool, optional
+        Queue the requests behind first-turn searches. Defaults to False.
+
+    Returns
+    -------
+    list[tuple[str, callable]]
+        (label, fetch) pairs, where fetch() returns a list of papers.
+    """
+    category = arxiv_category(subject, subtopic)
+    fetches = []
+    for group in plan_queries(phrases):
+        combined = CombinedArxivFetch(group, category, max_results, background, derive_recent=most_relevant)
+        if most_relevant:
+            fetches.append(("arXiv (most relevant)", combined.most_relevant))
+        if most_recent:
+            fetches.append(("arXiv (most recent)", combined.most_recent))
+    return fetches
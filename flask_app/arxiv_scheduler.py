@@ -0,0 +1,215 @@
+import itertools
+import queue
+import random
+import threading
+from concurrent.futures import Future
+from time import monotonic, sleep
+
+import arxiv
+import requests
+
+# Job priorities: lower runs first
+FOREGROUND = 0
+BACKGROUND = 1
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: ``rate`` tokens per second, at most ``capacity`` banked.
+
+    Parameters
+    ----------
+    rate : float
+        Tokens added per second.
+    capacity : float
+        Maximum burst size.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        if rate <= 0 or capacity < 1:
+            raise ValueError("rate must be positive and capacity at least 1")
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self) -> None:
+        """
+        Blocks until a token is available and takes it.
+        """
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            sleep(wait)
+
+    def penalize(self, seconds: float) -> None:
+        """
+        Empties the bucket and delays the next token by ``seconds``, so that every
+        worker backs off after the server signals overload.
+        """
+        with self._lock:
+            self._refill()
+            self._tokens = min(self._tokens, 0) - seconds * self.rate
+
+
+class ArxivScheduler:
+    """
+    Shared scheduler for arXiv API requests.
+
+    Each worker sends its requests through its own ``arxiv.Client`` (and so its own
+    pooled keep-alive HTTP session). Every request takes a token from a shared
+    bucket, and is retried with jittered exponential backoff on throttling (429),
+    server errors (5xx), empty pages and network errors; other HTTP errors, such as
+    400 for a malformed query, fail at once. Jobs wait in a priority queue, so first-turn searches overtake
+    background ones. A job is meant to send one HTTP request: ``search`` splits a
+    search into one job per page.
+
+    Parameters
+    ----------
+    rate : float, optional
+        Requests per second. Defaults to 1/3, arXiv's published limit.
+    burst : int, optional
+        Requests that may be sent back to back after an idle period. Defaults to 2.
+    workers : int, optional
+        Number of requests in flight at once. Defaults to 2.
+    max_retries : int, optional
+        Retries per request. Defaults to 4.
+    backoff : float, optional
+        Base backoff in seconds, doubled on each retry. Defaults to 3.
+    page_size : int, optional
+        Results per page, i.e. per request. Defaults to 100.
+    """
+
+    def __init__(self, rate: float = 1 / 3, burst: int = 2, workers: int = 2, max_retries: int = 4, backoff: float = 3.0, page_size: int = 100):
+        if page_size < 1:
+            raise ValueError("page_size must be at least 1")
+        self.bucket = TokenBucket(rate, burst)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.page_size = page_size
+        self.requests = 0
+        self.retries = 0
+        self._stats_lock = threading.Lock()
+        self._queue = queue.PriorityQueue()
+        self._counter = itertools.count()
+        for i in range(workers):
+            threading.Thread(target=self._work, name=f"arxiv-{i}", daemon=True).start()
+
+    def submit(self, fn, background: bool = False) -> Future:
+        """
+        Queues ``fn(client)`` to run on a worker once a token is available.
+
+        Parameters
+        ----------
+        fn : callable
+            Function taking the worker's ``arxiv.Client`` and performing one request.
+        background : bool, optional
+            Run after all queued foreground jobs. Defaults to False.
+
+        Returns
+        -------
+        Future
+            Resolves to the return value of ``fn``.
+        """
+        future = Future()
+        priority = BACKGROUND if background else FOREGROUND
+        self._queue.put((priority, next(self._counter), fn, future))
+        return future
+
+    def run(self, fn, background: bool = False):
+        """
+        Same as submit, but waits for and returns the result.
+        """
+        return self.submit(fn, background).result()
+
+    def search(self, search: arxiv.Search, background: bool = False) -> list:
+        """
+        Runs a search page by page, each page a job of its own, so that every HTTP
+        request is paced by the bucket and retried on its own.
+
+        Parameters
+        ----------
+        search : arxiv.Search
+            The search; max_results=None fetches every result.
+        background : bool, optional
+            Run after all queued foreground jobs. Defaults to False.
+
+        Returns
+        -------
+        list[arxiv.Result]
+            The results, in order.
+        """
+        results = []
+        while search.max_results is None or len(results) < search.max_results:
+            offset = len(results)
+            size = self.page_size if search.max_results is None else min(self.page_size, search.max_results - offset)
+            page = self.run(lambda client: self._page(client, search, offset, size), background)
+            results.extend(page)
+            if len(page) < size:
+                break
+        return results
+
+    @staticmethod
+    def _page(client: arxiv.Client, search: arxiv.Search, offset: int, size: int) -> list:
+        """
+        Fetches the results offset..offset+size-1 of a search in one request.
+        """
+        page = arxiv.Search(
+            query=search.query, id_list=search.id_list, max_results=offset + size,
+            sort_by=search.sort_by, sort_order=search.sort_order
+        )
+        return list(client.results(page, offset=offset))
+
+    def _work(self) -> None:
+        # Pacing and retries are handled here, not by the client; one page per request
+        client = arxiv.Client(page_size=self.page_size, delay_seconds=0, num_retries=0)
+        while True:
+            _, _, fn, future = self._queue.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(self._call(fn, client))
+            except Exception as e:
+                future.set_exception(e)
+
+    @staticmethod
+    def _retryable(error: Exception) -> bool:
+        if isinstance(error, arxiv.HTTPError):
+            return error.status == 429 or error.status >= 500
+        return isinstance(error, (arxiv.UnexpectedEmptyPageError, requests.RequestException))
+
+    def _call(self, fn, client: arxiv.Client):
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            with self._stats_lock:
+                self.requests += 1
+            try:
+                return fn(client)
+            except (arxiv.HTTPError, arxiv.UnexpectedEmptyPageError, requests.RequestException) as e:
+                if attempt == self.max_retries or not self._retryable(e):
+                    raise
+                with self._stats_lock:
+                    self.retries += 1
+                delay = self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+                if isinstance(e, arxiv.HTTPError) and e.status in (429, 503):
+                    # Throttled: make every worker wait, not just this one
+                    self.bucket.penalize(delay)
+                else:
+                    sleep(delay)
+
+    def stats(self) -> dict:
+        """
+        Returns request and retry counters and the queue length.
+        """
+        with self._stats_lock:
+            return {"requests": self.requests, "retries": self.retries, "queued": self._queue.qsize()}
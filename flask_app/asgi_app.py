@@ -0,0 +1,186 @@
+#
+#  ASGI serving mode: same routes and SSE events as the Flask app, served from one event loop.
+#  CHAT_APP selects the backend: "app" (Gemini API, default) or "app2" (local Phi-3).
+#
+#  Run with:  hypercorn asgi_app:app --bind 0.0.0.0:5000
+#
+import importlib
+import os
+
+from quart import Quart, request, Response, render_template, jsonify, g
+
+from Helper4 import delete_collection, get_cache_stats
+from session_manager import SESSION_COOKIE
+
+# The chat pipeline, session registry and chat state helpers of the selected app
+backend = importlib.import_module(os.getenv("CHAT_APP", "app"))
+
+# Quart app initialization; templates and static files are shared with the Flask app
+app = Quart(__name__)
+
+
+@app.before_serving
+async def start():
+    """
+    Starts the selected app (API configuration, model warm-up) when the server starts.
+    """
+    backend.start()
+
+
+def get_session():
+    """
+    Returns the session of the current request, identified by the session cookie or
+    the X-Session-Token header. A new session's ID is sent back as a cookie.
+    """
+    token = request.cookies.get(SESSION_COOKIE) or request.headers.get("X-Session-Token")
+    session, created = backend.sessions.get(token)
+    if created:
+        g.new_session_id = session.id
+    return session
+
+
+@app.after_request
+async def set_session_cookie(response):
+    """
+    Sets the session cookie on the response to the request that created the session.
+    """
+    session_id = g.pop("new_session_id", None)
+    if session_id is not None:
+        response.set_cookie(SESSION_COOKIE, session_id, httponly=True, samesite="Lax")
+    return response
+
+
+@app.route("/")
+async def index():
+    """
+    Serves the main chat interface.
+    """
+    return await render_template('index.html', subjects=list(backend.sub2tag.keys()))
+
+
+@app.route('/get_subtopics', methods=['POST'])
+async def get_subtopics():
+    """
+    Returns a JSON list of subtopics for the given subject.
+    """
+    subject = (await request.get_json()).get('subject')
+    if subject in backend.sub2tag:
+        return jsonify(list(backend.sub2tag[subject].keys()))
+    return jsonify([])
+
+
+@app.route("/stats", methods=["GET"])
+async def stats():
+    """
+    Returns cache hit/miss counters as JSON.
+    """
+    stats = get_cache_stats()
+    stats["sessions"] = backend.sessions.stats()
+    stats["uploads"] = backend.upload_jobs.stats()
+    return jsonify(stats)
+
+
+@app.route("/upload_files", methods=["POST"])
+async def upload_files():
+    """
+    Accept file uploads and index them in the background into the session's collection.
+    """
+    session = get_session()
+    uploaded = await request.files
+
+    if 'files' not in uploaded:
+        return jsonify({"success": False, "error": "No files provided"}), 400
+
+    files = uploaded.getlist('files')
+    if not files or files[0].filename == '':
+        return jsonify({"success": False, "error": "No files selected"}), 400
+
+    await session.acquire()
+    try:
+        # The files are indexed on this loop, where the app's coroutines run
+        job_id = backend.add_uploaded_files(session, files)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    finally:
+        session.release()
+
+    return jsonify({
+        "success": True,
+        "job_id": job_id,
+        "file_count": len(files),
+        "files": [file.filename for file in files]
+    }), 202
+
+
+@app.route("/upload_status/<job_id>", methods=["GET"])
+async def upload_status(job_id):
+    """
+    Returns the indexing progress of each file of an upload job of the session.
+    """
+    status = backend.upload_jobs.status(job_id, get_session().id)
+    if status is None:
+        return jsonify({"success": False, "error": "Unknown upload job"}), 404
+    return jsonify(status)
+
+
+@app.route("/init", methods=["POST"])
+async def init_chat():
+    """
+    Initialize chat session using the provided topics and arXiv settings.
+    """
+    session = get_session()
+    data = await request.get_json(force=True)
+    await session.acquire()
+    try:
+        session.state = backend.chat_state_from_payload(data)
+    finally:
+        session.release()
+    return jsonify({"success": True})
+
+
+@app.route("/chat", methods=["GET"])
+async def chat():
+    """
+    Chat endpoint: expects query parameter 'prompt' and streams SSE response.
+    """
+    user_input = request.args.get("prompt", "")
+    if not user_input:
+        return "No prompt provided", 400
+    session = get_session()
+
+    async def generate():
+        # Turns of the same session run one at a time
+        await session.acquire()
+        try:
+            async for event in backend.stream_response(session, user_input):
+                yield event
+        finally:
+            session.release()
+
+    response = Response(generate(), mimetype="text/event-stream")
+    # Stream for as long as the answer takes
+    response.timeout = None
+    return response
+
+
+@app.route("/shutdown", methods=["POST"])
+async def shutdown():
+    """
+    Clear session data and delete the Qdrant collection.
+    """
+    session = get_session()
+    await session.acquire()
+    try:
+        backend.upload_jobs.cancel(session.id)
+        try:
+            await delete_collection(backend.COLLECTION_PREFIX, session.id)
+        except Exception as e:
+            return f"Error deleting collection: {e}", 500
+        session.state = backend.reset_chat_state(session.state)
+    finally:
+        session.release()
+    return "Session data cleared", 200
+
+
+if __name__ == "__main__":
+    app.run(host="0.0.0.0", port=5000)
@@ -0,0 +1,123 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Threads for CPU-bound model calls (keyphrases, summaries, local LLM decoding)
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", "2"))
+
+_loop = None
+_loop_lock = threading.Lock()
+cpu_executor = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix="cpu")
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """
+    Returns the process-wide event loop, starting it in a daemon thread on first use.
+
+    Every coroutine the sync Flask views need (fetching, Qdrant calls) runs on this
+    one long-lived loop instead of a fresh loop per asyncio.run call.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name="async-runner", daemon=True)
+            thread.start()
+            _loop = loop
+    return _loop
+
+
+def run_async(coro, timeout: float = None):
+    """
+    Runs a coroutine on the shared loop and blocks until it returns.
+
+    Parameters
+    ----------
+    coro : coroutine
+        The coroutine to run.
+    timeout : float, optional
+        Seconds to wait for the result. Defaults to no limit.
+
+    Returns
+    -------
+    Any
+        The result of the coroutine.
+    """
+    return asyncio.run_coroutine_threadsafe(coro, get_loop()).result(timeout)
+
+
+def iterate_async(agen):
+    """
+    Iterates an async generator on the shared loop from synchronous code, such as a
+    Flask streaming response.
+
+    Parameters
+    ----------
+    agen : async generator
+        The async generator to iterate.
+
+    Yields
+    ------
+    Any
+        The items produced by the async generator.
+    """
+    loop = get_loop()
+    try:
+        while True:
+            try:
+                yield asyncio.run_coroutine_threadsafe(agen.__anext__(), loop).result()
+            except StopAsyncIteration:
+                break
+    finally:
+        # Runs when the client disconnects mid-stream, too
+        asyncio.run_coroutine_threadsafe(agen.aclose(), loop).result()
+
+
+async def run_cpu(fn, *args, **kwargs):
+    """
+    Runs a CPU-bound function on the bounded CPU executor, so the event loop keeps
+    serving other connections meanwhile.
+
+    Parameters
+    ----------
+    fn : callable
+        The function to run.
+    *args, **kwargs
+        Arguments passed to fn.
+
+    Returns
+    -------
+    Any
+        The return value of fn.
+    """
+    return await asyncio.get_running_loop().run_in_executor(cpu_executor, lambda: fn(*args, **kwargs))
+
+
+async def iterate_in_executor(iterable):
+    """
+    Iterates a blocking iterator (such as a local LLM token stream) on the CPU
+    executor, one item at a time, from async code.
+
+    Items are produced on whichever worker is free and interleave with other
+    iterations, so iterators that share a model context must not run concurrently:
+    callers serialize them (app2 holds a lock for the whole LLM stream).
+
+    Parameters
+    ----------
+    iterable : iterable
+        The blocking iterable.
+
+    Yields
+    ------
+    Any
+        The items of the iterable.
+    """
+    loop = asyncio.get_running_loop()
+    iterator = iter(iterable)
+    done = object()
+    while True:
+        item = await loop.run_in_executor(cpu_executor, next, iterator, done)
+        if item is done:
+            break
+        yield item
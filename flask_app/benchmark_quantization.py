@@ -0,0 +1,128 @@
+#
+#  Benchmark of quantized vector storage: estimated memory of the in-RAM vectors and
+#  recall@k of retrieve_content against exact float32 search, for typical research
+#  queries. Memory is not measured: it is computed from the point count and vector
+#  size (Qdrant reports neither per collection), and leaves out the HNSW graph and
+#  payloads.
+#
+#  Needs a Qdrant server (the embedded mode does not quantize):
+#  QDRANT_URL=http://localhost:6333 python benchmark_quantization.py
+#
+import asyncio
+import os
+from time import time
+
+# Search only the benchmark collections, dense side only
+os.environ["QDRANT_CORPUS_COLLECTION"] = ""
+os.environ["HYBRID_SPARSE_WEIGHT"] = "0"
+
+import Helper4
+from Helper4 import (
+    get_client,
+    ensure_collection,
+    store_content,
+    retrieve_content,
+    delete_collection,
+    iter_wiki_pages_sync,
+    search_arxiv_sync,
+    make_point_id,
+    get_embedder
+)
+from qdrant_client.http import models
+
+PREFIX = "bench_quantization_"
+TOP_K = 10
+DIM = 384
+
+TYPICAL_QUERIES = [
+    "transformer attention mechanism",
+    "graph neural networks for molecules",
+    "reinforcement learning from human feedback",
+    "diffusion models for image generation",
+    "markov chain monte carlo convergence",
+    "quantization of large language models",
+    "protein structure prediction",
+    "federated learning and differential privacy",
+]
+
+# (collection, quantization, rescore)
+MODES = [
+    ("float32", "", False),
+    ("int8", "int8", False),
+    ("int8_rescored", "int8", True),
+    ("binary", "binary", False),
+    ("binary_rescored", "binary", True),
+]
+
+
+def build_corpus(queries: list[str]) -> list[dict]:
+    """
+    Fetches the Wikipedia and arXiv chunks the chat would ingest for the queries
+    (served from the response cache after the first run).
+    """
+    documents = []
+    for query in queries:
+        for page in iter_wiki_pages_sync(query, num_results=5):
+            documents.extend(page)
+        documents.extend(search_arxiv_sync(f"abs:({query})", max_results=20))
+    return documents
+
+
+def ram_bytes(points: int, quantization: str) -> int:
+    """
+    Estimated size of the vectors kept in RAM: points x dimensions x bytes per
+    dimension, without index or storage overhead.
+    """
+    if quantization == "int8":
+        return points * DIM
+    if quantization == "binary":
+        return points * DIM // 8
+    return points * DIM * 4
+
+
+async def main():
+    documents = build_corpus(TYPICAL_QUERIES)
+    print(f"{len(documents)} chunks, {len(TYPICAL_QUERIES)} queries, recall@{TOP_K}")
+
+    queries = {query: get_embedder().encode(query) for query in TYPICAL_QUERIES}
+    for name, quantization, _ in MODES:
+        if name.endswith("_rescored"):
+            continue
+        await delete_collection(PREFIX, name)
+        await ensure_collection(PREFIX + name, quantization=quantization)
+        await store_content(PREFIX, name, documents, batch_size=128)
+    points = (await get_client().count(collection_name=PREFIX + "float32", exact=True)).count
+
+    # Ground truth: exact float32 search
+    truth = {}
+    for query, embedding in queries.items():
+        hits = await get_client().search(
+            collection_name=PREFIX + "float32", query_vector=[float(x) for x in embedding],
+            limit=TOP_K, search_params=models.SearchParams(exact=True)
+        )
+        truth[query] = {str(hit.id) for hit in hits}
+
+    print(f"{'mode':<16}{'est. MB':>10}{'est. saved':>12}{'recall':>8}{'ms/query':>10}")
+    baseline = ram_bytes(points, "")
+    for name, quantization, rescore in MODES:
+        collection = name.replace("_rescored", "")
+        Helper4.QDRANT_RESCORE = rescore
+        recall, start = 0.0, time()
+        for query, embedding in queries.items():
+            docs = await retrieve_content(PREFIX, collection, query, top_k=TOP_K, threshold=0.0, query_embedding=embedding)
+            found = {make_point_id(doc["source"], doc["text"]) for doc in docs}
+            recall += len(found & truth[query]) / max(len(truth[query]), 1)
+        latency = (time() - start) * 1000 / len(queries)
+        size = ram_bytes(points, quantization)
+        print(f"{name:<16}{size / 2**20:>10.2f}{1 - size / baseline:>12.0%}{recall / len(queries):>8.3f}{latency:>10.1f}")
+
+    for name, _, rescore in MODES:
+        if not rescore:
+            await delete_collection(PREFIX, name)
+    print("Memory columns are estimates from the point count, not measurements")
+
+
+if __name__ == "__main__":
+    if not Helper4.QDRANT_URL:
+        raise SystemExit("Set QDRANT_URL to a Qdrant server: the embedded mode does not quantize")
+    asyncio.run(main())
@@ -0,0 +1,117 @@
+import re
+
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+")
+
+
+def _split(text: str, start: int, end: int, separator: re.Pattern):
+    """
+    Yields the (start, end) spans of text[start:end] between separator matches,
+    without surrounding whitespace.
+    """
+    pos = start
+    for match in separator.finditer(text, start, end):
+        yield from _strip(text, pos, match.start())
+        pos = match.end()
+    yield from _strip(text, pos, end)
+
+
+def _strip(text: str, start: int, end: int):
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    if start < end:
+        yield start, end
+
+
+def _split_long(text: str, start: int, end: int, tokenizer, max_tokens: int):
+    """
+    Splits a sentence longer than max_tokens into windows of max_tokens tokens,
+    using the tokenizer's character offsets.
+    """
+    offsets = tokenizer(text[start:end], add_special_tokens=False, return_offsets_mapping=True)["offset_mapping"]
+    for i in range(0, len(offsets), max_tokens):
+        window = offsets[i:i + max_tokens]
+        yield start + window[0][0], start + window[-1][1], len(window)
+
+
+def iter_chunk_spans(text: str, tokenizer, max_tokens: int, overlap: int = 0):
+    """
+    Splits text into chunks of at most max_tokens tokenizer tokens, breaking at
+    sentence boundaries and starting a new chunk at a paragraph that would not fit
+    in the current one. Sentences longer than max_tokens are split on token
+    boundaries.
+
+    The text is processed one paragraph at a time and chunks are yielded as soon as
+    they are complete, as character offsets into text rather than copies.
+
+    Parameters
+    ----------
+    text : str
+        The text to split.
+    tokenizer : transformers.PreTrainedTokenizerFast
+        The tokenizer of the embedding model.
+    max_tokens : int
+        The maximum number of tokens per chunk, without special tokens.
+    overlap : int, optional
+        The maximum number of tokens of trailing sentences repeated at the start of
+        the next chunk. Defaults to 0.
+
+    Yields
+    ------
+    tuple[int, int]
+        The start and end offsets of each chunk.
+    """
+    if not isinstance(text, str):
+        raise TypeError("Text must be a string")
+    if max_tokens <= 0:
+        raise ValueError("max_tokens must be positive")
+    if overlap < 0 or overlap >= max_tokens:
+        raise ValueError("overlap must be between 0 and max_tokens - 1")
+
+    # Sentences of the chunk being built: (start, end, tokens)
+    current = []
+    size = 0
+    fresh = 0
+
+    def flush():
+        nonlocal current, size, fresh
+        span = (current[0][0], current[-1][1])
+        # Carry the trailing sentences over into the next chunk
+        kept, kept_size = [], 0
+        for piece in reversed(current):
+            if kept_size + piece[2] > overlap:
+                break
+            kept.insert(0, piece)
+            kept_size += piece[2]
+        current, size, fresh = kept, kept_size, 0
+        return span
+
+    for paragraph_start, paragraph_end in _split(text, 0, len(text), _PARAGRAPH_BREAK):
+        sentences = list(_split(text, paragraph_start, paragraph_end, _SENTENCE_BREAK))
+        counts = [len(ids) for ids in tokenizer([text[s:e] for s, e in sentences], add_special_tokens=False)["input_ids"]]
+        pieces = []
+        for (start, end), count in zip(sentences, counts):
+            if count <= max_tokens:
+                pieces.append((start, end, count))
+            else:
+                pieces.extend(_split_long(text, start, end, tokenizer, max_tokens))
+
+        # Keep a paragraph that fits in one chunk together
+        paragraph_size = sum(piece[2] for piece in pieces)
+        if fresh and size + paragraph_size > max_tokens and paragraph_size <= max_tokens:
+            yield flush()
+
+        for piece in pieces:
+            if fresh and size + piece[2] > max_tokens:
+                yield flush()
+            # Drop carried-over sentences that leave no room
+            while current and size + piece[2] > max_tokens:
+                size -= current.pop(0)[2]
+            current.append(piece)
+            size += piece[2]
+            fresh += 1
+
+    if fresh:
+        yield flush()
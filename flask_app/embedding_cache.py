@@ -0,0 +1,265 @@
+import atexit
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+class EmbeddingCache:
+    """
+    Disk-backed cache of sentence embeddings keyed by a hash of the model name and
+    the chunk text.
+
+    Vectors live in a fixed-capacity memory-mapped ``.npy`` file, so looking up a
+    cached chunk is a page read instead of a transformer forward pass. A SQLite
+    index maps each key to its row in the vector file and keeps the keys in
+    least-recently-used order; when the cache is full the oldest entries are evicted
+    in bulk and their rows reused.
+
+    Changes are kept in memory and written to disk ``flush_interval`` seconds after
+    the first pending one, at exit, and before evicted rows are reused: only the
+    changed keys are written, and the index never points at a row holding another
+    key's vector.
+
+    Parameters
+    ----------
+    cache_dir : str
+        Directory holding ``vectors.npy`` and ``index.sqlite3``.
+    model_name : str
+        Name of the embedding model. Part of every key, so switching models never
+        returns stale vectors.
+    dim : int
+        Dimension of the embedding vectors.
+    max_entries : int, optional
+        Maximum number of vectors kept on disk. Defaults to 100000.
+    flush_interval : float, optional
+        Seconds pending changes wait before being written. Defaults to 30.
+    """
+
+    def __init__(self, cache_dir: str, model_name: str, dim: int, max_entries: int = 100_000, flush_interval: float = 30.0):
+        if not isinstance(dim, int) or dim <= 0:
+            raise ValueError("dim must be a positive integer")
+        if not isinstance(max_entries, int) or max_entries <= 0:
+            raise ValueError("max_entries must be a positive integer")
+
+        self.cache_dir = cache_dir
+        self.model_name = model_name
+        self.dim = dim
+        self.max_entries = max_entries
+        self.flush_interval = flush_interval
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._vectors_path = os.path.join(cache_dir, "vectors.npy")
+        # key -> row in the vector file, oldest first
+        self._index = OrderedDict()
+        self._free_rows = []
+        # Rows of evicted entries, free once the eviction is on disk
+        self._released_rows = []
+        # key -> (row, seq) to write, or None to delete
+        self._pending = {}
+        self._seq = 0
+        self._timer = None
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(cache_dir, "index.sqlite3"), check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, row INTEGER, seq INTEGER)")
+        self._db.commit()
+        self._open()
+        atexit.register(self.close)
+
+    def _open(self):
+        """
+        Open the vector file and index, or create empty ones if they are missing or
+        were written with a different shape.
+        """
+        shape = (self.max_entries, self.dim)
+        vectors = None
+        if os.path.exists(self._vectors_path):
+            try:
+                vectors = np.lib.format.open_memmap(self._vectors_path, mode="r+")
+                if vectors.shape != shape or vectors.dtype != np.float32:
+                    vectors = None
+            except (ValueError, OSError):
+                vectors = None
+
+        if vectors is None:
+            # Start over with an empty cache
+            vectors = np.lib.format.open_memmap(self._vectors_path, mode="w+", dtype=np.float32, shape=shape)
+            self._db.execute("DELETE FROM entries")
+            self._db.commit()
+
+        self._vectors = vectors
+        index = self._db.execute("SELECT key, row, seq FROM entries ORDER BY seq").fetchall()
+        self._index = OrderedDict((key, row) for key, row, _ in index if 0 <= row < self.max_entries)
+        self._seq = index[-1][2] if index else 0
+        used = set(self._index.values())
+        self._free_rows = [row for row in range(self.max_entries - 1, -1, -1) if row not in used]
+
+    def _touch(self, key: str, row: int) -> None:
+        # Must be called with the lock held: marks key as most recently used
+        self._index[key] = row
+        self._index.move_to_end(key)
+        self._seq += 1
+        self._pending[key] = (row, self._seq)
+
+    def _take_row(self) -> int:
+        # Must be called with the lock held
+        if not self._free_rows:
+            # Evict the least recently used entries in bulk, so the index is written
+            # once per batch of evictions rather than once per new entry
+            for _ in range(max(1, self.max_entries // 100)):
+                if not self._index:
+                    break
+                key, row = self._index.popitem(last=False)
+                self._pending[key] = None
+                self._released_rows.append(row)
+                self.evictions += 1
+            self._flush_locked()
+        return self._free_rows.pop()
+
+    def key(self, text: str) -> str:
+        """
+        Return the cache key for a chunk of text.
+        """
+        return hashlib.sha1(f"{self.model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, texts: list[str]) -> list:
+        """
+        Look up the embeddings for a list of texts.
+
+        Returns
+        -------
+        list
+            One entry per text: a copy of the cached vector, or ``None`` on a miss.
+        """
+        results = []
+        with self._lock:
+            for text in texts:
+                key = self.key(text)
+                row = self._index.get(key)
+                if row is None:
+                    self.misses += 1
+                    results.append(None)
+                else:
+                    self.hits += 1
+                    self._touch(key, row)
+                    results.append(np.array(self._vectors[row]))
+            self._schedule_flush()
+        return results
+
+    def put_many(self, texts: list[str], vectors) -> None:
+        """
+        Store the embeddings for a list of texts, evicting the least recently used
+        entries when the cache is full.
+        """
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                key = self.key(text)
+                row = self._index.get(key)
+                if row is None:
+                    row = self._take_row()
+                self._vectors[row] = vector
+                self._touch(key, row)
+            self._schedule_flush()
+
+    def encode(self, embedder, texts: list[str], batch_size: int = 128, show_progress_bar: bool = False):
+        """
+        Embed a list of texts, running the model only on the texts that are not
+        already cached.
+
+        Parameters
+        ----------
+        embedder : SentenceTransformer
+            The model used for cache misses.
+        texts : list[str]
+            The texts to embed.
+        batch_size : int, optional
+            Batch size passed to ``embedder.encode``. Defaults to 128.
+        show_progress_bar : bool, optional
+            Whether to show the encoder progress bar. Defaults to False.
+
+        Returns
+        -------
+        np.ndarray
+            A ``(len(texts), dim)`` float32 array, in the order of ``texts``.
+        """
+        cached = self.get_many(texts)
+
+        # Encode each distinct missing text once
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, cached) if vector is None))
+        if missing:
+            new_vectors = embedder.encode(missing, batch_size=batch_size, show_progress_bar=show_progress_bar)
+            self.put_many(missing, new_vectors)
+            encoded = dict(zip(missing, new_vectors))
+            cached = [vector if vector is not None else encoded[text] for text, vector in zip(texts, cached)]
+
+        if not cached:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.asarray(cached, dtype=np.float32)
+
+    def _schedule_flush(self) -> None:
+        # Must be called with the lock held
+        if self._pending and self._timer is None and self._db is not None:
+            self._timer = threading.Timer(self.flush_interval, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _flush_locked(self) -> None:
+        # Vectors first, so that the index never references a row not yet written
+        self._vectors.flush()
+        if self._pending:
+            with self._db:
+                self._db.executemany(
+                    "DELETE FROM entries WHERE key = ?", [(key,) for key, entry in self._pending.items() if entry is None]
+                )
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO entries (key, row, seq) VALUES (?, ?, ?)",
+                    [(key, *entry) for key, entry in self._pending.items() if entry is not None]
+                )
+            self._pending.clear()
+        self._free_rows.extend(self._released_rows)
+        self._released_rows.clear()
+
+    def flush(self) -> None:
+        """
+        Write pending vectors and index changes to disk.
+        """
+        with self._lock:
+            self._timer = None
+            if self._db is not None:
+                self._flush_locked()
+
+    def close(self) -> None:
+        """
+        Flush pending changes and close the index. Called at exit.
+        """
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._db is None:
+                return
+            self._flush_locked()
+            self._db.close()
+            self._db = None
+
+    def stats(self) -> dict:
+        """
+        Return hit/miss counters and the current size of the cache.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._index),
+                "max_entries": self.max_entries,
+            }
@@ -0,0 +1,233 @@
+import asyncio
+import concurrent.futures
+import os
+import threading
+from time import time
+
+from Helper4 import (
+    iter_wiki_pages_sync,
+    make_point_id,
+    store_content,
+    corpus_tags,
+    CORPUS_COLLECTION,
+    CORPUS_MAX_POINTS,
+    CORPUS_SCOPE_FIELD
+)
+from arxiv_planner import plan_arxiv_fetches
+
+# Seconds to wait for the slowest source before answering with what has arrived
+INGEST_TIMEOUT = float(os.getenv("INGEST_TIMEOUT", "180"))
+# Chunks embedded and upserted together
+INGEST_MICRO_BATCH = int(os.getenv("INGEST_MICRO_BATCH", "64"))
+# Fetched pages/papers waiting to be embedded before fetch threads block
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "32"))
+
+
+def _pump(iterable, loop, queue: asyncio.Queue, source: str, stop: threading.Event) -> None:
+    """
+    Runs a blocking fetch iterator in a worker thread and puts each item it yields on
+    the asyncio queue. Blocks while the queue is full, which is what gives the
+    pipeline its backpressure; gives up once ``stop`` is set.
+    """
+    for item in iterable:
+        docs = item if isinstance(item, list) else [item]
+        future = asyncio.run_coroutine_threadsafe(queue.put(("docs", source, docs)), loop)
+        while True:
+            try:
+                future.result(timeout=0.5)
+                break
+            except concurrent.futures.TimeoutError:
+                if stop.is_set():
+                    future.cancel()
+                    return
+        if stop.is_set():
+            return
+
+
+async def _produce(source: str, iterable_factory, loop, queue: asyncio.Queue, stop: threading.Event) -> None:
+    """
+    Runs one fetch (one source and keyword) and reports on the queue when it ends.
+    """
+    error = None
+    try:
+        await asyncio.to_thread(_pump, iterable_factory(), loop, queue, source, stop)
+    except Exception as e:
+        error = e
+    await queue.put(("done", source, error))
+
+
+async def ingest_sources(
+    collection_prefix: str,
+    session_id: str,
+    keywords: list[str],
+    use_wikipedia: bool = False,
+    fetch_most_relevant: bool = False,
+    fetch_most_recent: bool = False,
+    arxiv_subject: str = "",
+    arxiv_subtopic: str = "",
+    arxiv_max_results: int = 20,
+    wiki_options: dict = None,
+    timeout: float = INGEST_TIMEOUT,
+    micro_batch: int = INGEST_MICRO_BATCH,
+    queue_size: int = INGEST_QUEUE_SIZE,
+    background: bool = False,
+    max_points: int = None,
+    topics: list[str] = None,
+    status: dict = None
+):
+    """
+    Fetches all enabled sources concurrently and streams the results into Qdrant.
+
+    Every Wikipedia keyword and every planned arXiv query (see arxiv_planner) runs
+    in its own thread and pushes each page or paper onto a bounded queue as soon as
+    it arrives. The consumer
+    embeds and upserts the chunks in micro-batches while the fetches continue, so
+    network I/O overlaps with embedding; when the queue is full the fetch threads
+    wait, which caps memory on large keyword fan-outs. The wall time is that of the
+    slowest source rather than the sum of all of them.
+
+    With a shared corpus collection (persistent Qdrant), the chunks are stored there
+    instead of in the session's collection, tagged with the session's corpus scope
+    (source, topics and arXiv subject), and the corpus is capped at CORPUS_MAX_POINTS.
+
+    Parameters
+    ----------
+    collection_prefix : str
+        Prefix of the Qdrant collection name.
+    session_id : str
+        The ID of the session whose collection receives the documents.
+    keywords : list[str]
+        The key phrases to search for.
+    use_wikipedia : bool, optional
+        Whether to fetch Wikipedia content. Defaults to False.
+    fetch_most_relevant : bool, optional
+        Whether to fetch the most relevant arXiv papers. Defaults to False.
+    fetch_most_recent : bool, optional
+        Whether to fetch the most recent arXiv papers. Defaults to False.
+    arxiv_subject : str, optional
+        Optional arXiv subject filter.
+    arxiv_subtopic : str, optional
+        Optional arXiv subtopic filter.
+    arxiv_max_results : int, optional
+        Maximum number of arXiv papers per keyword and ordering. Defaults to 20.
+    wiki_options : dict, optional
+        Extra keyword arguments for iter_wiki_pages_sync.
+    timeout : float, optional
+        Seconds to wait for the sources; fetches still running afterwards are
+        abandoned. Defaults to INGEST_TIMEOUT.
+    micro_batch : int, optional
+        Number of chunks embedded and upserted at a time. Defaults to INGEST_MICRO_BATCH.
+    queue_size : int, optional
+        Maximum number of fetched pages/papers waiting to be embedded. Defaults to
+        INGEST_QUEUE_SIZE.
+    background : bool, optional
+        Queue the arXiv searches behind first-turn searches of other sessions.
+        Defaults to False.
+    max_points : int, optional
+        Cap on the size of the session's collection (not applied to the shared
+        corpus). Defaults to no limit.
+    topics : list[str], optional
+        The session's topics, for the corpus scope tags. Defaults to none.
+    status : dict, optional
+        Filled with the state of each source ("Wikipedia", "arXiv (most relevant)",
+        ...) as it progresses: {"state": "running", "done" or "timed out",
+        "chunks": new chunks fetched, "errors": messages of failed fetches}.
+
+    Yields
+    ------
+    str
+        Progress messages, suitable for the SSE 'status' event.
+    """
+    if not keywords:
+        return
+
+    wiki_options = wiki_options or {}
+    fetches = []
+    if use_wikipedia:
+        for keyword in keywords:
+            fetches.append(("Wikipedia", lambda kw=keyword: iter_wiki_pages_sync(kw, **wiki_options)))
+    if fetch_most_relevant or fetch_most_recent:
+        # Key phrases are coalesced into as few combined arXiv queries as possible
+        fetches += plan_arxiv_fetches(
+            arxiv_subject, arxiv_subtopic, keywords, arxiv_max_results,
+            most_relevant=fetch_most_relevant, most_recent=fetch_most_recent, background=background
+        )
+    if not fetches:
+        return
+
+    pending = {}
+    for source, _ in fetches:
+        pending[source] = pending.get(source, 0) + 1
+    status = {} if status is None else status
+    for source in pending:
+        status[source] = {"state": "running", "chunks": 0, "errors": []}
+    yield f"Fetching {', '.join(pending)} content..."
+
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    producers = [asyncio.ensure_future(_produce(source, factory, loop, queue, stop)) for source, factory in fetches]
+
+    start = time()
+    deadline = None if timeout is None else start + timeout
+    seen = set()
+    buffer = []
+    stored = 0
+    remaining = len(producers)
+    # Fetched content goes to the shared corpus when there is one, else to the session
+    if CORPUS_COLLECTION:
+        target, cap = ("", CORPUS_COLLECTION), CORPUS_MAX_POINTS
+        tags = {
+            "wikipedia": corpus_tags("wikipedia", topics),
+            "arxiv": corpus_tags("arxiv", topics, arxiv_subject, arxiv_subtopic),
+        }
+    else:
+        target, cap = (collection_prefix, session_id), max_points
+        tags = None
+    try:
+        while remaining > 0:
+            wait = None if deadline is None else deadline - time()
+            if wait is not None and wait <= 0:
+                for source, count in pending.items():
+                    if count:
+                        status[source]["state"] = "timed out"
+                yield f"Skipping sources still running after {timeout:g} seconds."
+                break
+            try:
+                kind, source, payload = await asyncio.wait_for(queue.get(), wait)
+            except asyncio.TimeoutError:
+                continue
+
+            if kind == "done":
+                remaining -= 1
+                pending[source] -= 1
+                if payload is not None:
+                    status[source]["errors"].append(str(payload))
+                    yield f"{source} fetch failed: {payload}"
+                if pending[source] == 0:
+                    status[source]["state"] = "done"
+                    yield f"{source} content fetched ({status[source]['chunks']} chunks) in {time() - start:.2f} seconds."
+                continue
+
+            # Drop chunks already seen in this ingestion (same source and text)
+            for doc in payload:
+                point_id = make_point_id(doc["source"], doc["text"])
+                if point_id not in seen:
+                    seen.add(point_id)
+                    if tags is not None:
+                        doc = {**doc, CORPUS_SCOPE_FIELD: tags["wikipedia" if source == "Wikipedia" else "arxiv"]}
+                    buffer.append(doc)
+                    status[source]["chunks"] += 1
+
+            if len(buffer) >= micro_batch:
+                stored += await store_content(*target, buffer, batch_size=micro_batch, max_points=cap)
+                buffer = []
+    finally:
+        stop.set()
+        for producer in producers:
+            producer.cancel()
+
+    if buffer:
+        stored += await store_content(*target, buffer, batch_size=micro_batch, max_points=cap)
+    if stored:
+        yield f"{stored} chunks stored in Qdrant in {time() - start:.2f} seconds."
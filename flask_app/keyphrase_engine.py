@@ -0,0 +1,116 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from keyphrase_vectorizers import KeyphraseCountVectorizer
+
+
+class KeyphraseEngine:
+    """
+    Persistent KeyBERT-style keyphrase extractor.
+
+    Candidates are noun phrases found by ``KeyphraseCountVectorizer`` and are ranked
+    by cosine similarity to the query, exactly like ``KeyBERT.extract_keywords``,
+    but the engine reuses the already-loaded sentence embedder and spaCy pipeline,
+    handles a batch of queries with one spaCy pass and one encoder call per batch,
+    and keeps an LRU cache of candidate-phrase embeddings across calls. The
+    vectorizer is built once; each batch refits its vocabulary, one batch at a time.
+
+    Parameters
+    ----------
+    embedder : SentenceTransformer
+        The shared sentence embedder.
+    spacy_pipeline : spacy.Language or str, optional
+        The spaCy pipeline used to tag candidate phrases. Defaults to 'en_core_web_sm'.
+    cache_size : int, optional
+        Maximum number of phrase embeddings kept in memory. Defaults to 20000.
+    stop_words : str or list[str], optional
+        Stop words removed from candidate phrases. Defaults to 'english'.
+    """
+
+    def __init__(self, embedder, spacy_pipeline="en_core_web_sm", cache_size: int = 20_000, stop_words="english"):
+        self.embedder = embedder
+        self.spacy_pipeline = spacy_pipeline
+        self.cache_size = cache_size
+        self.vectorizer = KeyphraseCountVectorizer(spacy_pipeline=spacy_pipeline, stop_words=stop_words)
+        self._phrase_cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._vectorizer_lock = threading.Lock()
+
+    def _embed_phrases(self, phrases: list[str]) -> dict:
+        """
+        Return normalized embeddings for the given phrases, encoding only the ones
+        missing from the cache.
+        """
+        found = {}
+        with self._lock:
+            for phrase in phrases:
+                if phrase in self._phrase_cache:
+                    self._phrase_cache.move_to_end(phrase)
+                    found[phrase] = self._phrase_cache[phrase]
+        missing = [phrase for phrase in phrases if phrase not in found]
+
+        if missing:
+            vectors = _normalize(self.embedder.encode(missing, show_progress_bar=False))
+            with self._lock:
+                for phrase, vector in zip(missing, vectors):
+                    found[phrase] = vector
+                    self._phrase_cache[phrase] = vector
+                    self._phrase_cache.move_to_end(phrase)
+                while len(self._phrase_cache) > self.cache_size:
+                    self._phrase_cache.popitem(last=False)
+        return found
+
+    def extract(self, queries: list[str], top_n: int = 5, threshold: float = 0.75):
+        """
+        Extract keyphrases for a batch of queries.
+
+        Parameters
+        ----------
+        queries : list[str]
+            The queries from which to extract keyphrases.
+        top_n : int, optional
+            The maximum number of keyphrases to return per query. Defaults to 5.
+        threshold : float, optional
+            Only keyphrases with a similarity to their query of at least this value
+            are returned. Defaults to 0.75.
+
+        Returns
+        -------
+        tuple[list[list[str]], np.ndarray]
+            The keyphrases of each query, best first, and the ``(len(queries), dim)``
+            array of query embeddings computed along the way.
+        """
+        if not queries:
+            return [], np.zeros((0, 0), dtype=np.float32)
+
+        query_embeddings = np.asarray(self.embedder.encode(queries, show_progress_bar=False), dtype=np.float32)
+
+        # One spaCy pass over the whole batch to find candidate phrases
+        try:
+            # Fitting replaces the vocabulary, so batches take turns
+            with self._vectorizer_lock:
+                doc_term = self.vectorizer.fit_transform(queries)
+                vocabulary = self.vectorizer.get_feature_names_out()
+        except ValueError:
+            # No candidate phrases in any of the queries
+            return [[] for _ in queries], query_embeddings
+
+        candidates = [[vocabulary[i] for i in row.nonzero()[1]] for row in doc_term]
+        phrase_vectors = self._embed_phrases(sorted({phrase for phrases in candidates for phrase in phrases}))
+
+        keywords = []
+        for query_vector, phrases in zip(_normalize(query_embeddings), candidates):
+            if not phrases:
+                keywords.append([])
+                continue
+            scores = np.stack([phrase_vectors[phrase] for phrase in phrases]) @ query_vector
+            ranked = sorted(zip(phrases, scores), key=lambda item: item[1], reverse=True)[:top_n]
+            keywords.append([phrase for phrase, score in ranked if score >= threshold])
+        return keywords, query_embeddings
+
+
+def _normalize(vectors) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
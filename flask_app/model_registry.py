@@ -0,0 +1,227 @@
+import copy
+import os
+import threading
+from time import time
+
+EMBEDDER_NAME = "all-MiniLM-L6-v2"
+SUMMARIZER_NAME = "sshleifer/distilbart-cnn-12-6"
+
+
+def current_rss_mb() -> float:
+    """
+    Returns the resident set size of this process in MB.
+
+    Reads /proc/self/statm where available and falls back to the peak RSS reported
+    by the resource module on other platforms.
+    """
+    try:
+        with open("/proc/self/statm", "r") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        import resource
+        import sys
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and in KB elsewhere
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class ModelRegistry:
+    """
+    Process-wide registry of lazily loaded models.
+
+    Each model is registered with a zero-argument loader and is loaded at most once,
+    on first use, no matter how many modules or threads ask for it. Load time and
+    the change in resident memory are recorded for every model. Shared services
+    (caches, schedulers) can be registered the same way, with ``model=False``, so
+    that they are created once but are not loaded by a default warm-up.
+    """
+
+    def __init__(self):
+        self._loaders = {}
+        self._models = {}
+        self._services = set()
+        self._stats = {}
+        self._locks = {}
+        self._background_loads = set()
+        self._registry_lock = threading.Lock()
+
+    def register(self, name: str, loader, model: bool = True) -> None:
+        """
+        Register a loader for a model. The loader is not called until the model is
+        first requested. With ``model=False`` the entry is a service, which
+        warm_up skips unless it is named.
+        """
+        if not callable(loader):
+            raise TypeError("loader must be callable")
+        with self._registry_lock:
+            self._loaders[name] = loader
+            self._locks.setdefault(name, threading.Lock())
+            if model:
+                self._services.discard(name)
+            else:
+                self._services.add(name)
+
+    def get(self, name: str):
+        """
+        Return the model registered under ``name``, loading it if needed.
+        """
+        # A loader may return None (e.g. a disabled cache): that result is kept too
+        if name in self._models:
+            return self._models[name]
+        if name not in self._loaders:
+            raise KeyError(f"No model registered under '{name}'")
+
+        with self._locks[name]:
+            # Another thread may have finished loading while we waited
+            if name in self._models:
+                return self._models[name]
+            rss_before = current_rss_mb()
+            start = time()
+            model = self._loaders[name]()
+            self._stats[name] = {
+                "load_seconds": round(time() - start, 3),
+                "rss_delta_mb": round(current_rss_mb() - rss_before, 1),
+            }
+            self._models[name] = model
+            return model
+
+    def peek(self, name: str):
+        """
+        Return the model registered under ``name`` if it is loaded, else None.
+        """
+        return self._models.get(name)
+
+    def load_in_background(self, name: str) -> None:
+        """
+        Start loading a model in a daemon thread, unless it is loaded or a background
+        load of it was already started. A failed load is not retried.
+        """
+        with self._registry_lock:
+            if name in self._models or name in self._background_loads:
+                return
+            self._background_loads.add(name)
+
+        def load():
+            try:
+                self.get(name)
+            except Exception as e:
+                print(f"Error loading {name}: {e}")
+
+        threading.Thread(target=load, name=f"load-{name}", daemon=True).start()
+
+    def warm_up(self, names: list[str] = None, background: bool = True):
+        """
+        Load the given models (all registered models, but no services, by default)
+        ahead of the first request.
+
+        Parameters
+        ----------
+        names : list[str], optional
+            The models or services to load, in order.
+        background : bool, optional
+            Load in a daemon thread and return it immediately. Defaults to True.
+
+        Returns
+        -------
+        threading.Thread or None
+            The warm-up thread when ``background`` is True.
+        """
+        names = [name for name in self._loaders if name not in self._services] if names is None else names
+
+        def load_all():
+            for name in names:
+                try:
+                    self.get(name)
+                except Exception as e:
+                    print(f"Error warming up {name}: {e}")
+
+        if not background:
+            load_all()
+            return None
+        thread = threading.Thread(target=load_all, name="model-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def stats(self) -> dict:
+        """
+        Return per-model load time and memory, and the current RSS of the process.
+        """
+        return {
+            "models": {
+                name: {"loaded": name in self._models, **self._stats.get(name, {})}
+                for name in self._loaders
+            },
+            "rss_mb": round(current_rss_mb(), 1),
+        }
+
+
+def _load_embedder():
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(EMBEDDER_NAME)
+
+def _load_summarizer_tokenizer():
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(SUMMARIZER_NAME)
+
+def _load_summarizer_model():
+    from transformers import AutoModelForSeq2SeqLM
+    return AutoModelForSeq2SeqLM.from_pretrained(SUMMARIZER_NAME)
+
+def _load_chunk_tokenizer():
+    from transformers import AutoTokenizer
+    # A separate instance: chunking runs in fetch threads while encoding changes the
+    # truncation settings of the embedder's own tokenizer
+    return AutoTokenizer.from_pretrained(f"sentence-transformers/{EMBEDDER_NAME}")
+
+def _load_spacy_pipeline():
+    import spacy
+    # Same components KeyphraseCountVectorizer excludes when it loads spaCy itself
+    exclude = ["parser", "attribute_ruler", "lemmatizer", "ner", "textcat"]
+    try:
+        return spacy.load("en_core_web_sm", exclude=exclude)
+    except OSError:
+        # Download the pipeline on first use, like KeyphraseCountVectorizer does
+        spacy.cli.download("en_core_web_sm")
+        return spacy.load("en_core_web_sm", exclude=exclude)
+
+def _load_keyphrase_engine():
+    from keyphrase_engine import KeyphraseEngine
+    # Reuse the sentence embedder instead of letting KeyBERT load its own copy
+    return KeyphraseEngine(registry.get("embedder"), registry.get("spacy_pipeline"))
+
+
+registry = ModelRegistry()
+registry.register("embedder", _load_embedder)
+registry.register("chunk_tokenizer", _load_chunk_tokenizer)
+registry.register("summarizer_tokenizer", _load_summarizer_tokenizer)
+registry.register("summarizer_model", _load_summarizer_model)
+registry.register("spacy_pipeline", _load_spacy_pipeline)
+registry.register("keyphrase_engine", _load_keyphrase_engine)
+
+def get_embedder():
+    """
+    Returns the shared sentence embedder.
+    """
+    return registry.get("embedder")
+
+# Per-thread copies of the summarization tokenizer
+_local = threading.local()
+
+def get_summarizer():
+    """
+    Returns the summarization tokenizer and the shared model. Each thread gets its own
+    copy of the tokenizer: a fast tokenizer changes its truncation and padding settings
+    on every call and fails with "Already borrowed" when two threads use it at once
+    (the turn's summary and the conversation summary run in parallel).
+    """
+    tokenizer = getattr(_local, "summarizer_tokenizer", None)
+    if tokenizer is None:
+        tokenizer = _local.summarizer_tokenizer = copy.deepcopy(registry.get("summarizer_tokenizer"))
+    return tokenizer, registry.get("summarizer_model")
+
+def get_keyphrase_engine():
+    """
+    Returns the shared keyphrase extraction engine.
+    """
+    return registry.get("keyphrase_engine")
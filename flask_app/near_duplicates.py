@@ -0,0 +1,189 @@
+import hashlib
+import os
+import re
+import threading
+
+import numpy as np
+
+# Estimated Jaccard similarity of word shingles above which a chunk is a near-duplicate
+NEAR_DUP_THRESHOLD = float(os.getenv("NEAR_DUP_THRESHOLD", "0.8"))
+# Words per shingle
+SHINGLE_SIZE = int(os.getenv("NEAR_DUP_SHINGLE_SIZE", "5"))
+# MinHash signature length and LSH bands; 16 bands of 4 rows find pairs above 0.8
+# similarity with probability > 0.999
+MINHASH_PERMUTATIONS = 64
+MINHASH_BANDS = 16
+
+_WORD = re.compile(r"\w+")
+_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = (1 << 32) - 1
+# Fixed seed: signatures and band keys must be the same in every process, since the
+# band keys are stored with the points
+_rng = np.random.RandomState(1)
+_A = _rng.randint(1, _MAX_HASH, size=MINHASH_PERMUTATIONS, dtype=np.uint64)
+_B = _rng.randint(0, _MAX_HASH, size=MINHASH_PERMUTATIONS, dtype=np.uint64)
+
+_stats = {"checked": 0, "dropped": 0}
+_stats_lock = threading.Lock()
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> set[str]:
+    """
+    Returns the set of lowercased word n-grams of text. A text shorter than size
+    words is a single shingle.
+    """
+    words = _WORD.findall(text.lower())
+    if len(words) <= size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def signature(text: str) -> np.ndarray:
+    """
+    Returns the MinHash signature of the shingles of text.
+
+    Returns
+    -------
+    np.ndarray
+        MINHASH_PERMUTATIONS unsigned integers.
+    """
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=4).digest(), "little") for shingle in shingles(text)),
+        dtype=np.uint64
+    )
+    if not len(hashes):
+        return np.full(MINHASH_PERMUTATIONS, _MAX_HASH, dtype=np.uint64)
+    # One universal hash per permutation, applied to all shingles at once
+    return (((hashes[:, None] * _A + _B) % _PRIME) & _MAX_HASH).min(axis=0)
+
+
+def band_keys(sig: np.ndarray) -> list[str]:
+    """
+    Returns the LSH bucket key of each band of a signature. Texts sharing a key are
+    candidate near-duplicates.
+    """
+    rows = MINHASH_PERMUTATIONS // MINHASH_BANDS
+    return [
+        f"{band}:{hashlib.blake2b(sig[band * rows:(band + 1) * rows].tobytes(), digest_size=8).hexdigest()}"
+        for band in range(MINHASH_BANDS)
+    ]
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """
+    Estimated Jaccard similarity of the texts of two signatures.
+    """
+    return float(np.mean(a == b))
+
+
+class NearDuplicateIndex:
+    """
+    In-memory MinHash LSH index. Texts are checked and added one at a time, so it can
+    filter a stream of chunks.
+
+    Parameters
+    ----------
+    threshold : float, optional
+        Estimated similarity at or above which a text is a near-duplicate. Defaults
+        to NEAR_DUP_THRESHOLD.
+    """
+
+    def __init__(self, threshold: float = NEAR_DUP_THRESHOLD):
+        if not 0 < threshold <= 1:
+            raise ValueError("threshold must be in (0, 1]")
+        self.threshold = threshold
+        self._signatures = []
+        self._buckets = {}
+
+    def add(self, sig: np.ndarray, keys: list[str] = None) -> None:
+        """
+        Adds a signature to the index.
+        """
+        self._signatures.append(sig)
+        for key in keys or band_keys(sig):
+            self._buckets.setdefault(key, []).append(len(self._signatures) - 1)
+
+    def find(self, sig: np.ndarray, keys: list[str] = None) -> int:
+        """
+        Returns the position (in order of addition) of the first signature in the
+        index that the given one is a near-duplicate of, or None.
+        """
+        candidates = sorted({i for key in keys or band_keys(sig) for i in self._buckets.get(key, ())})
+        return next((i for i in candidates if similarity(sig, self._signatures[i]) >= self.threshold), None)
+
+    def is_duplicate(self, sig: np.ndarray, keys: list[str] = None) -> bool:
+        """
+        Returns whether a signature is a near-duplicate of one in the index.
+        """
+        return self.find(sig, keys) is not None
+
+
+def match_near_duplicates(signatures: list[np.ndarray], existing: list[np.ndarray] = (), threshold: float = NEAR_DUP_THRESHOLD) -> list:
+    """
+    Returns, for each signature, what it is a near-duplicate of: an existing
+    signature or an earlier kept signature of the list.
+
+    Parameters
+    ----------
+    signatures : list[np.ndarray]
+        Signatures of the new texts, in order.
+    existing : list[np.ndarray], optional
+        Signatures of texts already stored.
+    threshold : float, optional
+        Similarity threshold. Defaults to NEAR_DUP_THRESHOLD.
+
+    Returns
+    -------
+    list[tuple[str, int] or None]
+        None for a text to keep, ("existing", i) for a duplicate of existing[i], or
+        ("new", i) for a duplicate of signatures[i].
+    """
+    index = NearDuplicateIndex(threshold)
+    for sig in existing:
+        index.add(sig)
+    # Position in the index -> what it refers to
+    entries = [("existing", i) for i in range(len(existing))]
+    matches = []
+    for i, sig in enumerate(signatures):
+        keys = band_keys(sig)
+        found = index.find(sig, keys)
+        if found is None:
+            index.add(sig, keys)
+            entries.append(("new", i))
+            matches.append(None)
+        else:
+            matches.append(entries[found])
+    with _stats_lock:
+        _stats["checked"] += len(signatures)
+        _stats["dropped"] += sum(match is not None for match in matches)
+    return matches
+
+
+def filter_near_duplicates(signatures: list[np.ndarray], existing: list[np.ndarray] = (), threshold: float = NEAR_DUP_THRESHOLD) -> list[int]:
+    """
+    Returns the indices of the signatures that are near-duplicates neither of an
+    earlier signature in the list nor of an existing one.
+
+    Parameters
+    ----------
+    signatures : list[np.ndarray]
+        Signatures of the new texts, in order.
+    existing : list[np.ndarray], optional
+        Signatures of texts already stored.
+    threshold : float, optional
+        Similarity threshold. Defaults to NEAR_DUP_THRESHOLD.
+
+    Returns
+    -------
+    list[int]
+        Indices of the texts to keep, in order.
+    """
+    return [i for i, match in enumerate(match_near_duplicates(signatures, existing, threshold)) if match is None]
+
+
+def stats() -> dict:
+    """
+    Returns the number of chunks checked and dropped as near-duplicates.
+    """
+    with _stats_lock:
+        return dict(_stats)
@@ -0,0 +1,131 @@
+import asyncio
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from time import time
+
+# Processes extracting PDF pages, and pages extracted per task
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(max(1, min(4, (os.cpu_count() or 2) - 1)))))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "8"))
+
+_pool = None
+_pool_lock = threading.Lock()
+_stats = {"files": 0, "pages": 0, "seconds": 0.0}
+_stats_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    """
+    Returns the process pool, starting it on first use. Workers are spawned rather
+    than forked, since the parent process runs threads and holds large models.
+
+    Spawned workers import the main module of the parent: run the app from serve.py,
+    whose top level has no side effects, rather than as ``python app.py``.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def _page_count(path: str) -> int:
+    import fitz  # PyMuPDF
+    with fitz.open(path) as doc:
+        return len(doc)
+
+
+def _extract_pages(path: str, start: int, end: int) -> list[str]:
+    """
+    Runs in a worker process: returns the text of pages start..end-1.
+    """
+    import fitz  # PyMuPDF
+    with fitz.open(path) as doc:
+        return [doc.load_page(i).get_text() for i in range(start, end)]
+
+
+def _imported_modules(names: list[str]) -> list[str]:
+    """
+    Runs in a worker process: returns the names among the given ones of the modules
+    it has imported.
+    """
+    import sys
+    return [name for name in names if name in sys.modules]
+
+
+def save_upload(file_obj, suffix: str = ".pdf") -> str:
+    """
+    Copies an uploaded file (Flask or Quart FileStorage) to a temporary file, in
+    blocks, and returns its path. The caller deletes it.
+    """
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
+        shutil.copyfileobj(file_obj.stream, tmp)
+        return tmp.name
+
+
+async def iter_pdf_pages(path: str, workers: int = PDF_WORKERS, pages_per_task: int = PDF_PAGES_PER_TASK):
+    """
+    Extracts the text of a PDF in a process pool and yields it page by page, in
+    order, as the pages become ready.
+
+    Page ranges are spread over the worker processes; at most two ranges per worker
+    are in flight, so memory stays bounded however long the document is.
+
+    Parameters
+    ----------
+    path : str
+        Path of the PDF file.
+    workers : int, optional
+        Ranges extracted in parallel. Defaults to PDF_WORKERS.
+    pages_per_task : int, optional
+        Pages per range. Defaults to PDF_PAGES_PER_TASK.
+
+    Yields
+    ------
+    tuple[int, int, str]
+        The 1-based page number, the page count and the text of the page.
+    """
+    start_time = time()
+    page_count = await asyncio.to_thread(_page_count, path)
+    pool = _get_pool()
+    pending = deque()
+    next_page = 0
+    extracted = 0
+
+    def submit():
+        nonlocal next_page
+        end = min(next_page + pages_per_task, page_count)
+        pending.append((next_page, asyncio.wrap_future(pool.submit(_extract_pages, path, next_page, end))))
+        next_page = end
+
+    try:
+        while next_page < page_count and len(pending) < 2 * workers:
+            submit()
+        while pending:
+            first, future = pending.popleft()
+            pages = await future
+            extracted += len(pages)
+            if next_page < page_count:
+                submit()
+            for i, text in enumerate(pages):
+                yield first + i + 1, page_count, text
+    finally:
+        for _, future in pending:
+            future.cancel()
+        with _stats_lock:
+            _stats["files"] += 1
+            _stats["pages"] += extracted
+            _stats["seconds"] += time() - start_time
+
+
+def stats() -> dict:
+    """
+    Returns the number of PDF files and pages extracted and the pages per second.
+    """
+    with _stats_lock:
+        seconds = _stats["seconds"]
+        return {**_stats, "pages_per_sec": round(_stats["pages"] / seconds, 1) if seconds else 0.0}
@@ -0,0 +1,94 @@
+import os
+from time import time
+
+from model_registry import registry
+
+# Optional cross-encoder rerank stage between retrieval and summarization
+RERANK = os.getenv("RERANK", "0") == "1"
+RERANKER_NAME = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+# Dense hits fetched for reranking, and how many of them are kept
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "40"))
+RERANK_TOP_N = int(os.getenv("RERANK_TOP_N", "8"))
+# Seconds the rerank stage may take; past it, the remaining candidates keep the dense order
+RERANK_TIME_BUDGET = float(os.getenv("RERANK_TIME_BUDGET", "1.5"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "16"))
+# Pairs in the first batch, scored before there is a time estimate (it includes warm-up)
+RERANK_FIRST_BATCH = int(os.getenv("RERANK_FIRST_BATCH", "4"))
+
+# Running estimate of the seconds it takes to score one pair
+_seconds_per_pair = None
+
+
+def _load_reranker():
+    from sentence_transformers import CrossEncoder
+    return CrossEncoder(RERANKER_NAME, max_length=512)
+
+
+# Only registered when enabled, so warm-up does not load an unused model
+if RERANK:
+    registry.register("reranker", _load_reranker)
+
+
+def rerank(query: str, documents: list[dict], top_n: int = RERANK_TOP_N,
+           time_budget: float = RERANK_TIME_BUDGET, batch_size: int = RERANK_BATCH_SIZE) -> list[dict]:
+    """
+    Reorders retrieved documents by cross-encoder relevance to the query and keeps
+    the best top_n.
+
+    Candidates are scored in batches, in their dense order, until the time budget is
+    spent: the scored ones are sorted by cross-encoder score and the rest follow in
+    dense order. Each batch is sized to fit in the remaining budget, going by the
+    time pairs took so far; the very first batch is small (RERANK_FIRST_BATCH), since
+    there is no estimate yet. The budget is best-effort: a batch slower than
+    estimated overruns it. While the model is not loaded yet (the first call starts
+    loading it in the background), the dense order is returned unchanged.
+
+    Parameters
+    ----------
+    query : str
+        The user query.
+    documents : list[dict]
+        The retrieved documents, best dense match first.
+    top_n : int, optional
+        The number of documents to keep. Defaults to RERANK_TOP_N.
+    time_budget : float, optional
+        Seconds the scoring may take. Defaults to RERANK_TIME_BUDGET.
+    batch_size : int, optional
+        Query-document pairs scored per batch. Defaults to RERANK_BATCH_SIZE.
+
+    Returns
+    -------
+    list[dict]
+        At most top_n documents.
+    """
+    if not isinstance(top_n, int) or top_n <= 0:
+        raise ValueError("top_n must be a positive integer")
+
+    model = registry.peek("reranker")
+    if model is None:
+        registry.load_in_background("reranker")
+        return documents[:top_n]
+
+    global _seconds_per_pair
+    start = time()
+    scores = []
+    while len(scores) < len(documents):
+        remaining = time_budget - (time() - start)
+        if remaining <= 0:
+            break
+        if _seconds_per_pair is None:
+            size = min(batch_size, RERANK_FIRST_BATCH)
+        else:
+            # Only the pairs expected to fit in the budget
+            size = min(batch_size, int(remaining / _seconds_per_pair))
+            if size == 0:
+                break
+        batch_start = time()
+        pairs = [(query, doc["text"]) for doc in documents[len(scores):len(scores) + size]]
+        scores.extend(float(score) for score in model.predict(pairs, batch_size=batch_size, show_progress_bar=False))
+        seconds = (time() - batch_start) / len(pairs)
+        _seconds_per_pair = seconds if _seconds_per_pair is None else 0.7 * _seconds_per_pair + 0.3 * seconds
+
+    scored = sorted(range(len(scores)), key=lambda j: scores[j], reverse=True)
+    order = scored + list(range(len(scores), len(documents)))
+    return [documents[j] for j in order[:top_n]]
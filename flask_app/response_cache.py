@@ -0,0 +1,203 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from time import time
+
+
+class ResponseCache:
+    """
+    Persistent cache for responses of external APIs (Wikipedia search and pages,
+    arXiv search results), stored as JSON in a SQLite file.
+
+    Every namespace has its own time-to-live. An entry younger than its TTL is
+    fresh; an entry older than that but still within ``stale_ttl`` is stale and is
+    served immediately while a background thread refreshes it
+    (stale-while-revalidate). Stale entries are also served when the refresh fails,
+    e.g. while the network is down. The total size of the stored values is capped,
+    least recently used entries go first.
+
+    Parameters
+    ----------
+    db_path : str
+        Path of the SQLite file.
+    ttls : dict, optional
+        Seconds before an entry of each namespace becomes stale.
+    default_ttl : float, optional
+        TTL for namespaces not in ``ttls``. Defaults to one day.
+    stale_ttl : float, optional
+        Extra seconds during which a stale entry may still be served. Defaults to
+        one week.
+    max_bytes : int, optional
+        Maximum total size of the stored values. Defaults to 512 MB.
+    """
+
+    def __init__(self, db_path: str, ttls: dict = None, default_ttl: float = 86_400,
+                 stale_ttl: float = 7 * 86_400, max_bytes: int = 512 * 1024 * 1024):
+        self.ttls = ttls or {}
+        self.default_ttl = default_ttl
+        self.stale_ttl = stale_ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._puts_since_trim = 0
+
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses "
+            "(key TEXT PRIMARY KEY, value TEXT, size INTEGER, stored_at REAL, last_used REAL)"
+        )
+        self._db.commit()
+
+    @staticmethod
+    def _key(namespace: str, key) -> str:
+        return f"{namespace}:{hashlib.sha1(json.dumps(key, sort_keys=True).encode('utf-8')).hexdigest()}"
+
+    def lookup(self, namespace: str, key):
+        """
+        Looks up a cached response.
+
+        Returns
+        -------
+        tuple or None
+            ``(value, fresh)`` where fresh is False for a stale entry, or None when
+            there is no usable entry.
+        """
+        db_key = self._key(namespace, key)
+        with self._lock:
+            row = self._db.execute("SELECT value, stored_at FROM responses WHERE key = ?", (db_key,)).fetchone()
+            if row is None:
+                return None
+            age = time() - row[1]
+            ttl = self.ttls.get(namespace, self.default_ttl)
+            if age > ttl + self.stale_ttl:
+                return None
+            self._db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time(), db_key))
+            self._db.commit()
+        return json.loads(row[0]), age <= ttl
+
+    def put(self, namespace: str, key, value) -> None:
+        """
+        Stores a JSON-serializable response.
+        """
+        db_key = self._key(namespace, key)
+        data = json.dumps(value)
+        now = time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, stored_at, last_used) VALUES (?, ?, ?, ?, ?)",
+                (db_key, data, len(data), now, now)
+            )
+            self._puts_since_trim += 1
+            if self._puts_since_trim >= 50:
+                self._trim()
+                self._puts_since_trim = 0
+            self._db.commit()
+
+    def _trim(self) -> None:
+        """
+        Deletes least recently used entries until the total size fits max_bytes.
+        """
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._db.execute("SELECT key, size FROM responses ORDER BY last_used ASC").fetchall()
+        doomed = []
+        for db_key, size in rows:
+            if total <= self.max_bytes:
+                break
+            doomed.append((db_key,))
+            total -= size
+        self._db.executemany("DELETE FROM responses WHERE key = ?", doomed)
+
+    def record_hit(self, fresh: bool = True) -> None:
+        """
+        Counts a lookup served from the cache, for callers that use lookup directly.
+        """
+        with self._lock:
+            if fresh:
+                self.hits += 1
+            else:
+                self.stale_hits += 1
+
+    def record_miss(self) -> None:
+        """
+        Counts a lookup that found no usable entry.
+        """
+        with self._lock:
+            self.misses += 1
+
+    def refresh_in_background(self, namespace: str, key, loader) -> None:
+        """
+        Reloads an entry in a daemon thread, unless a refresh of it is already running.
+        """
+        db_key = self._key(namespace, key)
+        with self._lock:
+            if db_key in self._refreshing:
+                return
+            self._refreshing.add(db_key)
+
+        def refresh():
+            try:
+                self.put(namespace, key, loader())
+            except Exception as e:
+                print(f"Error refreshing cached {namespace} response: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(db_key)
+
+        threading.Thread(target=refresh, name="cache-refresh", daemon=True).start()
+
+    def fetch(self, namespace: str, key, loader):
+        """
+        Returns the cached response for a key, calling ``loader`` on a miss.
+
+        Parameters
+        ----------
+        namespace : str
+            The kind of response, e.g. 'wiki_search'; selects the TTL.
+        key : Any
+            JSON-serializable request parameters.
+        loader : callable
+            Zero-argument function performing the request; its result must be
+            JSON-serializable.
+
+        Returns
+        -------
+        Any
+            The (possibly stale) response.
+        """
+        entry = self.lookup(namespace, key)
+        if entry is not None:
+            value, fresh = entry
+            self.record_hit(fresh)
+            if not fresh:
+                self.refresh_in_background(namespace, key, loader)
+            return value
+
+        self.record_miss()
+        value = loader()
+        self.put(namespace, key, value)
+        return value
+
+    def stats(self) -> dict:
+        """
+        Returns hit counters and the size of the cache.
+        """
+        with self._lock:
+            entries, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+            hits, stale_hits, misses = self.hits, self.stale_hits, self.misses
+        lookups = hits + stale_hits + misses
+        return {
+            "hits": hits,
+            "stale_hits": stale_hits,
+            "misses": misses,
+            "hit_rate": (hits + stale_hits) / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": size,
+        }
@@ -0,0 +1,111 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+class SemanticCache:
+    """
+    In-memory cache of chat turns keyed by the embedding of the question.
+
+    A question whose embedding has a cosine similarity of at least ``threshold`` with
+    a cached one, in one of the requested scopes, gets the cached value (retrieved
+    documents, summary, answer). Scopes separate sessions, or group sessions with the
+    same sources and topics. Every entry records the versions of the collections its
+    documents came from, and is only served while they are unchanged, so storing new
+    content invalidates it. Least recently used entries are dropped beyond
+    ``max_entries``.
+
+    Parameters
+    ----------
+    threshold : float, optional
+        Minimum cosine similarity for a hit. Defaults to 0.92.
+    max_entries : int, optional
+        Maximum number of entries. Defaults to 512.
+    """
+
+    def __init__(self, threshold: float = 0.92, max_entries: int = 512):
+        if not 0 < threshold <= 1:
+            raise ValueError("threshold must be in (0, 1]")
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, embedding, scopes: list, versions) -> dict:
+        """
+        Returns the value of the most similar valid entry in the given scopes, or None.
+
+        Parameters
+        ----------
+        embedding : array-like
+            The embedding of the question.
+        scopes : list
+            Hashable scope keys to search.
+        versions : callable
+            Function returning the current version of a collection name.
+
+        Returns
+        -------
+        dict
+            The cached value, or None on a miss.
+        """
+        query = self._normalize(embedding)
+        with self._lock:
+            best_id, best_score = None, self.threshold
+            for entry_id, entry in list(self._entries.items()):
+                if entry["scope"] not in scopes:
+                    continue
+                if any(versions(name) != version for name, version in entry["versions"].items()):
+                    # Content was stored or deleted since: the entry is stale
+                    del self._entries[entry_id]
+                    continue
+                score = float(np.dot(query, entry["embedding"]))
+                if score >= best_score:
+                    best_id, best_score = entry_id, score
+            if best_id is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(best_id)
+            return self._entries[best_id]["value"]
+
+    def put(self, embedding, scope, versions: dict, value: dict) -> None:
+        """
+        Caches a value under the embedding of its question.
+
+        Parameters
+        ----------
+        embedding : array-like
+            The embedding of the question.
+        scope
+            The hashable scope key.
+        versions : dict
+            The version of each collection the value depends on, read before it was
+            computed.
+        value : dict
+            The value to cache.
+        """
+        with self._lock:
+            self._entries[self._next_id] = {
+                "embedding": self._normalize(embedding), "scope": scope, "versions": dict(versions), "value": value
+            }
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        """
+        Returns the hit/miss counters and the number of entries.
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
@@ -0,0 +1,13 @@
+#
+#  Entry point of the Flask app: python serve.py
+#  CHAT_APP selects the backend: "app" (Gemini API, default) or "app2" (local Phi-3).
+#
+#  PDF pages are extracted in spawned worker processes, which import the main module
+#  of the parent. This module imports nothing else at the top level, so the workers
+#  start without loading the app, its vector store client or its models.
+#
+import importlib
+import os
+
+if __name__ == "__main__":
+    importlib.import_module(os.getenv("CHAT_APP", "app")).main()
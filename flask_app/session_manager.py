@@ -0,0 +1,215 @@
+import asyncio
+import inspect
+import os
+import re
+import secrets
+import threading
+from collections import OrderedDict
+from time import monotonic
+
+from async_runner import run_async
+
+# Name of the cookie (or X-Session-Token header) carrying the session ID
+SESSION_COOKIE = "rag_session"
+# Seconds of inactivity before a session and its collection are dropped
+SESSION_IDLE_TIMEOUT = float(os.getenv("SESSION_IDLE_TIMEOUT", "1800"))
+# Sessions kept at once; the least recently used one is evicted beyond that
+SESSION_MAX = int(os.getenv("SESSION_MAX", "32"))
+# Maximum number of points in one session's collection
+SESSION_MAX_POINTS = int(os.getenv("SESSION_MAX_POINTS", "20000"))
+
+# Session IDs end up in collection names, so only accept URL-safe tokens
+_VALID_ID = re.compile(r"^[A-Za-z0-9_-]{16,64}$")
+
+
+class Session:
+    """
+    The state of one user's chat session.
+
+    Attributes
+    ----------
+    id : str
+        The session ID, also the suffix of the session's Qdrant collection.
+    state : dict
+        The chat state (topics, context, key phrases, ...).
+    lock : threading.Lock
+        Held while a request reads or modifies the session, so concurrent requests
+        of the same user run one after the other. Async code uses ``acquire`` and
+        ``release`` instead.
+    last_used : float
+        Monotonic time of the last access.
+    """
+
+    def __init__(self, session_id: str, state: dict):
+        self.id = session_id
+        self.state = state
+        self.lock = threading.Lock()
+        self.last_used = monotonic()
+        self._async_lock = None
+
+    async def acquire(self) -> None:
+        """
+        Acquires the session's lock from async code without blocking the event loop:
+        requests wait in turn on an asyncio lock, and its holder takes the thread
+        lock, which is otherwise only held for an instant by the eviction check.
+        Release it with ``release()``.
+        """
+        if self._async_lock is None:
+            # Created on first use, on the loop serving the async requests
+            self._async_lock = asyncio.Lock()
+        await self._async_lock.acquire()
+        try:
+            self.lock.acquire()
+        except BaseException:
+            self._async_lock.release()
+            raise
+
+    def release(self) -> None:
+        """
+        Releases the lock taken with ``acquire``.
+        """
+        self.lock.release()
+        self._async_lock.release()
+
+
+class SessionManager:
+    """
+    Thread-safe registry of chat sessions.
+
+    Sessions idle for longer than ``idle_timeout`` are evicted, and so is the least
+    recently used one when more than ``max_sessions`` exist. Sessions in use (whose
+    lock is held, or for which ``busy`` returns True) are never evicted. ``on_evict``
+    is called with every evicted session, outside the registry lock, to free its
+    resources (e.g. delete its collection). A coroutine it returns is scheduled as a
+    task when the session was requested from a running event loop (the ASGI app),
+    and run on the shared loop otherwise.
+
+    Parameters
+    ----------
+    new_state : callable
+        Zero-argument function returning the state of a new session.
+    on_evict : callable, optional
+        Function or coroutine function called with each evicted Session.
+    busy : callable, optional
+        Function returning True for a Session with background work in progress.
+    idle_timeout : float, optional
+        Seconds of inactivity before a session is evicted. Defaults to SESSION_IDLE_TIMEOUT.
+    max_sessions : int, optional
+        Maximum number of sessions. Defaults to SESSION_MAX.
+    """
+
+    def __init__(self, new_state, on_evict=None, idle_timeout: float = SESSION_IDLE_TIMEOUT, max_sessions: int = SESSION_MAX, busy=None):
+        if max_sessions < 1:
+            raise ValueError("max_sessions must be at least 1")
+        self.new_state = new_state
+        self.on_evict = on_evict
+        self.busy = busy
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self.evictions = 0
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._tasks = set()
+
+    @staticmethod
+    def new_id() -> str:
+        """
+        Returns a new random session ID.
+        """
+        return secrets.token_urlsafe(16)
+
+    def get(self, session_id: str = None) -> tuple[Session, bool]:
+        """
+        Returns the session with the given ID, creating it if it does not exist
+        (or the ID is missing or malformed).
+
+        Returns
+        -------
+        tuple[Session, bool]
+            The session, and whether it was created by this call.
+        """
+        if not session_id or not _VALID_ID.match(session_id):
+            session_id = self.new_id()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            created = session is None
+            if created:
+                session = Session(session_id, self.new_state())
+                self._sessions[session_id] = session
+            session.last_used = monotonic()
+            self._sessions.move_to_end(session_id)
+            evicted = self._collect()
+        self._evict(evicted)
+        return session, created
+
+    def _collect(self) -> list[Session]:
+        """
+        Removes expired and surplus sessions from the registry and returns them.
+        Must be called with the registry lock held.
+        """
+        evicted = []
+        now = monotonic()
+        surplus = len(self._sessions) - self.max_sessions
+        # Oldest first, skipping the session just accessed and sessions with a request in flight
+        for session_id, session in list(self._sessions.items())[:-1]:
+            expired = now - session.last_used > self.idle_timeout
+            if not expired and surplus <= 0:
+                break
+            if not session.lock.acquire(blocking=False):
+                continue
+            session.lock.release()
+            if self.busy is not None and self.busy(session):
+                continue
+            del self._sessions[session_id]
+            evicted.append(session)
+            surplus -= 1
+        return evicted
+
+    def _evict(self, sessions: list[Session]) -> None:
+        for session in sessions:
+            self.evictions += 1
+            if self.on_evict is not None:
+                try:
+                    result = self.on_evict(session)
+                    if inspect.isawaitable(result):
+                        self.schedule(result, f"evicting session {session.id}")
+                except Exception as e:
+                    print(f"Error evicting session {session.id}: {e}")
+
+    def schedule(self, cleanup, label: str = "cleaning up") -> None:
+        """
+        Runs a cleanup coroutine: as a task when called from a running event loop (the
+        ASGI app), and on the shared loop otherwise. Errors are printed with the label.
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            try:
+                run_async(cleanup)
+            except Exception as e:
+                print(f"Error {label}: {e}")
+            return
+
+        def done(task):
+            self._tasks.discard(task)
+            if not task.cancelled() and task.exception() is not None:
+                print(f"Error {label}: {task.exception()}")
+
+        # Keep a reference until the task is done, so it is not garbage collected
+        task = loop.create_task(cleanup)
+        self._tasks.add(task)
+        task.add_done_callback(done)
+
+    def ids(self) -> list[str]:
+        """
+        Returns the IDs of the live sessions.
+        """
+        with self._lock:
+            return list(self._sessions)
+
+    def stats(self) -> dict:
+        """
+        Returns the number of live sessions and evictions so far.
+        """
+        with self._lock:
+            return {"sessions": len(self._sessions), "max_sessions": self.max_sessions, "evictions": self.evictions}
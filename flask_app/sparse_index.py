@@ -0,0 +1,90 @@
+import hashlib
+import os
+import re
+from collections import Counter
+
+# BM25 parameters; document lengths are normalized against a fixed average, since the
+# index grows incrementally and chunks have similar sizes
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+BM25_AVG_DOC_LEN = float(os.getenv("BM25_AVG_DOC_LEN", "256"))
+
+# Keeps arXiv IDs (2401.01234v2), version numbers and hyphenated terms in one token
+_TOKEN = re.compile(r"[a-z0-9]+(?:[.\-][a-z0-9]+)*")
+
+_STOPWORDS = frozenset("""
+a an and are as at be but by can do does for from has have how i if in into is it its
+me my no not of on or our so than that the their them then there these they this to
+was we what when where which who why will with you your
+""".split())
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Lowercases text and splits it into terms, dropping stopwords.
+    """
+    return [token for token in _TOKEN.findall(text.lower()) if token not in _STOPWORDS]
+
+
+def _term_index(term: str) -> int:
+    # Stable 32-bit term ID, the same in every process
+    return int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=4).digest(), "little")
+
+
+def _sparse(weights: dict) -> tuple[list[int], list[float]]:
+    # Merge the (rare) hash collisions
+    merged = {}
+    for term, weight in weights.items():
+        index = _term_index(term)
+        merged[index] = merged.get(index, 0.0) + weight
+    return list(merged), list(merged.values())
+
+
+def document_vector(text: str) -> tuple[list[int], list[float]]:
+    """
+    Returns the BM25 term weights of a document as a sparse vector. The IDF part is
+    applied by Qdrant at query time (Modifier.IDF), so documents can be indexed one
+    batch at a time.
+
+    Returns
+    -------
+    tuple[list[int], list[float]]
+        The term indices and their saturated, length-normalized frequencies.
+    """
+    counts = Counter(tokenize(text))
+    length = sum(counts.values())
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * length / BM25_AVG_DOC_LEN)
+    return _sparse({term: tf * (BM25_K1 + 1) / (tf + norm) for term, tf in counts.items()})
+
+
+def query_vector(text: str) -> tuple[list[int], list[float]]:
+    """
+    Returns the sparse vector of a query: weight 1 per distinct term.
+    """
+    return _sparse(dict.fromkeys(tokenize(text), 1.0))
+
+
+def rrf_fuse(rankings: list[list], weights: list[float], k: int = 60) -> list[tuple]:
+    """
+    Weighted reciprocal rank fusion: each item scores sum(weight / (k + rank)) over
+    the rankings it appears in.
+
+    Parameters
+    ----------
+    rankings : list[list]
+        Ranked lists of hashable items (best first).
+    weights : list[float]
+        The weight of each ranking.
+    k : int, optional
+        Damping constant. Defaults to 60.
+
+    Returns
+    -------
+    list[tuple]
+        (item, score) pairs, best first.
+    """
+    scores = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + weight / (k + rank)
+    return sorted(scores.items(), key=lambda pair: pair[1], reverse=True)
@@ -158,22 +158,26 @@ let uploaded = false;
     .then(response => response.json())
     .then(data => {
         if (data.success) {
-            uploadStatus.textContent = `Successfully uploaded and processed ${data.file_count} files.`;
+            uploadStatus.textContent = `Uploaded ${data.file_count} files, indexing...`;
             uploaded = true;
             
             // Display uploaded files
             const uploadedFiles = document.getElementById("uploaded-files");
             uploadedFiles.innerHTML = "<p><strong>Uploaded files:</strong></p>";
             const fileList = document.createElement("ul");
-            data.files.forEach(file => {
+            const items = data.files.map(file => {
                 const item = document.createElement("li");
                 item.textContent = file;
                 fileList.appendChild(item);
+                return item;
             });
             uploadedFiles.appendChild(fileList);
             
             // Clear the file input
             document.getElementById("file-upload").value = "";
+
+            // Poll the indexing progress; chat can already use the indexed chunks
+            pollUploadStatus(data.job_id, items, uploadStatus);
         } else {
             uploadStatus.textContent = `Error: ${data.error}`;
         }
@@ -183,6 +187,36 @@ let uploaded = false;
     });
 });
 
+function pollUploadStatus(jobId, items, uploadStatus) {
+    fetch(`/upload_status/${jobId}`)
+    .then(response => response.json())
+    .then(job => {
+        if (!job.files) {
+            uploadStatus.textContent = `Error: ${job.error}`;
+            return;
+        }
+        job.files.forEach((file, i) => {
+            let progress = file.status;
+            if (file.status === "indexing" && file.page_count) {
+                progress = `indexing, page ${file.pages}/${file.page_count}`;
+            } else if (file.status === "error") {
+                progress = `error: ${file.error}`;
+            }
+            items[i].textContent = `${file.name} (${progress}, ${file.chunks} chunks)`;
+        });
+        const finished = job.files.filter(file => file.status === "done").length;
+        if (job.done) {
+            uploadStatus.textContent = `Successfully uploaded and processed ${finished} of ${job.files.length} files.`;
+        } else {
+            uploadStatus.textContent = `Indexing files: ${finished}/${job.files.length} done...`;
+            setTimeout(() => pollUploadStatus(jobId, items, uploadStatus), 1000);
+        }
+    })
+    .catch(error => {
+        uploadStatus.textContent = `Upload status failed: ${error}`;
+    });
+}
+
 document.getElementById("reset-btn").addEventListener("click", function() {
   if (!confirm("Are you sure you want to reset the session?")) return;
   fetch("/shutdown", { method: "POST" })
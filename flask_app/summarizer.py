@@ -0,0 +1,321 @@
+import os
+from time import time
+
+from model_registry import registry, get_summarizer
+from summary_cache import SummaryCache, text_hash
+
+# Defaults for the chat pipeline; both can be overridden per call
+SUMMARY_MODE = os.getenv("SUMMARY_MODE", "beam")
+SUMMARY_TIME_BUDGET = float(os.getenv("SUMMARY_TIME_BUDGET", "20"))
+
+# In-memory summary cache with an optional SQLite tier ("" disables it)
+SUMMARY_CACHE_SIZE = int(os.getenv("SUMMARY_CACHE_SIZE", "2048"))
+SUMMARY_CACHE_DB = os.getenv("SUMMARY_CACHE_DB", os.path.join(".cache", "summaries.sqlite3"))
+registry.register("summary_cache", lambda: SummaryCache(SUMMARY_CACHE_SIZE, SUMMARY_CACHE_DB), model=False)
+
+# Maximum length of the running summary of a conversation's older turns
+MEMORY_SUMMARY_TOKENS = int(os.getenv("MEMORY_SUMMARY_TOKENS", "256"))
+
+
+def pack_groups(texts: list[str], lengths: list[int], max_tokens: int) -> list[str]:
+    """
+    Greedily packs texts, in order, into groups whose total token count stays within
+    max_tokens. A text longer than max_tokens gets a group of its own (and is
+    truncated by the tokenizer later).
+
+    Parameters
+    ----------
+    texts : list[str]
+        The texts to pack.
+    lengths : list[int]
+        The token count of each text.
+    max_tokens : int
+        The maximum number of tokens per group.
+
+    Returns
+    -------
+    list[str]
+        The groups, each one the newline-joined texts it contains.
+    """
+    groups = []
+    current, current_len = [], 0
+    for text, length in zip(texts, lengths):
+        if current and current_len + length > max_tokens:
+            groups.append("\n".join(current))
+            current, current_len = [], 0
+        current.append(text)
+        current_len += length
+    if current:
+        groups.append("\n".join(current))
+    return groups
+
+
+def _generate(texts: list[str], max_input_tokens: int, max_output_tokens: int, num_beams: int, max_time: float = None) -> list[str]:
+    """
+    Summarizes a list of texts as one padded batch.
+    """
+    import torch
+
+    tokenizer, model = get_summarizer()
+    inputs = tokenizer(
+        texts,
+        return_tensors="pt",
+        max_length=max_input_tokens,
+        truncation=True,
+        padding="longest"
+    )
+    with torch.inference_mode():
+        summary_ids = model.generate(
+            inputs["input_ids"],
+            attention_mask=inputs["attention_mask"],
+            num_beams=num_beams,
+            max_length=max_output_tokens,
+            early_stopping=num_beams > 1,
+            max_time=max_time
+        )
+    return tokenizer.batch_decode(summary_ids, skip_special_tokens=True)
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    """
+    Extractive fallback: the first max_tokens tokens of the text.
+    """
+    tokenizer, _ = get_summarizer()
+    ids = tokenizer(text, add_special_tokens=False, max_length=max_tokens, truncation=True)["input_ids"]
+    return tokenizer.decode(ids, skip_special_tokens=True)
+
+
+def summarize_groups(
+    groups: list[str],
+    max_input_tokens: int = 1024,
+    max_output_tokens: int = 142,
+    mode: str = SUMMARY_MODE,
+    num_beams: int = 4,
+    batch_size: int = 8,
+    deadline: float = None,
+    kind: str = "partial"
+) -> tuple[list[str], bool]:
+    """
+    Summarizes each group in padded batches (the map step), reusing cached summaries.
+
+    Beam search is used while the deadline allows it; once the remaining time is less
+    than the last batch took, the rest is generated greedily, and once the deadline
+    has passed the remaining groups are truncated instead of summarized. A batch that
+    runs into the deadline is stopped by generate, possibly mid-sentence. Only
+    summaries produced with the requested settings and not cut short are cached.
+
+    Parameters
+    ----------
+    groups : list[str]
+        The texts to summarize.
+    max_input_tokens : int, optional
+        Input tokens per group; longer groups are truncated. Defaults to 1024.
+    max_output_tokens : int, optional
+        Maximum length of each summary. Defaults to 142.
+    mode : str, optional
+        'beam' or 'greedy'. Defaults to SUMMARY_MODE.
+    num_beams : int, optional
+        Number of beams in 'beam' mode. Defaults to 4.
+    batch_size : int, optional
+        Number of groups per generate call. Defaults to 8.
+    deadline : float, optional
+        Absolute time (as returned by time.time) by which to finish.
+    kind : str, optional
+        Label of these summaries in the cache statistics. Defaults to 'partial'.
+
+    Returns
+    -------
+    tuple[list[str], bool]
+        One summary per group, and whether all of them were generated with the
+        requested settings (False when the deadline forced a fallback or cut a
+        batch short).
+    """
+    if mode not in ("beam", "greedy"):
+        raise ValueError("mode must be 'beam' or 'greedy'")
+
+    beams = num_beams if mode == "beam" else 1
+    cache = registry.get("summary_cache")
+    settings = {"max_input_tokens": max_input_tokens, "max_output_tokens": max_output_tokens, "num_beams": beams}
+    keys = [cache.make_key(kind, [text_hash(text)], settings) for text in groups]
+    summaries = [cache.get(key) for key in keys]
+    missing = [i for i, summary in enumerate(summaries) if summary is None]
+
+    complete = True
+    last_batch_seconds = 0.0
+    for i in range(0, len(missing), batch_size):
+        batch = missing[i:i + batch_size]
+        remaining = None if deadline is None else deadline - time()
+        if remaining is not None and remaining <= 0:
+            # Out of time: keep the leading text of each remaining group
+            for j in batch:
+                summaries[j] = _truncate(groups[j], max_output_tokens)
+            complete = False
+            continue
+        batch_beams = beams
+        if remaining is not None and beams > 1 and remaining < last_batch_seconds:
+            batch_beams = 1
+            complete = False
+
+        start = time()
+        generated = _generate([groups[j] for j in batch], max_input_tokens, max_output_tokens, batch_beams, max_time=remaining)
+        last_batch_seconds = time() - start
+        # generate stops at max_time without finishing the beams
+        timed_out = remaining is not None and last_batch_seconds >= remaining
+        if timed_out:
+            complete = False
+        for j, summary in zip(batch, generated):
+            summaries[j] = summary
+            if batch_beams == beams and not timed_out:
+                cache.put(keys[j], summary, last_batch_seconds / len(batch))
+    return summaries, complete
+
+
+def summarize_documents(
+    documents: list[dict],
+    max_input_tokens: int = 1024,
+    max_output_tokens: int = 512,
+    map_output_tokens: int = 142,
+    mode: str = SUMMARY_MODE,
+    num_beams: int = 4,
+    batch_size: int = 8,
+    time_budget: float = SUMMARY_TIME_BUDGET,
+    max_levels: int = 3
+) -> str:
+    """
+    Summarizes a list of retrieved documents with a map-reduce pass, so that all of
+    them contribute to the summary instead of only the first max_input_tokens tokens.
+
+    If the documents fit into one model input they are summarized in a single pass.
+    Otherwise every document longer than map_output_tokens is first summarized on
+    its own (short ones are kept verbatim), the partial summaries are packed into
+    groups that fit the model's input and summarized again, until a single final
+    pass is left. Per-document partial summaries and the final summary are cached,
+    so a turn whose retrieved set only partly changed only summarizes the new
+    documents.
+
+    Parameters
+    ----------
+    documents : list[dict]
+        The retrieved documents, each with "title" and "text" keys, best first.
+    max_input_tokens : int, optional
+        The maximum number of input tokens per generate call. Defaults to 1024.
+    max_output_tokens : int, optional
+        The maximum length of the final summary. Defaults to 512.
+    map_output_tokens : int, optional
+        The maximum length of each partial summary. Defaults to 142.
+    mode : str, optional
+        'beam' or 'greedy' decoding. Defaults to SUMMARY_MODE.
+    num_beams : int, optional
+        Number of beams in 'beam' mode. Defaults to 4.
+    batch_size : int, optional
+        Number of groups per generate call. Defaults to 8.
+    time_budget : float, optional
+        Seconds available for the whole summary; None for no limit. Defaults to
+        SUMMARY_TIME_BUDGET. When it runs out, decoding degrades to greedy, then to
+        truncation, and the partial summaries are returned without a reduce step.
+    max_levels : int, optional
+        The maximum number of reduce levels. Defaults to 3.
+
+    Returns
+    -------
+    str
+        The summary of the documents.
+    """
+    if not isinstance(documents, list):
+        raise TypeError("Documents must be a list of dictionaries")
+    if not documents:
+        return ""
+
+    tokenizer, _ = get_summarizer()
+    cache = registry.get("summary_cache")
+    deadline = None if time_budget is None else time() + time_budget
+    settings = dict(max_input_tokens=max_input_tokens, mode=mode, num_beams=num_beams, batch_size=batch_size, deadline=deadline)
+
+    texts = [f"{doc['title']}\n{doc['text']}" for doc in documents]
+    final_key = cache.make_key("final", sorted(text_hash(text) for text in texts), {
+        "max_input_tokens": max_input_tokens, "max_output_tokens": max_output_tokens,
+        "map_output_tokens": map_output_tokens, "mode": mode, "num_beams": num_beams,
+    })
+    summary = cache.get(final_key)
+    if summary is not None:
+        return summary
+
+    start = time()
+    complete = True
+    lengths = [len(ids) for ids in tokenizer(texts, add_special_tokens=False)["input_ids"]]
+    if sum(lengths) > max_input_tokens - 2:
+        # Map: summarize each long document on its own, so partial summaries can be reused
+        long_docs = [i for i, length in enumerate(lengths) if length > map_output_tokens]
+        partials, complete = summarize_groups([texts[i] for i in long_docs], max_output_tokens=map_output_tokens, **settings)
+        for i, partial in zip(long_docs, partials):
+            texts[i] = partial
+
+        for _ in range(max_levels):
+            if deadline is not None and time() >= deadline:
+                # No time left for a reduce step: the partial summaries are the answer
+                return "\n".join(texts)
+            lengths = [len(ids) for ids in tokenizer(texts, add_special_tokens=False)["input_ids"]]
+            groups = pack_groups(texts, lengths, max_input_tokens - 2)
+            if len(groups) == 1:
+                break
+            texts, level_complete = summarize_groups(groups, max_output_tokens=map_output_tokens, **settings)
+            complete = complete and level_complete
+
+    # Reduce: one final pass over whatever is left
+    [summary], final_complete = summarize_groups(["\n".join(texts)], max_output_tokens=max_output_tokens, kind="reduce", **settings)
+    if complete and final_complete:
+        cache.put(final_key, summary, time() - start)
+    return summary
+
+
+def summarize_conversation(
+    summary: str,
+    turns: list[str],
+    max_input_tokens: int = 1024,
+    max_output_tokens: int = MEMORY_SUMMARY_TOKENS,
+    mode: str = SUMMARY_MODE
+) -> str:
+    """
+    Folds conversation turns into the running summary of a conversation. Turns that
+    do not fit next to the summary in one model input are first summarized on their
+    own; then the summary and the turns are summarized together. Meant to run in the
+    background, so there is no time budget.
+
+    Parameters
+    ----------
+    summary : str
+        The running summary so far ("" for none).
+    turns : list[str]
+        The turns to fold in, oldest first, as plain text.
+    max_input_tokens : int, optional
+        The maximum number of input tokens per generate call. Defaults to 1024.
+    max_output_tokens : int, optional
+        The maximum length of the summary. Defaults to MEMORY_SUMMARY_TOKENS.
+    mode : str, optional
+        'beam' or 'greedy' decoding. Defaults to SUMMARY_MODE.
+
+    Returns
+    -------
+    str
+        The updated summary.
+    """
+    if not turns:
+        return summary
+
+    tokenizer, _ = get_summarizer()
+    texts = list(turns)
+    lengths = [len(ids) for ids in tokenizer([summary, *texts], add_special_tokens=False)["input_ids"]]
+    if sum(lengths) > max_input_tokens - 2:
+        long_turns = [i for i, length in enumerate(lengths[1:]) if length > max_output_tokens]
+        partials, _ = summarize_groups(
+            [texts[i] for i in long_turns], max_input_tokens=max_input_tokens,
+            max_output_tokens=max_output_tokens, mode=mode, kind="memory_turn"
+        )
+        for i, partial in zip(long_turns, partials):
+            texts[i] = partial
+
+    [summary], _ = summarize_groups(
+        ["\n".join([summary, *texts]).strip()], max_input_tokens=max_input_tokens,
+        max_output_tokens=max_output_tokens, mode=mode, kind="memory"
+    )
+    return summary
@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from time import time
+
+
+def text_hash(text: str) -> str:
+    """
+    Returns the sha1 hex digest of a text.
+    """
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class SummaryCache:
+    """
+    Two-tier cache of generated summaries.
+
+    Entries live in an in-memory LRU dict and, when ``db_path`` is given, in a SQLite
+    file as well, so that summaries survive restarts. Each entry remembers how long
+    it took to generate, which lets the cache report the generation time it saved.
+
+    Parameters
+    ----------
+    max_entries : int, optional
+        Maximum number of summaries kept in memory. Defaults to 2048.
+    db_path : str, optional
+        Path of the SQLite file for the on-disk tier. Disabled when empty or None.
+    max_disk_entries : int, optional
+        Maximum number of summaries kept on disk. Defaults to 50000.
+    """
+
+    def __init__(self, max_entries: int = 2048, db_path: str = None, max_disk_entries: int = 50_000):
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._db = None
+        self._puts_since_trim = 0
+
+        if db_path:
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS summaries "
+                "(key TEXT PRIMARY KEY, summary TEXT, seconds REAL, last_used REAL)"
+            )
+            self._db.commit()
+
+    @staticmethod
+    def make_key(kind: str, hashes: list[str], settings: dict) -> str:
+        """
+        Builds a cache key from the kind of summary, the content hashes it covers and
+        the summarizer settings that produced it.
+        """
+        payload = json.dumps([kind, hashes, settings], sort_keys=True)
+        return f"{kind}:{text_hash(payload)}"
+
+    def _count(self, kind: str, hit: bool, seconds: float = 0.0) -> None:
+        counter = self._counters.setdefault(kind, {"hits": 0, "misses": 0, "seconds_saved": 0.0})
+        if hit:
+            counter["hits"] += 1
+            counter["seconds_saved"] += seconds
+        else:
+            counter["misses"] += 1
+
+    def get(self, key: str):
+        """
+        Returns the cached summary for a key, or None on a miss.
+        """
+        kind = key.split(":", 1)[0]
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None and self._db is not None:
+                row = self._db.execute("SELECT summary, seconds FROM summaries WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    entry = (row[0], row[1])
+                    self._db.execute("UPDATE summaries SET last_used = ? WHERE key = ?", (time(), key))
+                    self._db.commit()
+                    self._remember(key, entry)
+            if entry is None:
+                self._count(kind, hit=False)
+                return None
+            self._memory.move_to_end(key)
+            self._count(kind, hit=True, seconds=entry[1])
+            return entry[0]
+
+    def _remember(self, key: str, entry: tuple) -> None:
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def put(self, key: str, summary: str, seconds: float) -> None:
+        """
+        Stores a summary together with the time it took to generate.
+        """
+        with self._lock:
+            self._remember(key, (summary, seconds))
+            if self._db is None:
+                return
+            self._db.execute(
+                "INSERT OR REPLACE INTO summaries (key, summary, seconds, last_used) VALUES (?, ?, ?, ?)",
+                (key, summary, seconds, time())
+            )
+            self._puts_since_trim += 1
+            if self._puts_since_trim >= 100:
+                # Drop the least recently used rows beyond the disk cap
+                self._db.execute(
+                    "DELETE FROM summaries WHERE key IN "
+                    "(SELECT key FROM summaries ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    (self.max_disk_entries,)
+                )
+                self._puts_since_trim = 0
+            self._db.commit()
+
+    def stats(self) -> dict:
+        """
+        Returns hit rate and generation time saved, per kind of summary.
+        """
+        with self._lock:
+            stats = {}
+            for kind, counter in self._counters.items():
+                lookups = counter["hits"] + counter["misses"]
+                stats[kind] = {
+                    **counter,
+                    "seconds_saved": round(counter["seconds_saved"], 3),
+                    "hit_rate": counter["hits"] / lookups if lookups else 0.0,
+                }
+            stats["memory_entries"] = len(self._memory)
+            return stats
@@ -1,9 +1,14 @@
 from Helper4 import *
+from transformers import AutoTokenizer
 import pytest
+import threading
 
-# Load the model and tokenizer for summary generation
+# The tokenizer of the summarization model, loaded by the tests that need it
 model_name = "sshleifer/distilbart-cnn-12-6"
-tokenizer = AutoTokenizer.from_pretrained(model_name)
+
+@pytest.fixture(scope="module")
+def tokenizer():
+    return AutoTokenizer.from_pretrained(model_name)
 
 def test_keyword_extraction():
     query = "Who is the CEO of DeepSeek? What does DeepSeek do? And when was it founded?"
@@ -58,7 +63,7 @@ def test_arxiv_no_result():
     papers = get_arxiv_paper_sync(subject="Computer Science", subtopic="Artificial Intelligence", query=query, max_results=3)
     assert papers == []
 
-def test_summarize_function():
+def test_summarize_function(tokenizer):
     assert isinstance(summarize("This is a test string"), str)
     pytest.raises(TypeError, match="Input text must be a string.")
 
@@ -112,6 +117,33 @@ def test_summarize_function():
     assert isinstance(summarize(text), str)
     assert len(tokenizer.encode(summarize(text))) <= 512
 
+def test_keyphrase_engine_reuses_models(monkeypatch):
+    import numpy as np
+    import spacy
+    from keyphrase_engine import KeyphraseEngine
+    # Blank pipeline tagging a few known nouns, so no spaCy model is needed
+    nlp = spacy.blank("en")
+    ruler = nlp.add_pipe("attribute_ruler")
+    ruler.add([[{"IS_ALPHA": False}]], {"TAG": "."})
+    ruler.add([[{"IS_ALPHA": True}]], {"TAG": "DT"})
+    ruler.add([[{"LOWER": {"IN": ["rlhf", "graph", "networks"]}}]], {"TAG": "NN"})
+    monkeypatch.setattr(spacy, "load", lambda *args, **kwargs: pytest.fail("spaCy pipeline reloaded"))
+
+    class StubEmbedder:
+        calls = []
+        def encode(self, texts, show_progress_bar=False):
+            self.calls.append(list(texts))
+            return np.ones((len(texts), 4), dtype=np.float32)
+
+    embedder = StubEmbedder()
+    engine = KeyphraseEngine(embedder, nlp, stop_words=["what", "is"])
+    vectorizer = engine.vectorizer
+    assert engine.extract(["What is RLHF?", "graph networks"], threshold=0.0)[0] == [["rlhf"], ["graph networks"]]
+    assert engine.extract(["graph networks"], threshold=0.0)[0] == [["graph networks"]]
+    assert engine.vectorizer is vectorizer and vectorizer.spacy_pipeline is nlp
+    # The second call only encodes its query: the phrase embedding is cached
+    assert embedder.calls[2:] == [["graph networks"]]
+
 def test_remove_duplicate_dicts():
     assert remove_duplicate_dicts([{"a": 1, "b": 2}, {"a": 1, "b": 2}, {"c": 3, "d": 4}]) == [{"a": 1, "b": 2}, {"c": 3, "d": 4}]
     pytest.raises(TypeError, remove_duplicate_dicts, [{"a": 1, "b": 2}, "not a dict", {"c": 3, "d": 4}])
@@ -119,3 +151,574 @@ def test_remove_duplicate_dicts():
 
 
 
+
+def test_embedding_cache(tmp_path):
+    from embedding_cache import EmbeddingCache
+
+    class CountingEmbedder:
+        calls = 0
+        def encode(self, texts, batch_size=128, show_progress_bar=False):
+            self.calls += len(texts)
+            return [[float(len(t)), 1.0, 0.0] for t in texts]
+
+    fake = CountingEmbedder()
+    cache = EmbeddingCache(str(tmp_path), "fake-model", 3, max_entries=2)
+    first = cache.encode(fake, ["a", "bb", "a"])
+    assert first.shape == (3, 3)
+    assert fake.calls == 2
+    cache.encode(fake, ["bb"])
+    assert fake.calls == 2
+    assert cache.stats()["hits"] >= 1
+
+    # The index is written on a timer or on close, not on every call
+    import sqlite3
+    index = sqlite3.connect(str(tmp_path / "index.sqlite3"))
+    assert index.execute("SELECT COUNT(*) FROM entries").fetchone() == (0,)
+
+    # Reopening the cache keeps the vectors, and the LRU entry is evicted when full
+    cache.close()
+    assert index.execute("SELECT COUNT(*) FROM entries").fetchone() == (2,)
+    reopened = EmbeddingCache(str(tmp_path), "fake-model", 3, max_entries=2)
+    reopened.encode(fake, ["bb", "ccc"])
+    assert fake.calls == 3
+    assert reopened.stats()["evictions"] == 1
+
+def test_make_point_id():
+    first = make_point_id("http://arxiv.org/abs/1706.03762v7", "Attention Is All You Need")
+    assert first == make_point_id("http://arxiv.org/abs/1706.03762v7", "Attention Is All You Need")
+    assert first != make_point_id("http://arxiv.org/abs/1706.03762v7", "Another chunk")
+    assert str(uuid.UUID(first)) == first
+
+def test_pack_groups():
+    from summarizer import pack_groups
+    groups = pack_groups(["a", "b", "c", "d"], [400, 500, 300, 2000], max_tokens=1000)
+    assert groups == ["a\nb", "c", "d"]
+    assert pack_groups([], [], max_tokens=1000) == []
+
+def test_summarize_documents():
+    from summarizer import summarize_documents
+    docs = [{"title": f"Doc {i}", "text": "Python is a high-level programming language. " * 80} for i in range(4)]
+    summary = summarize_documents(docs, max_output_tokens=256, mode="greedy", time_budget=120.0)
+    assert isinstance(summary, str) and len(summary) > 0
+    assert summarize_documents([]) == ""
+
+def test_time_truncated_summary_not_cached(monkeypatch):
+    import time
+    import summarizer
+    from model_registry import ModelRegistry
+    from summary_cache import SummaryCache, text_hash
+
+    def slow_generate(texts, max_input_tokens, max_output_tokens, num_beams, max_time=None):
+        if max_time is not None:
+            time.sleep(max_time)
+        return ["cut short" for _ in texts]
+
+    models = ModelRegistry()
+    models.register("summary_cache", lambda: SummaryCache(max_entries=8))
+    monkeypatch.setattr(summarizer, "registry", models)
+    monkeypatch.setattr(summarizer, "_generate", slow_generate)
+    cache = models.get("summary_cache")
+    key = cache.make_key("partial", [text_hash("text")], {"max_input_tokens": 1024, "max_output_tokens": 142, "num_beams": 1})
+
+    summaries, complete = summarizer.summarize_groups(["text"], mode="greedy", deadline=time.time() + 0.05)
+    assert summaries == ["cut short"] and not complete
+    assert cache.get(key) is None
+
+    summaries, complete = summarizer.summarize_groups(["text"], mode="greedy")
+    assert complete and cache.get(key) == "cut short"
+
+def test_model_registry_warm_up_skips_services():
+    from model_registry import ModelRegistry
+    calls = []
+    models = ModelRegistry()
+    models.register("model", lambda: calls.append("model") or "model")
+    models.register("disabled_cache", lambda: calls.append("disabled_cache"), model=False)
+    models.warm_up(background=False)
+    assert calls == ["model"]
+    # A None result is loaded once, like any other
+    assert models.get("disabled_cache") is None and models.get("disabled_cache") is None
+    assert calls == ["model", "disabled_cache"]
+
+def test_summarizer_tokenizer_per_thread(monkeypatch):
+    import model_registry
+    from model_registry import ModelRegistry, get_summarizer
+    models = ModelRegistry()
+    models.register("summarizer_tokenizer", lambda: {"truncation": None})
+    models.register("summarizer_model", object)
+    monkeypatch.setattr(model_registry, "registry", models)
+    results = []
+    def summarize():
+        results.append((get_summarizer(), get_summarizer()))
+    threads = [threading.Thread(target=summarize) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    (first, again), (second, _) = results
+    assert first[0] is again[0] and first[0] is not second[0] and first[1] is second[1]
+
+def test_summary_cache(tmp_path):
+    from summary_cache import SummaryCache
+    cache = SummaryCache(max_entries=1, db_path=str(tmp_path / "summaries.sqlite3"))
+    key = SummaryCache.make_key("final", ["a", "b"], {"num_beams": 4})
+    assert cache.get(key) is None
+    cache.put(key, "summary", 2.0)
+    cache.put(SummaryCache.make_key("final", ["c"], {"num_beams": 4}), "other", 1.0)
+    # Evicted from memory but still on disk
+    assert cache.get(key) == "summary"
+    assert cache.stats()["final"]["seconds_saved"] == 2.0
+
+def test_response_cache(tmp_path):
+    from response_cache import ResponseCache
+    cache = ResponseCache(str(tmp_path / "responses.sqlite3"), {"wiki_search": 3600})
+    calls = []
+    def load():
+        calls.append(1)
+        return ["DeepSeek", "Liang Wenfeng"]
+    assert cache.fetch("wiki_search", ["deepseek", 10], load) == ["DeepSeek", "Liang Wenfeng"]
+    assert cache.fetch("wiki_search", ["deepseek", 10], load) == ["DeepSeek", "Liang Wenfeng"]
+    assert len(calls) == 1
+    assert cache.stats()["hits"] == 1
+
+def test_arxiv_scheduler_priority():
+    from arxiv_scheduler import ArxivScheduler
+    scheduler = ArxivScheduler(rate=100.0, burst=1, workers=1)
+    order = []
+    gate = threading.Event()
+    blocker = scheduler.submit(lambda client: gate.wait(5))
+    background = scheduler.submit(lambda client: order.append("background"), background=True)
+    foreground = scheduler.submit(lambda client: order.append("foreground"))
+    gate.set()
+    blocker.result(); background.result(); foreground.result()
+    assert order == ["foreground", "background"]
+
+def test_arxiv_scheduler_token_per_page(monkeypatch):
+    import arxiv
+    from arxiv_scheduler import ArxivScheduler
+    scheduler = ArxivScheduler(rate=100.0, burst=1, workers=2, page_size=100)
+    pages, tokens = [], []
+    acquire = scheduler.bucket.acquire
+    monkeypatch.setattr(scheduler.bucket, "acquire", lambda: tokens.append(1) or acquire())
+    # 230 results exist: pages of 100, 100 and 30
+    monkeypatch.setattr(ArxivScheduler, "_page", staticmethod(
+        lambda client, search, offset, size: pages.append(offset) or list(range(offset, min(offset + size, 230)))
+    ))
+    assert scheduler.search(arxiv.Search(query="abs:transformer", max_results=250)) == list(range(230))
+    assert pages == [0, 100, 200] and len(tokens) == 3
+    assert len(scheduler.search(arxiv.Search(query="abs:transformer", max_results=150))) == 150
+    assert pages[3:] == [0, 100] and len(tokens) == 5
+
+def test_arxiv_scheduler_retries_only_transient_errors():
+    import arxiv
+    from arxiv_scheduler import ArxivScheduler
+    scheduler = ArxivScheduler(rate=100.0, burst=1, workers=1, max_retries=2, backoff=0.0)
+    def failing(status):
+        calls = []
+        def fn(client):
+            calls.append(1)
+            raise arxiv.HTTPError("https://export.arxiv.org/api/query", 0, status)
+        return fn, calls
+    for status, attempts in ((400, 1), (503, 3)):
+        fn, calls = failing(status)
+        with pytest.raises(arxiv.HTTPError):
+            scheduler.run(fn)
+        assert len(calls) == attempts
+    assert scheduler.stats()["requests"] == 4 and scheduler.stats()["retries"] == 2
+
+def test_arxiv_query_planner():
+    from arxiv_planner import build_query, plan_queries, assign_results
+    assert build_query(["neural network", "transformer"], "cat:cs.AI") == 'cat:cs.AI AND (abs:"neural network" OR abs:transformer)'
+    assert plan_queries(["x", "y", "z"], max_terms=2) == [["x", "y"], ["z"]]
+    # A question typed by the user is neither an exact phrase nor punctuation
+    assert build_query(["What is RLHF?"], "cat:cs.AI") == "cat:cs.AI AND abs:RLHF"
+    assert build_query(["How do transformers handle very long context windows?"], "cat:cs.AI") == \
+        "cat:cs.AI AND (abs:transformers AND abs:handle AND abs:very AND abs:long AND abs:context AND abs:windows)"
+    assert build_query(["neural network", "What is RLHF?"]) == "((all:neural AND all:network) OR all:RLHF)"
+    assert plan_queries(["?", "the"]) == []
+    papers = [{"id": "1", "text": "A graph neural network"}, {"id": "2", "text": "Transformer models"}]
+    assigned = assign_results(papers, ["neural network", "transformer"], max_results=5)
+    assert [p["id"] for p in assigned["neural network"]] == ["1"]
+    assert [p["id"] for p in assigned["transformer"]] == ["2"]
+
+def test_wiki_pages_sections(monkeypatch):
+    import Helper4
+    # Plain-text extract as returned by TextExtracts: paragraphs on single lines,
+    # headings after a blank line
+    article = (
+        "DeepSeek is an AI company.\nIt was founded in 2023.\n\n\n"
+        "== History ==\nFounded by Liang Wenfeng.\n\n\n"
+        "== Models ==\nDeepSeek-V3 and R1.\n\n\n"
+        "=== Reasoning ===\nR1 is a reasoning model."
+    )
+    hits = [{"title": "DeepSeek", "intro": article.split("\n\n\n")[0], "disambiguation": False}]
+    downloads = []
+    monkeypatch.setattr(Helper4, "cached_wiki_search", lambda query, num_results: hits)
+    monkeypatch.setattr(Helper4, "cached_wiki_extracts", lambda titles: downloads.extend(titles) or {title: article for title in titles})
+    monkeypatch.setattr(Helper4, "chunk_text_tokens", lambda text, chunk_size, overlap: [text])
+
+    assert len(wiki_sections(article)) == 4 and len(wiki_sections(hits[0]["intro"])) == 1
+    # The intro is the first section: no download
+    [page] = Helper4.iter_wiki_pages_sync("deepseek", max_sections=1)
+    assert downloads == [] and [chunk["text"] for chunk in page] == [hits[0]["intro"]]
+    [page] = Helper4.iter_wiki_pages_sync("deepseek", max_sections=3)
+    assert downloads == ["DeepSeek"]
+    assert [chunk["title"] for chunk in page] == [f"DeepSeek - Section {i} - Chunk 1" for i in (1, 2, 3)]
+    assert page[1]["text"] == "== History ==\nFounded by Liang Wenfeng."
+
+def test_corpus_scopes():
+    state = {
+        "topics": ["Transformers"], "use_wikipedia": True, "fetch_most_relevant": False, "fetch_most_recent": True,
+        "arxiv_subject": "Computer Science", "arxiv_subtopic": ""
+    }
+    tags = corpus_scopes(state)
+    assert tags == corpus_tags("wikipedia", ["transformers"]) + corpus_tags("arxiv", ["Transformers"], "Computer Science", "")
+    # Chunks fetched for another topic or arXiv subject stay invisible
+    assert not set(tags) & set(corpus_tags("wikipedia", ["DeepSeek"]) + corpus_tags("arxiv", ["Transformers"], "Physics", ""))
+    state["use_wikipedia"] = False
+    assert corpus_scopes(state) == corpus_tags("arxiv", ["Transformers"], "Computer Science", "")
+
+def test_session_manager_eviction():
+    from session_manager import SessionManager
+    evicted = []
+    sessions = SessionManager(new_state=dict, on_evict=lambda s: evicted.append(s.id), max_sessions=2)
+    first, created = sessions.get()
+    assert created
+    assert sessions.get(first.id) == (first, False)
+    with first.lock:
+        # In use: survives even as the least recently used session
+        second, _ = sessions.get()
+        third, _ = sessions.get()
+    assert evicted == [second.id]
+    fourth, _ = sessions.get()
+    assert evicted == [second.id, first.id]
+    assert sessions.stats()["sessions"] == 2
+
+def test_session_manager_async_eviction():
+    import asyncio
+    from session_manager import SessionManager
+    evicted = []
+
+    async def delete(session):
+        evicted.append((session.id, asyncio.get_running_loop()))
+
+    async def requests():
+        sessions = SessionManager(new_state=dict, on_evict=delete, max_sessions=1)
+        first, _ = sessions.get()
+        await first.acquire()
+        waiter = asyncio.create_task(first.acquire())
+        await asyncio.sleep(0)
+        assert not waiter.done()
+        first.release()
+        await waiter
+        first.release()
+        sessions.get()
+        # Scheduled on this loop rather than run on the shared one
+        await asyncio.sleep(0)
+        return first.id, asyncio.get_running_loop()
+
+    assert evicted == [asyncio.run(requests())]
+
+def _collect(agen):
+    async def run():
+        return [message async for message in agen]
+    return asyncio.run(run())
+
+@pytest.fixture
+def stub_ingestion(monkeypatch):
+    """
+    ingest_sources with stub Wikipedia fetches (per keyword) and a stub store_content.
+    """
+    import ingestion
+    stored = []
+    async def store(prefix, session_id, docs, batch_size=128, max_points=None):
+        await asyncio.sleep(0.01)
+        stored.extend(docs)
+        return len(docs)
+    monkeypatch.setattr(ingestion, "store_content", store)
+    monkeypatch.setattr(ingestion, "CORPUS_COLLECTION", "")
+    return ingestion, stored
+
+def _page(keyword, i):
+    return [{"title": keyword, "text": f"{keyword} chunk {i}", "source": f"https://{keyword}"}]
+
+def test_ingest_sources_backpressure(stub_ingestion, monkeypatch):
+    ingestion, stored = stub_ingestion
+    produced = []
+    ahead = []
+    def pages(keyword, **options):
+        for i in range(20):
+            produced.append(i)
+            ahead.append(len(produced) - len(stored))
+            yield _page(keyword, i)
+    monkeypatch.setattr(ingestion, "iter_wiki_pages_sync", pages)
+    status = {}
+    _collect(ingestion.ingest_sources("rag_session_", "s", ["python"], use_wikipedia=True, micro_batch=1, queue_size=2, status=status))
+    assert len(stored) == 20 and status["Wikipedia"] == {"state": "done", "chunks": 20, "errors": []}
+    # The fetch thread waits for the consumer: at most the queue, the item being put and the one being stored
+    assert max(ahead) <= 2 + 2
+
+def test_ingest_sources_failure_and_timeout(stub_ingestion, monkeypatch):
+    import time
+    ingestion, stored = stub_ingestion
+    def pages(keyword, **options):
+        if keyword == "bad":
+            raise RuntimeError("page not found")
+        yield _page(keyword, 0)
+        if keyword == "slow":
+            # Past the deadline; asyncio.run waits for this thread on exit
+            time.sleep(1)
+            yield _page(keyword, 1)
+    monkeypatch.setattr(ingestion, "iter_wiki_pages_sync", pages)
+    monkeypatch.setattr(ingestion, "plan_arxiv_fetches", lambda *args, **kwargs: [("arXiv (most relevant)", lambda: [_page("paper", 0)[0]])])
+    status = {}
+    messages = _collect(ingestion.ingest_sources(
+        "rag_session_", "s", ["good", "bad", "slow"], use_wikipedia=True, fetch_most_relevant=True, timeout=0.5, status=status
+    ))
+    assert status["Wikipedia"] == {"state": "timed out", "chunks": 2, "errors": ["page not found"]}
+    assert status["arXiv (most relevant)"] == {"state": "done", "chunks": 1, "errors": []}
+    assert "Wikipedia fetch failed: page not found" in messages and "Skipping sources still running after 0.5 seconds." in messages
+    # What arrived before the deadline is still stored
+    assert sorted(doc["text"] for doc in stored) == ["good chunk 0", "paper chunk 0", "slow chunk 0"]
+    assert messages[-1].startswith("3 chunks stored")
+
+def test_iterate_in_executor():
+    from async_runner import iterate_async, iterate_in_executor, run_cpu
+    async def tokens():
+        yield await run_cpu(len, "abc")
+        async for token in iterate_in_executor(["a", "b"]):
+            yield token
+    assert list(iterate_async(tokens())) == [3, "a", "b"]
+
+def test_sparse_index_and_rrf():
+    from sparse_index import tokenize, document_vector, query_vector, rrf_fuse
+    assert tokenize("The BERT paper is arXiv:1810.04805v2") == ["bert", "paper", "arxiv", "1810.04805v2"]
+    indices, values = document_vector("bert bert attention")
+    assert len(indices) == 2 and values[0] > values[1]
+    assert query_vector("what is the")[0] == []
+    fused = rrf_fuse([["a", "b"], ["c", "a"]], [1.0, 1.0])
+    assert fused[0][0] == "a"
+
+def test_rerank_budget_and_fallback(monkeypatch):
+    import reranker
+    from reranker import rerank
+    from model_registry import ModelRegistry
+    docs = [{"text": t} for t in ["a", "bb", "ccc"]]
+    class LengthScorer:
+        def predict(self, pairs, batch_size, show_progress_bar):
+            return [len(text) for _, text in pairs]
+    loads = []
+    models = ModelRegistry()
+    models.register("reranker", lambda: loads.append(1) or LengthScorer())
+    monkeypatch.setattr(reranker, "registry", models)
+    monkeypatch.setattr(reranker, "_seconds_per_pair", None)
+    # Not loaded yet: dense order, while a single background load starts
+    assert [d["text"] for d in rerank("q", docs, top_n=2)] == ["a", "bb"]
+    rerank("q", docs, top_n=2)
+    models.get("reranker")
+    assert loads == [1]
+    assert [d["text"] for d in rerank("q", docs, top_n=2)] == ["ccc", "bb"]
+    # No time budget: the dense order
+    assert [d["text"] for d in rerank("q", docs, top_n=3, time_budget=0.0)] == ["a", "bb", "ccc"]
+
+    # Scoring takes 0.125 s per pair on a fake clock: a first batch of RERANK_FIRST_BATCH
+    # pairs, then only the pairs that fit in the rest of the budget
+    clock = [0.0]
+    class SlowScorer(LengthScorer):
+        def predict(self, pairs, batch_size, show_progress_bar):
+            clock[0] += 0.125 * len(pairs)
+            return super().predict(pairs, batch_size, show_progress_bar)
+    monkeypatch.setattr(reranker, "time", lambda: clock[0])
+    monkeypatch.setattr(reranker, "_seconds_per_pair", None)
+    monkeypatch.setattr(models, "peek", lambda name: SlowScorer())
+    many = [{"text": "x" * (i + 1)} for i in range(40)]
+    ranked = rerank("q", many, top_n=40, time_budget=1.0, batch_size=16)
+    assert clock[0] == 1.0
+    assert [len(d["text"]) for d in ranked[:8]] == list(range(8, 0, -1))
+    assert [len(d["text"]) for d in ranked[8:]] == list(range(9, 41))
+
+def test_token_chunker():
+    from chunker import iter_chunk_spans
+    tokenizer = AutoTokenizer.from_pretrained("sentence-transformers/all-MiniLM-L6-v2")
+    text = "Transformers use attention. They scale well.\n\nBM25 is a lexical ranking function. " * 20
+    spans = list(iter_chunk_spans(text, tokenizer, max_tokens=32, overlap=8))
+    assert len(spans) > 1
+    for start, end in spans:
+        chunk = text[start:end]
+        assert len(tokenizer(chunk, add_special_tokens=False)["input_ids"]) <= 32
+        assert chunk.endswith(".")
+
+def test_pdf_pages_in_order():
+    import asyncio, os, tempfile
+    import fitz
+    from pdf_extract import iter_pdf_pages
+    doc = fitz.open()
+    for i in range(20):
+        doc.new_page().insert_text((72, 72), f"page number {i + 1}")
+    path = os.path.join(tempfile.mkdtemp(), "test.pdf")
+    doc.save(path)
+
+    async def collect():
+        return [page async for page in iter_pdf_pages(path, workers=2, pages_per_task=3)]
+
+    pages = asyncio.run(collect())
+    assert [page for page, _, _ in pages] == list(range(1, 21))
+    assert all(count == 20 and f"page number {page}" in text for page, count, text in pages)
+
+def test_pdf_workers_do_not_import_app():
+    import sys
+    import pdf_extract
+    import serve
+    # As under "python serve.py": spawned workers import the main module
+    main, pool = sys.modules["__main__"], pdf_extract._pool
+    sys.modules["__main__"], pdf_extract._pool = serve, None
+    try:
+        names = ["app", "app2", "Helper4", "model_registry"]
+        assert pdf_extract._get_pool().submit(pdf_extract._imported_modules, names).result() == []
+    finally:
+        pdf_extract._pool.shutdown()
+        sys.modules["__main__"], pdf_extract._pool = main, pool
+
+def test_upload_jobs_progress():
+    import tempfile, time
+    from types import SimpleNamespace
+    from upload_jobs import UploadJobs
+
+    async def index_file(session, filename, path, progress):
+        if filename == "bad.txt":
+            raise ValueError("unreadable")
+        progress["chunks"] = 3
+
+    jobs = UploadJobs(index_file, workers=1)
+    session = SimpleNamespace(id="session-a")
+    uploads = [(name, tempfile.mkstemp()[1]) for name in ("a.txt", "bad.txt")]
+    job_id = jobs.submit(session, uploads)
+    for _ in range(100):
+        if jobs.status(job_id, "session-a")["done"]:
+            break
+        time.sleep(0.01)
+    status = jobs.status(job_id, "session-a")
+    assert [file["status"] for file in status["files"]] == ["done", "error"]
+    assert status["files"][0]["chunks"] == 3 and status["files"][1]["error"] == "unreadable"
+    assert jobs.status(job_id, "session-b") is None and not jobs.active("session-a")
+    assert not any(os.path.exists(path) for _, path in uploads)
+
+def test_near_duplicate_filter():
+    from near_duplicates import signature, filter_near_duplicates
+    text = " ".join(f"word{i}" for i in range(200))
+    mirrored = text.replace("word100", "changed")
+    other = " ".join(f"term{i}" for i in range(200))
+    stored = signature("unrelated text about something else entirely")
+    assert filter_near_duplicates([signature(text), signature(mirrored), signature(other)], [stored]) == [0, 2]
+    assert filter_near_duplicates([signature(other)], [signature(other)]) == []
+
+def stub_embedding(text):
+    # Bag of hashed words: similar texts get similar vectors
+    import numpy as np
+    vector = np.zeros(384, dtype=np.float32)
+    for word in text.lower().split():
+        vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % 384] += 1
+    return vector / max(np.linalg.norm(vector), 1)
+
+@pytest.fixture
+def stub_store(monkeypatch):
+    """
+    In-memory Qdrant and a stub embedder, so store_content and retrieve_content run offline.
+    """
+    import Helper4
+    import numpy as np
+    from model_registry import ModelRegistry
+    from qdrant_client import AsyncQdrantClient
+
+    class StubEmbeddingCache:
+        def encode(self, embedder, texts, batch_size=128):
+            return np.array([stub_embedding(text) for text in texts])
+
+    models = ModelRegistry()
+    models.register("qdrant", lambda: AsyncQdrantClient(":memory:"), model=False)
+    models.register("embedding_cache", StubEmbeddingCache, model=False)
+    monkeypatch.setattr(Helper4, "registry", models)
+    monkeypatch.setattr(Helper4, "get_embedder", lambda: None)
+    monkeypatch.setattr(Helper4, "CORPUS_COLLECTION", "rag_corpus")
+    monkeypatch.setattr(Helper4, "_known_collections", set())
+    monkeypatch.setattr(Helper4, "_sparse_collections", set())
+    return models
+
+def test_store_content_is_idempotent(stub_store):
+    documents = [
+        {"title": "A", "text": " ".join(f"alpha{i}" for i in range(50)), "source": "https://a"},
+        {"title": "B", "text": " ".join(f"beta{i}" for i in range(50)), "source": "https://b"},
+    ]
+    async def run():
+        first = await store_content(COLLECTION_PREFIX, "idempotent", documents)
+        second = await store_content(COLLECTION_PREFIX, "idempotent", [dict(doc) for doc in documents])
+        count = (await stub_store.get("qdrant").count(collection_name=COLLECTION_PREFIX + "idempotent", exact=True)).count
+        return first, second, count
+    assert asyncio.run(run()) == (2, 0, 2)
+
+def test_near_duplicates_keep_corpus_scopes(stub_store):
+    text = " ".join(f"word{i}" for i in range(200))
+    def doc(source, text, topic):
+        return {"title": source, "text": text, "source": source, CORPUS_SCOPE_FIELD: corpus_tags("wikipedia", [topic])}
+
+    async def visible(topic):
+        docs = await retrieve_content(
+            COLLECTION_PREFIX, "none", text, threshold=0.0, query_embedding=stub_embedding(text),
+            corpus_scopes=corpus_tags("wikipedia", [topic])
+        )
+        return len(docs)
+
+    async def run():
+        assert await store_content("", "rag_corpus", [doc("x", text, "python")]) == 1
+        # A near-duplicate from another page and session adds its scope instead of being lost
+        assert await store_content("", "rag_corpus", [doc("y", text.replace("word100", "changed"), "java")]) == 0
+        # Same within one batch
+        other = " ".join(f"term{i}" for i in range(200))
+        assert await store_content("", "rag_corpus", [doc("z", other, "go"), doc("w", other + " end", "rust")]) == 1
+        return [await visible(topic) for topic in ("python", "java", "go", "rust", "c")]
+
+    assert asyncio.run(run()) == [1, 1, 1, 1, 0]
+
+def test_delete_orphaned_collections(stub_store):
+    async def run():
+        for name in ("rag_session_old", "rag_session_live", "rag_corpus"):
+            await ensure_collection(name)
+        deleted = await delete_orphaned_collections(COLLECTION_PREFIX, lambda: ["live"])
+        names = {collection.name for collection in (await stub_store.get("qdrant").get_collections()).collections}
+        return deleted, names
+    assert asyncio.run(run()) == (["rag_session_old"], {"rag_session_live", "rag_corpus"})
+
+def test_turn_store_budget():
+    from turn_store import TurnStore
+    turns = TurnStore(lambda text: len(text.split()), header="Topics: x\n", budget=20)
+    for i in range(5):
+        turns.add("context " * 10 + f"question{i} ", compact=f"question{i} ")
+        turns.answer(f"answer{i} ")
+    prompt = turns.build()
+    assert len(prompt.split()) <= 20
+    assert "context " * 10 + "question4 answer4" in prompt
+    assert "question3 answer3" in prompt and "context " * 10 + "question3" not in prompt
+    assert "question0" not in prompt
+
+def test_turn_store_memory():
+    import asyncio
+    from turn_store import TurnStore
+    turns = TurnStore(lambda text: len(text.split()), summarize=lambda summary, texts: summary + f"{len(texts)} turns. ", recent_turns=2)
+    for i in range(4):
+        turns.add(f"<|user|>\nquestion{i}\n", text=f"question{i}")
+        turns.answer(f"answer{i}\n")
+    asyncio.run(turns.update_memory())
+    assert turns.memory == "2 turns. " and len(turns.turns) == 2
+    prompt = turns.build()
+    assert "2 turns." in prompt and "question2" in prompt and "question1" not in prompt
+
+def test_semantic_cache_hit_and_invalidation():
+    from semantic_cache import SemanticCache
+    cache = SemanticCache(threshold=0.9)
+    versions = {"rag_session_a": 1}
+    cache.put([1.0, 0.0, 0.0], ("session", "a"), versions, {"answer": "cached"})
+    assert cache.get([0.99, 0.05, 0.0], [("session", "a")], versions.get) == {"answer": "cached"}
+    assert cache.get([0.0, 1.0, 0.0], [("session", "a")], versions.get) is None
+    assert cache.get([1.0, 0.0, 0.0], [("session", "b")], versions.get) is None
+    versions["rag_session_a"] = 2
+    assert cache.get([1.0, 0.0, 0.0], [("session", "a")], versions.get) is None
+    assert cache.stats() == {"hits": 1, "misses": 3, "entries": 0}
@@ -0,0 +1,155 @@
+import asyncio
+import math
+
+from async_runner import run_cpu
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count (about four characters per token), for models whose tokenizer
+    is not available locally.
+    """
+    return math.ceil(len(text) / 4)
+
+
+class TurnStore:
+    """
+    The conversation sent to the LLM, kept as a list of turns instead of one growing
+    string.
+
+    Each turn is a user message, in a full form (instructions, retrieved context and
+    question) and a compact form (the question only), followed by the assistant's
+    answer. Token counts are computed once, when a turn is added or answered, so
+    building a prompt is a single pass over cached counts.
+
+    With a summarize function, turns older than the last ``recent_turns`` are folded
+    into a running summary after each answer, in the background, and removed; the
+    prompt then carries the summary and the recent turns only.
+
+    Parameters
+    ----------
+    count_tokens : callable
+        Function returning the number of tokens of a string.
+    header : str, optional
+        Text at the start of every prompt (e.g. the topics).
+    budget : int, optional
+        Maximum number of prompt tokens. Defaults to 8192.
+    summarize : callable, optional
+        Function ``summarize(summary, turns)`` returning the running summary updated
+        with the given plain-text turns. Defaults to no summary.
+    recent_turns : int, optional
+        Turns kept verbatim when summarizing. Defaults to 3.
+    """
+
+    def __init__(self, count_tokens, header: str = "", budget: int = 8192, summarize=None, recent_turns: int = 3):
+        if budget <= 0:
+            raise ValueError("budget must be positive")
+        if recent_turns < 1:
+            raise ValueError("recent_turns must be at least 1")
+        self.count_tokens = count_tokens
+        self.header = header
+        self.header_tokens = count_tokens(header) if header else 0
+        self.budget = budget
+        self.summarize = summarize
+        self.recent_turns = recent_turns
+        self.turns = []
+        self.memory = ""
+        self.memory_tokens = 0
+        self._memory_task = None
+
+    def add(self, full: str, compact: str = None, text: str = None) -> None:
+        """
+        Adds a user turn.
+
+        Parameters
+        ----------
+        full : str
+            The user message with its retrieved context.
+        compact : str, optional
+            A shorter form used once the turn is old and the budget is tight.
+            Defaults to full.
+        text : str, optional
+            The plain user message, for the running summary. Defaults to compact.
+        """
+        full_tokens = self.count_tokens(full)
+        compact = full if compact is None else compact
+        self.turns.append({
+            "full": full,
+            "full_tokens": full_tokens,
+            "compact": compact,
+            "compact_tokens": full_tokens if compact is full else self.count_tokens(compact),
+            "text": compact if text is None else text,
+            "answer": "",
+            "answer_tokens": 0,
+        })
+
+    def answer(self, text: str) -> None:
+        """
+        Sets the assistant's answer to the last user turn.
+        """
+        if not self.turns:
+            raise ValueError("No user turn to answer")
+        self.turns[-1]["answer"] = text
+        self.turns[-1]["answer_tokens"] = self.count_tokens(text)
+
+    def _memory_block(self) -> str:
+        return f"Summary of the earlier conversation:\n{self.memory}\n\n" if self.memory else ""
+
+    def build(self) -> str:
+        """
+        Returns the prompt: the header, the running summary, the last turn in full,
+        then as many earlier turns as fit in the budget, newest first, in full or else
+        compact form. Older turns are dropped.
+
+        Returns
+        -------
+        str
+            The prompt, oldest turn first.
+        """
+        if not self.turns:
+            return self.header + self._memory_block()
+        room = self.budget - self.header_tokens - self.memory_tokens
+        last = self.turns[-1]
+        parts = [last["full"] + last["answer"]]
+        room -= last["full_tokens"] + last["answer_tokens"]
+        for turn in reversed(self.turns[:-1]):
+            if turn["full_tokens"] + turn["answer_tokens"] <= room:
+                parts.append(turn["full"] + turn["answer"])
+                room -= turn["full_tokens"] + turn["answer_tokens"]
+            elif turn["compact_tokens"] + turn["answer_tokens"] <= room:
+                parts.append(turn["compact"] + turn["answer"])
+                room -= turn["compact_tokens"] + turn["answer_tokens"]
+            else:
+                break
+        return self.header + self._memory_block() + "".join(reversed(parts))
+
+    def schedule_memory_update(self) -> None:
+        """
+        Starts folding the turns older than the last recent_turns into the running
+        summary, as a task on the running loop, unless an update is in progress.
+        """
+        if self.summarize is None or len(self.turns) <= self.recent_turns:
+            return
+        if self._memory_task is not None and not self._memory_task.done():
+            return
+        self._memory_task = asyncio.get_running_loop().create_task(self.update_memory())
+
+    async def update_memory(self) -> None:
+        """
+        Folds the turns older than the last recent_turns into the running summary and
+        removes them. The summary is generated on the CPU executor; turns added in the
+        meantime are kept.
+        """
+        count = len(self.turns) - self.recent_turns
+        if self.summarize is None or count <= 0:
+            return
+        texts = [f"User: {turn['text']}\nAssistant: {turn['answer']}" for turn in self.turns[:count]]
+        try:
+            memory = await run_cpu(self.summarize, self.memory, texts)
+        except Exception as e:
+            print(f"Error summarizing the conversation: {e}")
+            return
+        self.memory = memory
+        self.memory_tokens = self.count_tokens(self._memory_block())
+        # New turns are only ever appended, so the folded ones are still the first
+        del self.turns[:count]
@@ -0,0 +1,171 @@
+import asyncio
+import os
+import secrets
+import threading
+from time import monotonic
+
+from async_runner import get_loop
+
+# Uploaded files indexed at the same time, across all sessions
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "2"))
+# Seconds a finished job's progress stays available
+UPLOAD_JOB_TTL = float(os.getenv("UPLOAD_JOB_TTL", "3600"))
+
+
+class UploadJobs:
+    """
+    Background indexing of uploaded files.
+
+    A job is a batch of files uploaded together; each file is indexed as its own task,
+    and at most ``workers`` files are indexed at once. Chunks are stored as they are
+    produced, so chat turns retrieve from the files already (partly) indexed while the
+    rest of the batch is processed. Progress is kept per file:
+
+    - status: "queued", "indexing", "done" or "error"
+    - pages, page_count: pages extracted so far and in total (PDFs)
+    - chunks: chunks stored so far
+    - error: the error message, if indexing failed
+
+    Parameters
+    ----------
+    index_file : callable
+        Coroutine function ``index_file(session, filename, path, progress)`` indexing
+        the file at path into the session's collection and updating progress.
+    workers : int, optional
+        Files indexed at the same time. Defaults to UPLOAD_WORKERS.
+    job_ttl : float, optional
+        Seconds a finished job is kept. Defaults to UPLOAD_JOB_TTL.
+    """
+
+    def __init__(self, index_file, workers: int = UPLOAD_WORKERS, job_ttl: float = UPLOAD_JOB_TTL):
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        self.index_file = index_file
+        self.workers = workers
+        self.job_ttl = job_ttl
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._semaphore = None
+
+    def submit(self, session, uploads: list[tuple[str, str]]) -> str:
+        """
+        Queues uploaded files for indexing and returns the job ID right away. The
+        files are removed once indexed. Callable from a Flask thread or from the
+        event loop of the ASGI app; the files are indexed on the loop running the
+        app's coroutines.
+
+        Parameters
+        ----------
+        session : Session
+            The session receiving the files.
+        uploads : list[tuple[str, str]]
+            The name and temporary path of each file.
+
+        Returns
+        -------
+        str
+            The job ID.
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = get_loop()
+
+        job_id = secrets.token_urlsafe(8)
+        job = {
+            "id": job_id,
+            "session": session.id,
+            "files": [{"name": name, "status": "queued", "pages": 0, "page_count": None, "chunks": 0, "error": None} for name, _ in uploads],
+            "finished": None,
+            "futures": [],
+        }
+        with self._lock:
+            self._prune()
+            self._jobs[job_id] = job
+            job["futures"] = [
+                asyncio.run_coroutine_threadsafe(self._index(session, path, progress), loop)
+                for (_, path), progress in zip(uploads, job["files"])
+            ]
+        # Outside the lock: the callback runs right away if the file is already done
+        for future, (_, path), progress in zip(job["futures"], uploads, job["files"]):
+            future.add_done_callback(lambda future, path=path, progress=progress: self._file_done(job, future, path, progress))
+        return job_id
+
+    async def _index(self, session, path: str, progress: dict) -> None:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.workers)
+        try:
+            async with self._semaphore:
+                progress["status"] = "indexing"
+                await self.index_file(session, progress["name"], path, progress)
+                progress["status"] = "done"
+        except Exception as e:
+            print(f"Error indexing {progress['name']}: {e}")
+            progress["status"] = "error"
+            progress["error"] = str(e)
+
+    def _file_done(self, job: dict, future, path: str, progress: dict) -> None:
+        # Also runs for files cancelled before they started
+        if future.cancelled():
+            progress["status"] = "error"
+            progress["error"] = "Cancelled"
+        try:
+            os.remove(path)
+        except OSError as e:
+            print(f"Error removing {path}: {e}")
+        with self._lock:
+            if all(future.done() for future in job["futures"]):
+                job["finished"] = monotonic()
+
+    def _prune(self) -> None:
+        # Must be called with the lock held
+        now = monotonic()
+        for job_id, job in list(self._jobs.items()):
+            if job["finished"] is not None and now - job["finished"] > self.job_ttl:
+                del self._jobs[job_id]
+
+    def status(self, job_id: str, session_id: str) -> dict:
+        """
+        Returns the progress of a job of the given session, or None if there is no
+        such job.
+
+        Returns
+        -------
+        dict
+            The job ID, whether all files are processed, and the progress of each file.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["session"] != session_id:
+                return None
+            return {
+                "id": job_id,
+                "done": job["finished"] is not None,
+                "files": [dict(progress) for progress in job["files"]],
+            }
+
+    def active(self, session_id: str) -> bool:
+        """
+        Returns whether files of the session are still being indexed.
+        """
+        with self._lock:
+            return any(job["session"] == session_id and job["finished"] is None for job in self._jobs.values())
+
+    def cancel(self, session_id: str) -> None:
+        """
+        Cancels the pending files of the session's jobs, e.g. before its collection is
+        deleted.
+        """
+        with self._lock:
+            futures = [future for job in self._jobs.values() if job["session"] == session_id for future in job["futures"]]
+        for future in futures:
+            future.cancel()
+
+    def stats(self) -> dict:
+        """
+        Returns the number of jobs and files by status.
+        """
+        with self._lock:
+            files = [progress for job in self._jobs.values() for progress in job["files"]]
+            counts = {status: sum(progress["status"] == status for progress in files) for status in ("queued", "indexing", "done", "error")}
+            return {"jobs": len(self._jobs), "workers": self.workers, **counts}
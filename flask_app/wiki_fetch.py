@@ -0,0 +1,120 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class WikipediaFetcher:
+    """
+    Thin MediaWiki API client built for bulk retrieval.
+
+    A single request searches, follows redirects, returns the intro of every hit
+    and flags disambiguation pages, so those are skipped without a failed round
+    trip. Full plain-text extracts are then requested only for pages whose intro
+    does not already provide enough paragraphs. All requests share one pooled
+    keep-alive session.
+
+    Parameters
+    ----------
+    api_url : str
+        The api.php endpoint, e.g. 'https://en.wikipedia.org/w/api.php'.
+    max_workers : int, optional
+        Number of extracts fetched in parallel. Defaults to 4.
+    timeout : float, optional
+        Seconds before a request is abandoned. Defaults to 15.
+    """
+
+    # TextExtracts returns at most 20 intros per request
+    MAX_BATCH = 20
+
+    def __init__(self, api_url: str, max_workers: int = 4, timeout: float = 15.0):
+        self.api_url = api_url
+        self.timeout = timeout
+        self.requests = 0
+        self.bytes = 0
+        self._lock = threading.Lock()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers * 2, max_retries=2)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers["User-Agent"] = "RAG-powered-search-engine-for-Research (research chatbot)"
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="wiki")
+
+    def _get(self, params: dict) -> dict:
+        params = {"format": "json", "formatversion": 2, **params}
+        response = self.session.get(self.api_url, params=params, timeout=self.timeout)
+        response.raise_for_status()
+        with self._lock:
+            self.requests += 1
+            self.bytes += len(response.content)
+        return response.json()
+
+    def search(self, query: str, limit: int = 5) -> list[dict]:
+        """
+        Searches Wikipedia and returns the intro of each hit, in search order.
+
+        Parameters
+        ----------
+        query : str
+            The search query.
+        limit : int, optional
+            The number of search results. Defaults to 5.
+
+        Returns
+        -------
+        list[dict]
+            One dict per article with "title", "intro" and "disambiguation" keys.
+        """
+        data = self._get({
+            "action": "query",
+            "generator": "search",
+            "gsrsearch": query,
+            "gsrlimit": min(limit, self.MAX_BATCH),
+            "gsrnamespace": 0,
+            "redirects": 1,
+            "prop": "extracts|pageprops",
+            "exintro": 1,
+            "explaintext": 1,
+            "exlimit": "max",
+            "ppprop": "disambiguation",
+        })
+        pages = data.get("query", {}).get("pages", [])
+        pages.sort(key=lambda page: page.get("index", 0))
+        return [{
+            "title": page["title"],
+            "intro": page.get("extract", ""),
+            "disambiguation": "disambiguation" in page.get("pageprops", {}),
+        } for page in pages if not page.get("missing")]
+
+    def extract(self, title: str) -> str:
+        """
+        Returns the full plain-text extract of one article ('' if it does not exist).
+        """
+        data = self._get({
+            "action": "query",
+            "titles": title,
+            "redirects": 1,
+            "prop": "extracts",
+            "explaintext": 1,
+            "exsectionformat": "wiki",
+        })
+        pages = data.get("query", {}).get("pages", [])
+        return pages[0].get("extract", "") if pages else ""
+
+    def extracts(self, titles: list[str]) -> dict:
+        """
+        Fetches the full extracts of several articles in parallel over the pooled session.
+
+        Returns
+        -------
+        dict
+            Title -> plain-text extract.
+        """
+        return dict(zip(titles, self._executor.map(self.extract, titles)))
+
+    def stats(self) -> dict:
+        """
+        Returns the number of requests sent and bytes received.
+        """
+        return {"requests": self.requests, "bytes": self.bytes}